@@ -3,28 +3,44 @@ FastAPI接口：提供HTTP API服务
 """
 import os
 import sys
+from contextlib import asynccontextmanager
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
+from memory_core import codec
 from memory_core.manager import MemoryManager
+from memory_core.jobs import ExtractionQueueFull
 from memory_core.models import MessageRole
 from config import MemoryConfig, ConfigPresets
 
 
+# 全局记忆管理器
+_manager: Optional[MemoryManager] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：退出时关闭LLM连接池和数据库连接"""
+    yield
+    global _manager
+    if _manager is not None:
+        await _manager.aclose()
+        _manager = None
+
+
 # 创建FastAPI应用
 app = FastAPI(
     title="玩具记忆系统API",
     description="为智能对话玩具提供记忆能力的独立服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# 全局记忆管理器
-_manager: Optional[MemoryManager] = None
-
 
 def get_manager() -> MemoryManager:
     """获取记忆管理器实例"""
@@ -58,12 +74,27 @@ class AddMessageRequest(BaseModel):
 class EndSessionRequest(BaseModel):
     session_id: str = Field(..., description="会话ID")
     extract_memory: bool = Field(True, description="是否提取记忆")
+    background: bool = Field(False, description="是否在后台提取记忆（立即返回任务ID）")
 
 
 class EndSessionResponse(BaseModel):
     success: bool
     episode_id: Optional[str] = None
     summary: Optional[str] = None
+    job_id: Optional[str] = None
+
+
+class JobStatusResponse(BaseModel):
+    id: str
+    session_id: str
+    user_id: str
+    status: str
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    episode_id: Optional[str] = None
+    summary: Optional[str] = None
+    error: Optional[str] = None
 
 
 class GetContextRequest(BaseModel):
@@ -116,7 +147,7 @@ async def root():
 async def start_session(request: StartSessionRequest, manager: MemoryManager = Depends(get_manager)):
     """开始新会话"""
     try:
-        working_memory = manager.start_session(request.user_id, request.session_id)
+        working_memory = await manager.astart_session(request.user_id, request.session_id)
         return StartSessionResponse(
             session_id=working_memory.session_id,
             user_id=working_memory.user_id,
@@ -133,7 +164,7 @@ async def add_message(request: AddMessageRequest, manager: MemoryManager = Depen
         if request.role not in ["user", "assistant", "system"]:
             raise HTTPException(status_code=400, detail="无效的消息角色")
         
-        manager.add_message(
+        await manager.aadd_message(
             request.session_id,
             request.role,
             request.content,
@@ -150,21 +181,36 @@ async def add_message(request: AddMessageRequest, manager: MemoryManager = Depen
 async def end_session(request: EndSessionRequest, manager: MemoryManager = Depends(get_manager)):
     """结束会话并提取记忆"""
     try:
-        episode = await manager.end_session(request.session_id, request.extract_memory)
+        if request.background and request.extract_memory:
+            job = await manager.asubmit_end_session(request.session_id)
+            return EndSessionResponse(success=True, job_id=job.id if job else None)
+        
+        episode = await manager.aend_session(request.session_id, request.extract_memory)
         return EndSessionResponse(
             success=True,
             episode_id=episode.id if episode else None,
             summary=episode.summary if episode else None
         )
+    except ExtractionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str, manager: MemoryManager = Depends(get_manager)):
+    """查询后台提取任务状态"""
+    job = manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return JobStatusResponse(**job.to_dict())
+
+
 @app.post("/context", response_model=MemoryContextResponse)
 async def get_memory_context(request: GetContextRequest, manager: MemoryManager = Depends(get_manager)):
     """获取记忆上下文（用于增强LLM对话）"""
     try:
-        context = manager.get_memory_context(request.session_id, request.query)
+        context = await manager.aget_memory_context(request.session_id, request.query)
         
         return MemoryContextResponse(
             system_prompt=context.to_system_prompt(),
@@ -180,7 +226,7 @@ async def get_memory_context(request: GetContextRequest, manager: MemoryManager
 @app.get("/profile/{user_id}", response_model=UserProfileResponse)
 async def get_user_profile(user_id: str, manager: MemoryManager = Depends(get_manager)):
     """获取用户画像"""
-    profile = manager.get_user_profile(user_id)
+    profile = await manager.aget_user_profile(user_id)
     if not profile:
         raise HTTPException(status_code=404, detail="用户不存在")
     
@@ -200,7 +246,7 @@ async def update_user_profile(request: UpdateProfileRequest, manager: MemoryMana
     """更新用户画像"""
     from memory_core.models import UserProfile
     
-    profile = manager.get_user_profile(request.user_id)
+    profile = await manager.aget_user_profile(request.user_id)
     if not profile:
         profile = UserProfile(user_id=request.user_id)
     
@@ -213,45 +259,115 @@ async def update_user_profile(request: UpdateProfileRequest, manager: MemoryMana
     if request.tags is not None:
         profile.tags = request.tags
     
-    manager.update_user_profile(profile)
+    await manager.aupdate_user_profile(profile)
     return {"success": True, "message": "用户画像已更新"}
 
 
 @app.get("/stats/{user_id}", response_model=StatsResponse)
 async def get_user_stats(user_id: str, manager: MemoryManager = Depends(get_manager)):
     """获取用户统计信息"""
-    stats = manager.get_stats(user_id)
+    stats = await manager.aget_stats(user_id)
     return StatsResponse(**stats)
 
 
 @app.post("/maintenance/forget/{user_id}")
 async def run_forgetting(user_id: str, manager: MemoryManager = Depends(get_manager)):
     """运行遗忘机制"""
-    deleted = manager.run_forgetting(user_id)
+    deleted = await manager.arun_forgetting(user_id)
     return {"success": True, "deleted_count": deleted}
 
 
 @app.post("/maintenance/cleanup")
 async def cleanup_old_data(days: int = 7, manager: MemoryManager = Depends(get_manager)):
     """清理过期数据"""
-    deleted = manager.cleanup(days)
+    deleted = await manager.acleanup(days)
     return {"success": True, "deleted_sessions": deleted}
 
 
+@app.get("/maintenance/status")
+async def maintenance_status(manager: MemoryManager = Depends(get_manager)):
+    """后台维护（遗忘+过期会话清理）的运行状态"""
+    if manager.maintenance is None:
+        return {"enabled": False}
+    state = await manager.async_storage.read(
+        manager.storage.get_maintenance_state, manager.maintenance.STATE_NAME
+    )
+    return {"enabled": True, "stats": manager.maintenance.stats, "state": state}
+
+
+@app.get("/export")
+async def export_users(
+    user_id: Optional[List[str]] = Query(None, description="要导出的用户，不指定时导出全部用户"),
+    manager: MemoryManager = Depends(get_manager)
+):
+    """流式导出多个用户的记忆（NDJSON，每行一个用户，可直接用于 /import/ndjson）"""
+    return StreamingResponse(manager.iter_export_ndjson(user_id), media_type="application/x-ndjson")
+
+
 @app.get("/export/{user_id}")
 async def export_user_memory(user_id: str, manager: MemoryManager = Depends(get_manager)):
-    """导出用户记忆"""
-    data = manager.export_user_memory(user_id)
-    return data
+    """导出用户记忆（流式输出JSON，不限条数）"""
+    return StreamingResponse(manager.iter_export_json(user_id), media_type="application/json")
 
 
 @app.post("/import")
 async def import_user_memory(data: Dict[str, Any], manager: MemoryManager = Depends(get_manager)):
     """导入用户记忆"""
-    manager.import_user_memory(data)
+    try:
+        await manager.aimport_user_memory(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"success": True, "message": "记忆导入成功"}
 
 
+@app.post("/import/ndjson")
+async def import_users_ndjson(request: Request, manager: MemoryManager = Depends(get_manager)):
+    """流式导入多个用户的记忆
+    
+    请求体为NDJSON，每行一个 /export/{user_id} 格式的用户数据；
+    边接收边解析，每 import_batch_users 个用户一个事务。
+    出错时返回400，detail 中的 imported 为已提交的用户数
+    """
+    batch_users = max(1, manager.config.import_batch_users)
+    imported = 0
+    line_no = 0
+    batch: List[Dict[str, Any]] = []
+    buffer = b""
+    
+    async def flush():
+        nonlocal imported, batch
+        if batch:
+            try:
+                imported += await manager.aimport_users(batch)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail={"error": str(e), "imported": imported})
+            batch = []
+    
+    async def handle(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        if not line.strip():
+            return
+        try:
+            batch.append(codec.loads(line))
+        except ValueError as e:
+            raise HTTPException(
+                status_code=400,
+                detail={"error": f"第{line_no}行不是有效的JSON: {e}", "imported": imported}
+            )
+        if len(batch) >= batch_users:
+            await flush()
+    
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            await handle(line)
+    await handle(buffer)
+    await flush()
+    return {"success": True, "imported_users": imported}
+
+
 # ========== 启动入口 ==========
 
 def create_app(config: MemoryConfig = None) -> FastAPI:
@@ -17,14 +17,48 @@ class MemoryConfig:
     data_dir: str = "./data"
     # SQLite数据库文件名
     db_name: str = "memory.db"
+    # 存储后端: "sqlite"（持久化）, "sharded"（按用户分片的多个SQLite文件）,
+    #          "memory"（纯内存，无磁盘I/O，进程退出后数据丢失）
+    storage_backend: str = "sqlite"
+    # 分片数（storage_backend="sharded"时生效，修改后需运行 storage.sharded_storage 迁移用户）
+    db_shards: int = 4
+    # 连接池大小（长连接复用，避免每次操作重新建立连接）
+    db_pool_size: int = 5
+    # 获取连接/等待数据库锁的超时时间（秒）
+    db_timeout: float = 30.0
+    # 日志模式（WAL允许读写并发）
+    db_journal_mode: str = "WAL"
+    # 同步级别（WAL模式下NORMAL即可保证一致性）
+    db_synchronous: str = "NORMAL"
+    # 每个连接的页缓存大小（KB）
+    db_cache_size_kb: int = 8192
+    # 是否由单个写线程组提交所有写操作（多个写操作合并为一个事务）
+    db_group_commit: bool = True
+    # 每次组提交最多合并的写操作数
+    db_group_commit_max_ops: int = 256
+    # 启动时表结构迁移的分块大小（大表数据迁移每块单独提交，避免长时间锁表）
+    db_migration_chunk_size: int = 1000
+    # 批量导入时每个事务包含的用户数
+    import_batch_users: int = 100
+    # 流式导出时每次查询的行数
+    export_chunk_size: int = 500
 
     # ========== 工作记忆配置 ==========
     # 工作记忆最大轮数（滑动窗口）
     working_memory_size: int = 10
+    # 是否启用写回缓冲（消息先缓存在内存，合并后批量落盘）
+    working_memory_write_behind: bool = False
+    # 写回缓冲的定时刷新间隔（秒）
+    working_memory_flush_interval: float = 2.0
+    # 单个会话允许的未落盘消息上限，达到即刷新（进程崩溃时最多丢失 上限-1 条）
+    working_memory_max_unflushed: int = 6
 
     # ========== 情景记忆配置 ==========
     # 单个用户最大情景记忆数量
     max_episodes_per_user: int = 100
+    # 是否在内存中累积访问计数，由后台线程按 working_memory_flush_interval 批量落盘
+    # （关闭时每次检索同步执行一次批量UPDATE）
+    episode_access_write_behind: bool = False
     # 情景摘要最大长度（字符）
     episode_summary_max_length: int = 200
     # 触发情景压缩的对话轮数阈值
@@ -46,6 +80,18 @@ class MemoryConfig:
     # 时间衰减权重
     time_decay_weight: float = 0.7
 
+    # ========== 后台维护配置 ==========
+    # 是否启用后台维护（定期对全部用户执行遗忘并清理过期会话）
+    maintenance_enabled: bool = False
+    # 两轮维护之间的间隔（秒）
+    maintenance_interval: float = 3600.0
+    # 每次遍历的用户数/每批清理的会话数
+    maintenance_chunk_size: int = 100
+    # 限速：每秒最多处理的用户数（<=0 不限速）
+    maintenance_rate: float = 20.0
+    # 工作记忆超过多少天未更新视为过期
+    session_retention_days: int = 7
+
     # ========== LLM配置 ==========
     # LLM API提供商: "openai", "zhipu", "local", "mock"
     llm_provider: str = "openai"
@@ -63,26 +109,68 @@ class MemoryConfig:
     llm_max_retries: int = 3
     # 请求超时（秒）
     llm_timeout: int = 30
+    # HTTP连接池最大连接数
+    llm_max_connections: int = 10
+    # 保持keep-alive的空闲连接数
+    llm_max_keepalive_connections: int = 5
+    # 空闲连接保持时间（秒）
+    llm_keepalive_expiry: float = 30.0
+    # 是否启用HTTP/2（需要安装 httpx[http2]）
+    llm_http2: bool = False
+    # 同一LLM提供商的最大并发请求数
+    llm_max_concurrency: int = 4
+
+    # ========== 后台提取配置 ==========
+    # 后台提取的工作协程数
+    extraction_workers: int = 2
+    # 提取队列容量（超出后入队等待，形成背压）
+    extraction_queue_size: int = 100
+    # 队列满时入队的最长等待时间（秒），超时返回503
+    extraction_enqueue_timeout: float = 1.0
+    # 保留的已完成任务状态数量
+    extraction_job_history: int = 1000
+    # 后台提取攒批的最长等待时间（秒），批大小由 batch_size 决定
+    extraction_batch_wait: float = 0.5
+    # 单段对话提取结果的输出token上限，批量提取按对话数放大
+    extraction_max_tokens: int = 800
+    # 单次提取调用的输出token上限（模型的输出长度限制），批量提取超出时拆成多次调用
+    extraction_max_output_tokens: int = 4096
 
     # ========== 向量检索配置 ==========
     # 是否启用向量检索（可选功能，关闭可降低成本）
     enable_vector_search: bool = False
     # 向量维度
     vector_dim: int = 384  # 使用小模型的维度
+    # embedding提供者: "hashing"（本地哈希向量，零依赖）, "sentence_transformers"
+    embedding_provider: str = "hashing"
     # 本地embedding模型路径
     embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     # 向量相似度阈值
     similarity_threshold: float = 0.7
     # 检索返回的最大结果数
     max_retrieval_results: int = 5
+    # 单个用户向量数超过此值且安装了faiss时使用HNSW近似检索
+    vector_ann_threshold: int = 5000
+    # 向量批量计算的批大小（跨会话/用户攒批）
+    embedding_batch_size: int = 32
+    # 攒批的最长等待时间（秒）
+    embedding_max_wait: float = 0.05
 
     # ========== 成本控制配置 ==========
-    # 批量处理大小（减少API调用次数）
+    # 批量处理大小（后台提取时多段对话合并为一次LLM调用，减少API调用次数）
     batch_size: int = 5
     # 缓存过期时间（秒）
     cache_ttl: int = 3600
     # 是否启用本地缓存
     enable_cache: bool = True
+    # 提取结果内存缓存的最大条目数（LRU淘汰）
+    cache_max_entries: int = 1024
+    # 是否把提取结果持久化到SQLite（重启后仍可命中）
+    cache_persistent: bool = False
+    # 持久化缓存的数据库文件名
+    cache_db_name: str = "llm_cache.db"
+    # 用户上下文缓存（画像/默认情景记忆/默认事实）最多缓存的用户数
+    context_cache_users: int = 256
 
     def get_db_path(self) -> str:
         """获取数据库完整路径"""
@@ -124,6 +212,7 @@ class ConfigPresets:
             max_episodes_per_user=100,
             max_facts_per_user=50,
             enable_vector_search=True,
+            embedding_provider="sentence_transformers",
             llm_provider="openai",
             llm_model="gpt-4o",
         )
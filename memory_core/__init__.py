@@ -6,10 +6,15 @@ from memory_core.models import (
 from memory_core.manager import MemoryManager
 from memory_core.llm_client import LLMClient, create_llm_client
 from memory_core.extractor import MemoryExtractor, RuleBasedExtractor, create_extractor
+from memory_core.embedding import EmbeddingProvider, create_embedding_provider
+from memory_core.vector_index import VectorIndex
+from memory_core.jobs import ExtractionJob, ExtractionJobQueue, ExtractionQueueFull, JobStatus
 
 __all__ = [
     "Message", "MessageRole", "WorkingMemory", "Episode",
     "UserProfile", "Fact", "MemoryContext", "MemoryType",
     "MemoryManager", "LLMClient", "create_llm_client",
-    "MemoryExtractor", "RuleBasedExtractor", "create_extractor"
+    "MemoryExtractor", "RuleBasedExtractor", "create_extractor",
+    "EmbeddingProvider", "create_embedding_provider", "VectorIndex",
+    "ExtractionJob", "ExtractionJobQueue", "ExtractionQueueFull", "JobStatus"
 ]
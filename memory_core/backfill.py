@@ -0,0 +1,43 @@
+"""
+回填存量情景记忆向量的命令行：
+    python -m memory_core.backfill --data-dir ./data
+
+单独成模块、不被 memory_core 包导入，python -m 执行时不会与已加载的模块冲突
+"""
+import argparse
+import os
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.embedding import create_embedding_provider
+from memory_core.embedding_pipeline import backfill_embeddings
+from storage.sqlite_storage import SQLiteStorage
+from config import MemoryConfig
+
+
+def main():
+    """命令行入口：回填存量情景记忆的向量"""
+    parser = argparse.ArgumentParser(description="回填情景记忆向量")
+    parser.add_argument("--data-dir", default="./data", help="数据目录")
+    parser.add_argument("--db-name", default="memory.db", help="数据库文件名")
+    parser.add_argument("--chunk-size", type=int, default=256, help="每批处理条数")
+    parser.add_argument("--provider", default="hashing", help="embedding提供者")
+    args = parser.parse_args()
+
+    config = MemoryConfig(
+        data_dir=args.data_dir,
+        db_name=args.db_name,
+        embedding_provider=args.provider
+    )
+    storage = SQLiteStorage(config)
+    try:
+        stats = backfill_embeddings(storage, create_embedding_provider(config), args.chunk_size)
+    finally:
+        storage.close()
+    print(f"回填 {stats['processed']} 条，耗时 {stats['seconds']:.2f}s，"
+          f"{stats['texts_per_sec']:.0f} texts/sec")
+
+
+if __name__ == "__main__":
+    main()
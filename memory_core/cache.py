@@ -0,0 +1,268 @@
+"""
+缓存
+- 提取结果缓存：相同的对话内容和模型不重复调用LLM
+  内存层为带TTL的LRU，可选SQLite持久层（重启、崩溃重放后仍然命中）
+- 用户上下文缓存：按用户缓存画像、高重要性情景记忆和常用事实，写入时失效
+"""
+import copy
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core import codec
+from memory_core.llm_client import LLMClient
+from config import MemoryConfig
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def make_cache_key(model: str, prompt: str, schema_hint: str = "") -> str:
+    """缓存键：模型 + 规范化后的prompt的SHA-256（空白差异不影响命中）"""
+    normalized = "\x1f".join([
+        model or "",
+        _WHITESPACE_RE.sub(" ", prompt or "").strip(),
+        _WHITESPACE_RE.sub(" ", schema_hint or "").strip(),
+    ])
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """两级缓存：内存LRU（最多max_entries条）+ 可选SQLite持久层"""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, db_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """读取缓存（过期视为未命中）"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    'SELECT value, expires_at FROM extraction_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    value = codec.loads(row[0])
+                    self._put_memory(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict):
+        """写入缓存"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            if self._conn is not None:
+                self._conn.execute('''
+                    INSERT OR REPLACE INTO extraction_cache (key, value, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (key, codec.dumps(value), expires_at))
+                self._conn.commit()
+
+    def _put_memory(self, key: str, value: Dict, expires_at: float):
+        """写入内存层并按LRU淘汰（调用方需持有锁）"""
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """删除过期条目，返回持久层删除的行数"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (_, exp) in self._entries.items() if exp <= now]:
+                del self._entries[key]
+            if self._conn is None:
+                return 0
+            cursor = self._conn.execute('DELETE FROM extraction_cache WHERE expires_at <= ?', (now,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        """关闭持久层连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachingLLMClient(LLMClient):
+    """在extract_json前加缓存的包装客户端；chat不缓存"""
+
+    def __init__(self, inner: LLMClient, cache: ExtractionCache, model: str = ""):
+        self.inner = inner
+        self.cache = cache
+        self.model = model
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 500
+    ) -> str:
+        return await self.inner.chat(messages, temperature=temperature, max_tokens=max_tokens)
+
+    async def extract_json(self, prompt: str, schema_hint: str = "", max_tokens: int = 800) -> Dict:
+        key = make_cache_key(self.model, prompt, schema_hint)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = await self.inner.extract_json(prompt, schema_hint, max_tokens=max_tokens)
+        # 解析失败（空结果）不缓存，下次重试
+        if result:
+            self.cache.set(key, result)
+        return result
+
+    async def extract_json_uncached(self, prompt: str, schema_hint: str = "", max_tokens: int = 800) -> Dict:
+        """绕过按prompt的缓存直接调用（调用方已按自己的键查过缓存时使用）"""
+        return await self.inner.extract_json(prompt, schema_hint, max_tokens=max_tokens)
+
+    async def aclose(self):
+        await self.inner.aclose()
+        self.cache.close()
+
+
+class UserContextCache:
+    """按用户的读穿透LRU缓存（画像、默认情景记忆、默认事实）
+
+    写入时从全局递增计数器取一个版本号记到该用户名下并丢弃缓存；
+    读取前记录版本号，回填时版本已变化则放弃，避免把旧数据写回缓存。
+    用户的缓存条目被淘汰或过期时一并移除其版本号，版本表最多保留 max_users 个用户；
+    移除的版本号并入下限 _floor，没有版本记录的用户都返回下限，
+    因此移除只会让进行中的回填多放弃一次，不会接受旧数据。
+    回填和取出时都深拷贝，调用方修改拿到的对象不会影响缓存内容
+    """
+
+    PARTS = ("profile", "episodes", "facts")
+
+    def __init__(self, max_users: int = 256, ttl: float = 3600):
+        self.max_users = max(1, max_users)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: str) -> int:
+        """当前版本号（在读取存储前获取）"""
+        with self._lock:
+            return self._versions.get(user_id, self._floor)
+
+    def _evict(self, user_id: str):
+        """移除用户的缓存条目和版本号（调用方持有锁）"""
+        self._entries.pop(user_id, None)
+        self._drop_version(user_id)
+
+    def _drop_version(self, user_id: str):
+        """移除用户的版本号并入下限（调用方持有锁）"""
+        version = self._versions.pop(user_id, None)
+        if version is not None:
+            self._floor = max(self._floor, version)
+
+    def get(self, user_id: str, parts: Tuple[str, ...]) -> Optional[Dict]:
+        """取出用户的指定部分，全部命中时返回 {部分: 值}，否则返回None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry["expires_at"] <= time.time():
+                self._evict(user_id)
+                entry = None
+            if entry is None or any(part not in entry for part in parts):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            found = {part: entry[part] for part in parts}
+        # 缓存中的对象回填后不再修改，可以在锁外拷贝
+        return copy.deepcopy(found)
+
+    def put(self, user_id: str, version: int, **parts):
+        """回填缓存（期间发生过写入则忽略）"""
+        parts = copy.deepcopy(parts)
+        with self._lock:
+            if self._versions.get(user_id, self._floor) != version:
+                return
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = {"expires_at": time.time() + self.ttl}
+                self._entries[user_id] = entry
+            entry.update({k: v for k, v in parts.items() if k in self.PARTS})
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """丢弃用户（或全部）缓存"""
+        with self._lock:
+            self._clock += 1
+            if user_id is None:
+                self._entries.clear()
+                self._versions.clear()
+                self._floor = self._clock
+            else:
+                self._entries.pop(user_id, None)
+                self._versions[user_id] = self._clock
+                self._versions.move_to_end(user_id)
+                # 写入未缓存用户也会记版本号，超出上限时移除最久未写入的
+                while len(self._versions) > self.max_users:
+                    self._drop_version(next(iter(self._versions)))
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def create_extraction_cache(config: MemoryConfig) -> ExtractionCache:
+    """工厂函数：按配置创建提取缓存"""
+    db_path = None
+    if config.cache_persistent:
+        db_path = os.path.join(config.data_dir, config.cache_db_name)
+    return ExtractionCache(
+        ttl=config.cache_ttl,
+        max_entries=config.cache_max_entries,
+        db_path=db_path
+    )
@@ -0,0 +1,149 @@
+"""
+JSON编解码：已安装 orjson 或 msgspec 时使用它们，否则回退到标准库 json
+所有后端输出相同的紧凑UTF-8文本（中文不转义），写入的数据可以被任一后端读取
+"""
+import json
+import re
+from typing import Any, Callable, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+# 20位及以上的数字串可能超出64位整数：orjson 会把它解析成浮点数，交给标准库按整数解析
+# （字符串内容命中时只是多走一次标准库，结果不变）
+_LONG_DIGITS = re.compile(r"\d{20}")
+_LONG_DIGITS_BYTES = re.compile(rb"\d{20}")
+
+
+def _has_long_digits(data: Union[str, bytes]) -> bool:
+    pattern = _LONG_DIGITS_BYTES if isinstance(data, (bytes, bytearray)) else _LONG_DIGITS
+    return pattern.search(data) is not None
+
+
+def _reject(obj: Any):
+    """快速后端遇到标准库不支持的类型时同样报错（消息与标准库一致）"""
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# 快速后端原生支持的标量类型中，标准库只能编码这些（按精确类型匹配，子类交给标准库）
+_PLAIN_TYPES = frozenset([str, int, bool, type(None)])
+
+
+def _is_plain(obj: Any) -> bool:
+    """obj 是否只由 dict（字符串键）/list/tuple 和快速后端与标准库输出相同的基本类型组成
+
+    浮点数要求有限且不用科学计数法：快速后端把 NaN/Infinity 写成 null，
+    指数写法也不同（1e16 与标准库的 1e+16）
+    """
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is dict:
+            if any(type(key) is not str for key in value):
+                return False
+            stack.extend(value.values())
+        elif kind is list or kind is tuple:
+            stack.extend(value)
+        elif kind is float:
+            if not (value == 0 or 1e-4 <= abs(value) < 1e16):
+                return False
+        elif kind not in _PLAIN_TYPES:
+            return False
+    return True
+
+
+def _build_backends() -> Dict[str, Tuple[Callable[[Any], str], Callable[[Union[str, bytes]], Any]]]:
+    """可用的后端：名称 -> (dumps, loads)
+
+    编码前先用 _is_plain 检查输入，输出可能与标准库不同的（非有限或需要科学计数法的浮点数、
+    非字符串键、datetime/dataclass 等标准库不支持的类型）交给标准库处理；快速后端自身
+    报错的输入（超出64位的整数等）同样回退。解析时含超长数字串的文本交给标准库，
+    快速后端解析失败（NaN/Infinity等）也回退。因此各后端的结果和报错与标准库一致，
+    解析错误统一为 json.JSONDecodeError（ValueError）
+    """
+    backends = {"json": (_json_dumps, _json_loads)}
+
+    if orjson is not None:
+        def orjson_dumps(obj: Any) -> str:
+            if not _is_plain(obj):
+                return _json_dumps(obj)
+            try:
+                return orjson.dumps(obj, default=_reject).decode("utf-8")
+            except TypeError:
+                return _json_dumps(obj)
+
+        def orjson_loads(data: Union[str, bytes]) -> Any:
+            if _has_long_digits(data):
+                return _json_loads(data)
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                return _json_loads(data)
+
+        backends["orjson"] = (orjson_dumps, orjson_loads)
+
+    if msgspec is not None:
+        encoder = msgspec.json.Encoder(enc_hook=_reject)
+        decoder = msgspec.json.Decoder()
+
+        def msgspec_dumps(obj: Any) -> str:
+            if not _is_plain(obj):
+                return _json_dumps(obj)
+            try:
+                return encoder.encode(obj).decode("utf-8")
+            except (TypeError, ValueError, msgspec.EncodeError):
+                return _json_dumps(obj)
+
+        def msgspec_loads(data: Union[str, bytes]) -> Any:
+            if _has_long_digits(data):
+                return _json_loads(data)
+            try:
+                return decoder.decode(data)
+            except msgspec.DecodeError:
+                return _json_loads(data)
+
+        backends["msgspec"] = (msgspec_dumps, msgspec_loads)
+
+    return backends
+
+
+BACKENDS = _build_backends()
+
+# 自动选择的顺序
+PREFERRED = ("orjson", "msgspec", "json")
+
+backend = ""
+dumps: Callable[[Any], str] = _json_dumps
+loads: Callable[[Union[str, bytes]], Any] = _json_loads
+
+
+def set_backend(name: str = None) -> str:
+    """切换后端（None为按 PREFERRED 自动选择），返回实际使用的后端名"""
+    global backend, dumps, loads
+    if name is None:
+        name = next(n for n in PREFERRED if n in BACKENDS)
+    if name not in BACKENDS:
+        raise ValueError(f"JSON后端不可用: {name}（可用: {', '.join(BACKENDS)}）")
+    backend = name
+    dumps, loads = BACKENDS[name]
+    return name
+
+
+set_backend()
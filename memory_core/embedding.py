@@ -0,0 +1,91 @@
+"""
+文本向量化：可插拔的embedding提供者
+默认使用本地哈希向量（字符n-gram），无需下载模型，可离线测试
+"""
+import math
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MemoryConfig
+
+
+class EmbeddingProvider(ABC):
+    """Embedding提供者基类"""
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """批量计算文本向量（返回L2归一化的向量）"""
+        pass
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """哈希向量：字符一元组和二元组哈希到固定维度（确定性，零依赖）"""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        chars = [c for c in (text or "").lower() if not c.isspace()]
+        features = [(c, 0.5) for c in chars]
+        features += [(chars[i] + chars[i + 1], 1.0) for i in range(len(chars) - 1)]
+
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if (h // self.dim) % 2 == 0 else -1.0
+            vector[h % self.dim] += sign * weight
+
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm > 0:
+            vector = [v / norm for v in vector]
+        return vector
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """基于sentence-transformers的本地模型（需要安装 vector 可选依赖）"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(texts, normalize_embeddings=True)
+        return [v.tolist() for v in vectors]
+
+
+def pack_embedding(vector: Optional[List[float]]) -> Optional[bytes]:
+    """向量打包为float32 BLOB"""
+    if not vector:
+        return None
+    return struct.pack(f'{len(vector)}f', *vector)
+
+
+def unpack_embedding(blob: Optional[bytes]) -> Optional[List[float]]:
+    """float32 BLOB解包为向量"""
+    if not blob:
+        return None
+    return list(struct.unpack(f'{len(blob) // 4}f', blob))
+
+
+def create_embedding_provider(config: MemoryConfig) -> EmbeddingProvider:
+    """工厂函数：创建embedding提供者"""
+    provider = config.embedding_provider.lower()
+
+    if provider == "hashing":
+        return HashingEmbeddingProvider(config.vector_dim)
+    elif provider == "sentence_transformers":
+        return SentenceTransformerProvider(config.embedding_model)
+    else:
+        raise ValueError(f"不支持的embedding提供者: {provider}")
@@ -0,0 +1,177 @@
+"""
+批量向量化流水线：跨会话/用户攒批计算embedding，以及存量数据回填
+回填命令行见 memory_core.backfill
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.models import Episode
+from memory_core.embedding import EmbeddingProvider
+from storage.writer import deferred_writes
+
+logger = logging.getLogger(__name__)
+
+
+def episode_text(episode: Episode) -> str:
+    """用于计算向量的情景记忆文本"""
+    return " ".join([episode.summary] + list(episode.keywords))
+
+
+class EmbeddingQueue:
+    """Embedding批处理队列
+
+    后台线程攒满 batch_size 条或等待 max_wait 秒后统一编码一批，
+    然后把向量写回存储并加入向量索引。处理失败的批次记录在 stats() 中，
+    其条目保持 embedding IS NULL，由 backfill_embeddings 补齐
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        storage,
+        vector_index=None,
+        batch_size: int = 32,
+        max_wait: float = 0.05
+    ):
+        self.provider = provider
+        self.storage = storage
+        self.vector_index = vector_index
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+
+        self._queue: "queue.Queue[Optional[Tuple[str, str, str]]]" = queue.Queue()
+        self._texts = 0
+        self._batches = 0
+        self._encode_seconds = 0.0
+        self._errors = 0
+        self._failed_texts = 0
+        self._last_error: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="embedding-queue", daemon=True)
+        self._thread.start()
+
+    def submit(self, episode: Episode):
+        """提交一条情景记忆等待向量化"""
+        self._queue.put((episode.user_id, episode.id, episode_text(episode)))
+
+    def flush(self):
+        """阻塞直到已提交的条目全部处理完"""
+        self._queue.join()
+
+    def close(self):
+        """处理完剩余条目后停止后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """吞吐量和失败统计（failed_texts 为等待回填的条目数）"""
+        return {
+            "texts": self._texts,
+            "batches": self._batches,
+            "texts_per_sec": self._texts / self._encode_seconds if self._encode_seconds else 0.0,
+            "errors": self._errors,
+            "failed_texts": self._failed_texts,
+            "last_error": self._last_error,
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            try:
+                self._process(batch)
+            except Exception as e:
+                # 失败的条目保持 embedding IS NULL，由回填任务补齐
+                self._errors += 1
+                self._failed_texts += len(batch)
+                self._last_error = repr(e)
+                logger.exception("向量化失败，%d 条情景记忆等待回填", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _process(self, batch: List[Tuple[str, str, str]]):
+        start = time.perf_counter()
+        vectors = self.provider.embed([text for _, _, text in batch])
+        self._encode_seconds += time.perf_counter() - start
+        self._texts += len(batch)
+        self._batches += 1
+
+        _write_embeddings(
+            self.storage,
+            [(user_id, episode_id, vector) for (user_id, episode_id, _), vector in zip(batch, vectors)]
+        )
+        if self.vector_index is not None:
+            for (user_id, episode_id, _), vector in zip(batch, vectors):
+                self.vector_index.add(user_id, episode_id, vector)
+
+
+def _write_embeddings(storage, items: List[Tuple[str, str, List[float]]]):
+    """按所属用户分组写回向量（分片存储只写对应用户的分片），组提交模式下各组合并为一个事务"""
+    by_user: Dict[str, List[Tuple[str, List[float]]]] = {}
+    for user_id, episode_id, vector in items:
+        by_user.setdefault(user_id, []).append((episode_id, vector))
+    with deferred_writes() as futures:
+        for user_id, user_items in by_user.items():
+            storage.update_episode_embeddings(user_items, user_id=user_id)
+    for future in futures:
+        future.result()
+
+
+def backfill_embeddings(
+    storage,
+    provider: EmbeddingProvider,
+    chunk_size: int = 256,
+    limit: Optional[int] = None
+) -> Dict[str, float]:
+    """为 embedding IS NULL 的存量情景记忆分块回填向量
+
+    每块单独提交，中断后重新运行会从剩余的空向量行继续
+    """
+    processed = 0
+    last_rowid = 0
+    start = time.perf_counter()
+
+    while limit is None or processed < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - processed)
+        rows = storage.get_episodes_without_embedding(after_rowid=last_rowid, limit=size)
+        if not rows:
+            break
+        vectors = provider.embed([episode_text(ep) for _, ep in rows])
+        _write_embeddings(
+            storage, [(ep.user_id, ep.id, vector) for (_, ep), vector in zip(rows, vectors)]
+        )
+        processed += len(rows)
+        last_rowid = rows[-1][0]
+
+    seconds = time.perf_counter() - start
+    return {
+        "processed": processed,
+        "seconds": seconds,
+        "texts_per_sec": processed / seconds if seconds else 0.0,
+    }
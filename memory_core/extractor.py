@@ -13,6 +13,7 @@ from memory_core.models import (
     Message, Episode, Fact, UserProfile, MessageRole
 )
 from memory_core.llm_client import LLMClient, create_llm_client
+from memory_core.cache import make_cache_key
 from config import MemoryConfig
 
 
@@ -45,12 +46,61 @@ EXTRACTION_PROMPT = """请分析以下对话内容，提取关键记忆信息。
 """
 
 
+# 多会话批量提取的Prompt模板（一次调用处理多段对话）
+BATCH_EXTRACTION_PROMPT = """请分别分析以下{count}段互相独立的对话，为每段对话提取关键记忆信息。
+
+{conversations}
+
+请以JSON格式返回，results数组中每段对话对应一个元素，用index标明对话编号：
+{{
+    "results": [
+        {{
+            "index": 1,
+            "summary": "对话的简短摘要（不超过100字）",
+            "keywords": ["关键词列表，3-5个"],
+            "emotion": "对话情感（开心/难过/生气/害怕/好奇/平静）",
+            "importance": 0.5,  // 重要性评分0-1，日常闲聊0.3，重要信息0.7以上
+            "facts": [{{"subject": "主语", "predicate": "谓语", "object": "宾语"}}],
+            "profile_updates": {{"name": "用户名字（如果提到）", "age": null, "tags": ["新发现的兴趣/特征标签"]}}
+        }}
+    ]
+}}
+
+注意：
+1. 每段对话单独提取，不要混用不同对话的信息
+2. 只提取明确提到的信息，不要推测
+3. 儿童对话特别关注：喜好、害怕的事物、家庭成员、学校生活
+"""
+
+EXTRACTION_SCHEMA_HINT = """
+期望的JSON结构：
+- summary: 字符串
+- keywords: 字符串数组
+- emotion: 字符串
+- importance: 0-1的浮点数
+- facts: 对象数组，每个对象有subject/predicate/object
+- profile_updates: 对象，包含name/age/tags
+"""
+
+BATCH_SCHEMA_HINT = """
+期望的JSON结构：
+- results: 对象数组，每个对象包含index（对话编号）以及summary/keywords/emotion/importance/facts/profile_updates
+"""
+
+
 class MemoryExtractor:
     """记忆提取器：从对话中提取结构化记忆"""
     
     def __init__(self, config: MemoryConfig, llm_client: LLMClient = None):
         self.config = config
         self.llm = llm_client or create_llm_client(config)
+        # 与缓存客户端共用提取缓存，按单段对话内容缓存（批量提取也能逐段命中）；
+        # 调用LLM时绕过客户端按整条prompt的缓存，同一结果只存一份、只统计一次
+        self.cache = getattr(self.llm, "cache", None)
+        self._cache_model = getattr(self.llm, "model", "")
+        self._extract_json = getattr(self.llm, "extract_json_uncached", self.llm.extract_json)
+        # 调用统计：LLM调用次数、随请求发送的对话数、prompt字符数
+        self.stats = {"llm_calls": 0, "conversations": 0, "prompt_chars": 0}
     
     async def extract_from_conversation(
         self,
@@ -62,25 +112,94 @@ class MemoryExtractor:
         
         # 格式化对话内容
         conversation_text = self._format_conversation(messages)
+        key = self._conversation_key(conversation_text)
+        result = self._cache_get(key)
         
         # 调用LLM提取
-        prompt = EXTRACTION_PROMPT.format(conversation=conversation_text)
-        
-        schema_hint = """
-期望的JSON结构：
-- summary: 字符串
-- keywords: 字符串数组
-- emotion: 字符串
-- importance: 0-1的浮点数
-- facts: 对象数组，每个对象有subject/predicate/object
-- profile_updates: 对象，包含name/age/tags
-"""
-        
-        result = await self.llm.extract_json(prompt, schema_hint)
+        if result is None:
+            prompt = EXTRACTION_PROMPT.format(conversation=conversation_text)
+            result = await self._call_llm(prompt, EXTRACTION_SCHEMA_HINT, conversations=1)
+            self._cache_set(key, result)
         
         # 验证和清理结果
         return self._validate_extraction(result, user_id, session_id)
     
+    async def extract_batch(
+        self,
+        conversations: List[Tuple[List[Message], str, str]]
+    ) -> List[Dict]:
+        """把多段对话打包进一次LLM调用提取，结果按顺序对应输入
+        
+        conversations: [(messages, user_id, session_id), ...]
+        已缓存的对话不再发送；输出token预算（每段 extraction_max_tokens）超过
+        extraction_max_output_tokens 时拆成多次调用；返回结构不完整（如输出被截断）的条目会回退为单独调用
+        """
+        texts = [self._format_conversation(messages) for messages, _, _ in conversations]
+        keys = [self._conversation_key(text) for text in texts]
+        raw: List[Optional[Dict]] = [self._cache_get(key) for key in keys]
+        misses = [i for i, result in enumerate(raw) if result is None]
+        
+        per_call = max(1, self.config.extraction_max_output_tokens // self.config.extraction_max_tokens)
+        for start in range(0, len(misses), per_call):
+            chunk = misses[start:start + per_call]
+            if len(chunk) > 1:
+                await self._extract_chunk(chunk, texts, keys, raw)
+        
+        results = []
+        for result, (messages, user_id, session_id) in zip(raw, conversations):
+            if result is not None:
+                results.append(self._validate_extraction(result, user_id, session_id))
+            else:
+                results.append(await self.extract_from_conversation(messages, user_id, session_id))
+        return results
+    
+    async def _extract_chunk(
+        self,
+        chunk: List[int],
+        texts: List[str],
+        keys: List[str],
+        raw: List[Optional[Dict]]
+    ):
+        """一次LLM调用提取 chunk 中的多段对话，结果按index写入 raw"""
+        blocks = [
+            f"### 对话{n}\n{texts[i]}"
+            for n, i in enumerate(chunk, start=1)
+        ]
+        prompt = BATCH_EXTRACTION_PROMPT.format(
+            count=len(chunk),
+            conversations="\n\n".join(blocks)
+        )
+        response = await self._call_llm(prompt, BATCH_SCHEMA_HINT, conversations=len(chunk))
+        
+        # 按index拆分结果
+        items = response.get("results") if isinstance(response, dict) else None
+        if isinstance(items, list):
+            for item in items:
+                if isinstance(item, dict) and isinstance(item.get("index"), int) and "summary" in item:
+                    n = item["index"]
+                    if 1 <= n <= len(chunk) and raw[chunk[n - 1]] is None:
+                        raw[chunk[n - 1]] = item
+                        self._cache_set(keys[chunk[n - 1]], item)
+    
+    def _conversation_key(self, conversation_text: str) -> str:
+        return make_cache_key(self._cache_model, conversation_text, "conversation")
+    
+    def _cache_get(self, key: str) -> Optional[Dict]:
+        return self.cache.get(key) if self.cache is not None else None
+    
+    def _cache_set(self, key: str, result: Dict):
+        # 解析失败（空结果）不缓存
+        if self.cache is not None and result:
+            self.cache.set(key, result)
+    
+    async def _call_llm(self, prompt: str, schema_hint: str, conversations: int) -> Dict:
+        """调用LLM并记录统计（输出token上限按对话数放大）"""
+        self.stats["llm_calls"] += 1
+        self.stats["conversations"] += conversations
+        self.stats["prompt_chars"] += len(prompt)
+        max_tokens = self.config.extraction_max_tokens * conversations
+        return await self._extract_json(prompt, schema_hint, max_tokens=max_tokens)
+    
     def _format_conversation(self, messages: List[Message]) -> str:
         """格式化对话为文本"""
         lines = []
@@ -0,0 +1,198 @@
+"""
+异步提取任务队列：会话结束后在后台提取记忆，HTTP请求立即返回任务ID
+"""
+import asyncio
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.models import Episode, WorkingMemory
+
+
+class JobStatus(Enum):
+    """任务状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ExtractionQueueFull(Exception):
+    """提取队列已满（背压）"""
+    pass
+
+
+@dataclass
+class ExtractionJob:
+    """一次后台记忆提取任务"""
+    session_id: str
+    user_id: str
+    provider: str = ""
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: JobStatus = JobStatus.PENDING
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    episode_id: Optional[str] = None
+    summary: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "episode_id": self.episode_id,
+            "summary": self.summary,
+            "error": self.error
+        }
+
+
+class ExtractionJobQueue:
+    """有界并发的后台提取队列
+
+    - workers 个协程从队列取任务执行，每次最多攒 batch_size 个任务
+      （最多等待 batch_wait 秒）交给 handler 一起处理
+    - 同一LLM提供商的并发调用数受 max_concurrency 信号量限制
+    - 队列满时入队最多等待 enqueue_timeout 秒，超时抛出 ExtractionQueueFull
+    - 只保留最近 history 个任务的状态
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[WorkingMemory]], Awaitable[List[Optional[Episode]]]],
+        batch_size: int = 1,
+        batch_wait: float = 0.0,
+        workers: int = 2,
+        max_size: int = 100,
+        max_concurrency: int = 4,
+        enqueue_timeout: float = 1.0,
+        history: int = 1000
+    ):
+        self.handler = handler
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.enqueue_timeout = enqueue_timeout
+        self.history = history
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._jobs: "OrderedDict[str, ExtractionJob]" = OrderedDict()
+
+    def _ensure_started(self):
+        """在当前事件循环中创建队列和工作协程"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._tasks = [
+                asyncio.create_task(self._worker()) for _ in range(self.workers)
+            ]
+
+    async def submit(self, working_memory: WorkingMemory, provider: str = "") -> ExtractionJob:
+        """提交任务，返回任务对象（队列满且等待超时时抛出ExtractionQueueFull）"""
+        self._ensure_started()
+        job = ExtractionJob(
+            session_id=working_memory.session_id,
+            user_id=working_memory.user_id,
+            provider=provider
+        )
+        try:
+            await asyncio.wait_for(
+                self._queue.put((job, working_memory)), timeout=self.enqueue_timeout
+            )
+        except asyncio.TimeoutError:
+            raise ExtractionQueueFull(f"提取队列已满（容量: {self.max_size}）")
+
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history:
+            self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[ExtractionJob]:
+        """查询任务状态"""
+        return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        """排队中的任务数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def join(self):
+        """等待所有已提交的任务完成"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self):
+        """等待队列清空后停止工作协程"""
+        if self._queue is None:
+            return
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queue = None
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await self._fill_batch(batch)
+                provider = batch[0][0].provider
+                semaphore = self._semaphores.setdefault(
+                    provider, asyncio.Semaphore(self.max_concurrency)
+                )
+                async with semaphore:
+                    await self._run(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _fill_batch(self, batch: List):
+        """在batch_wait时间内继续从队列取任务，直到凑满batch_size"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self, batch: List):
+        jobs = [job for job, _ in batch]
+        for job in jobs:
+            job.status = JobStatus.RUNNING
+            job.started_at = datetime.now()
+        try:
+            episodes = await self.handler([wm for _, wm in batch])
+            for job, episode in zip(jobs, episodes):
+                if episode is not None:
+                    job.episode_id = episode.id
+                    job.summary = episode.summary
+                job.status = JobStatus.DONE
+        except Exception as e:
+            for job in jobs:
+                job.status = JobStatus.FAILED
+                job.error = str(e)
+        finally:
+            for job in jobs:
+                job.finished_at = datetime.now()
@@ -7,6 +7,7 @@ import asyncio
 from abc import ABC, abstractmethod
 from typing import List, Dict, Optional, Any
 import httpx
+from httpx._client import ClientState
 
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -31,17 +32,94 @@ class LLMClient(ABC):
     async def extract_json(
         self, 
         prompt: str, 
-        schema_hint: str = ""
+        schema_hint: str = "",
+        max_tokens: int = 800
     ) -> Dict:
-        """提取结构化JSON数据"""
+        """提取结构化JSON数据（max_tokens 为输出token上限，批量提取时按对话数放大）"""
+        pass
+    
+    async def aclose(self):
+        """释放客户端持有的资源"""
         pass
 
 
-class OpenAIClient(LLMClient):
-    """OpenAI兼容的客户端（支持OpenAI、Azure、其他兼容API）"""
+def _close_sync(http: httpx.AsyncClient):
+    """同步关闭客户端（所属事件循环已关闭或未运行、无法再 await aclose 时使用）
+
+    httpx 的异步传输层只提供 aclose，这里直接关闭连接池中各连接的套接字并把客户端标记为已关闭；
+    依赖 httpx/httpcore/asyncio 的内部属性（_transport._pool、连接的 _network_stream、TransportSocket._sock），
+    取不到时跳过，升级 httpx 后需确认仍然适用。只释放套接字，asyncio 的传输对象回收时仍可能报 ResourceWarning
+    """
+    pool = getattr(http._transport, "_pool", None)
+    for connection in list(getattr(pool, "connections", [])):
+        inner = getattr(connection, "_connection", None)
+        stream = getattr(inner, "_network_stream", None)
+        sock = stream.get_extra_info("socket") if stream is not None else None
+        if sock is not None:
+            # asyncio 返回的是 TransportSocket 包装，真正的套接字在 _sock
+            getattr(sock, "_sock", sock).close()
+    http._state = ClientState.CLOSED
+
+
+class HTTPLLMClient(LLMClient):
+    """基于HTTP的客户端基类：每个事件循环复用一个httpx.AsyncClient（连接池+keep-alive）"""
     
     def __init__(self, config: MemoryConfig):
         self.config = config
+        # 事件循环 -> 该循环中创建的客户端
+        self._clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+    
+    def _get_http(self) -> httpx.AsyncClient:
+        """获取当前事件循环的长连接客户端（连接不能跨循环复用）"""
+        loop = asyncio.get_running_loop()
+        http = self._clients.get(loop)
+        if http is not None and not http.is_closed:
+            return http
+        # 循环已关闭的客户端无法再 await aclose，同步关闭后丢弃
+        for old in [l for l in self._clients if l.is_closed()]:
+            _close_sync(self._clients.pop(old))
+        http = httpx.AsyncClient(
+            timeout=self.config.llm_timeout,
+            http2=self.config.llm_http2,
+            limits=httpx.Limits(
+                max_connections=self.config.llm_max_connections,
+                max_keepalive_connections=self.config.llm_max_keepalive_connections,
+                keepalive_expiry=self.config.llm_keepalive_expiry
+            )
+        )
+        self._clients[loop] = http
+        return http
+    
+    async def aclose(self):
+        """关闭所有事件循环中的连接池
+
+        每个客户端在其所属循环中关闭：当前循环直接 await，其他线程中仍在运行的循环用
+        run_coroutine_threadsafe 提交（超时未完成视为循环已退出）；
+        所属循环已关闭或未运行时用 _close_sync 同步关闭
+        """
+        loop = asyncio.get_running_loop()
+        clients, self._clients = self._clients, {}
+        for owner, http in clients.items():
+            if http.is_closed:
+                continue
+            if owner is loop:
+                await http.aclose()
+                continue
+            if owner.is_running() and not owner.is_closed():
+                future = asyncio.run_coroutine_threadsafe(http.aclose(), owner)
+                try:
+                    await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.config.llm_timeout)
+                    continue
+                except asyncio.TimeoutError:
+                    future.cancel()
+            _close_sync(http)
+
+
+class OpenAIClient(HTTPLLMClient):
+    """OpenAI兼容的客户端（支持OpenAI、Azure、其他兼容API）"""
+    
+    def __init__(self, config: MemoryConfig):
+        super().__init__(config)
         self.api_key = config.llm_api_key
         self.base_url = config.llm_base_url or "https://api.openai.com/v1"
         self.model = config.llm_model
@@ -72,11 +150,10 @@ class OpenAIClient(LLMClient):
         
         for attempt in range(self.max_retries):
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"]
+                response = await self._get_http().post(url, headers=headers, json=payload)
+                response.raise_for_status()
+                data = response.json()
+                return data["choices"][0]["message"]["content"]
             except Exception as e:
                 if attempt == self.max_retries - 1:
                     raise RuntimeError(f"LLM请求失败: {e}")
@@ -87,7 +164,8 @@ class OpenAIClient(LLMClient):
     async def extract_json(
         self, 
         prompt: str, 
-        schema_hint: str = ""
+        schema_hint: str = "",
+        max_tokens: int = 800
     ) -> Dict:
         """提取结构化JSON数据"""
         system_prompt = f"""你是一个信息提取助手。请从用户输入中提取关键信息，并以JSON格式返回。
@@ -102,7 +180,7 @@ class OpenAIClient(LLMClient):
         response = await self.chat(
             messages, 
             temperature=0.1,  # 低温度保证稳定输出
-            max_tokens=800,
+            max_tokens=max_tokens,
             model=self.extraction_model
         )
         
@@ -138,7 +216,8 @@ class MockLLMClient(LLMClient):
     async def extract_json(
         self, 
         prompt: str, 
-        schema_hint: str = ""
+        schema_hint: str = "",
+        max_tokens: int = 800
     ) -> Dict:
         """模拟JSON提取"""
         # 简单的规则提取
@@ -160,11 +239,11 @@ class MockLLMClient(LLMClient):
         return result
 
 
-class ZhipuClient(LLMClient):
+class ZhipuClient(HTTPLLMClient):
     """智谱AI客户端（国内替代方案）"""
     
     def __init__(self, config: MemoryConfig):
-        self.config = config
+        super().__init__(config)
         self.api_key = config.llm_api_key
         self.base_url = config.llm_base_url or "https://open.bigmodel.cn/api/paas/v4"
         self.model = config.llm_model or "glm-4-flash"  # 使用便宜的flash模型
@@ -193,11 +272,10 @@ class ZhipuClient(LLMClient):
         
         for attempt in range(self.max_retries):
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    data = response.json()
-                    return data["choices"][0]["message"]["content"]
+                response = await self._get_http().post(url, headers=headers, json=payload)
+                response.raise_for_status()
+                data = response.json()
+                return data["choices"][0]["message"]["content"]
             except Exception as e:
                 if attempt == self.max_retries - 1:
                     raise RuntimeError(f"LLM请求失败: {e}")
@@ -208,7 +286,8 @@ class ZhipuClient(LLMClient):
     async def extract_json(
         self, 
         prompt: str, 
-        schema_hint: str = ""
+        schema_hint: str = "",
+        max_tokens: int = 800
     ) -> Dict:
         """提取结构化JSON数据"""
         system_prompt = f"""你是一个信息提取助手。请从用户输入中提取关键信息，并以JSON格式返回。
@@ -220,7 +299,7 @@ class ZhipuClient(LLMClient):
             {"role": "user", "content": prompt}
         ]
         
-        response = await self.chat(messages, temperature=0.1, max_tokens=800)
+        response = await self.chat(messages, temperature=0.1, max_tokens=max_tokens)
         
         try:
             if "```json" in response:
@@ -233,14 +312,21 @@ class ZhipuClient(LLMClient):
 
 
 def create_llm_client(config: MemoryConfig) -> LLMClient:
-    """工厂函数：创建LLM客户端"""
+    """工厂函数：创建LLM客户端（enable_cache时包装提取结果缓存）"""
     provider = config.llm_provider.lower()
     
     if provider == "openai":
-        return OpenAIClient(config)
+        client = OpenAIClient(config)
+        model = config.extraction_model
     elif provider == "zhipu":
-        return ZhipuClient(config)
+        client = ZhipuClient(config)
+        model = client.model
     elif provider == "mock":
         return MockLLMClient(config)
     else:
         raise ValueError(f"不支持的LLM提供商: {provider}")
+    
+    if config.enable_cache:
+        from memory_core.cache import CachingLLMClient, create_extraction_cache
+        client = CachingLLMClient(client, create_extraction_cache(config), f"{provider}:{model}")
+    return client
@@ -0,0 +1,121 @@
+"""
+后台维护调度：定期对全部用户执行遗忘，并清理过期会话
+按用户分块、限速执行，进度保存在存储中，重启后从上次的位置继续
+"""
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.base import StorageBackend
+
+
+class MaintenanceScheduler:
+    """后台维护调度器
+
+    - 每轮按 user_id 顺序遍历全部用户，每次取 chunk_size 个，对每个用户执行 forget(user_id)
+    - 每处理完一块把游标写入存储，重启后从游标处继续本轮
+    - 一轮用户遍历完后分批清理过期会话（每批最多 chunk_size 个）
+    - 每个用户/每批会话之后按 rate 限速，两轮之间等待 interval 秒
+    """
+
+    STATE_NAME = "forgetting"
+
+    def __init__(
+        self,
+        storage: StorageBackend,
+        forget: Callable[[str], int],
+        chunk_size: int = 100,
+        rate: float = 20.0,
+        interval: float = 3600.0,
+        session_days: int = 7
+    ):
+        self.storage = storage
+        self.forget = forget
+        self.chunk_size = max(1, chunk_size)
+        self.rate = rate
+        self.interval = interval
+        self.session_days = session_days
+
+        self.stats: Dict[str, Any] = {
+            "cycles": 0,
+            "users": 0,
+            "forgotten": 0,
+            "sessions_deleted": 0,
+            "errors": 0,
+            "last_cycle_at": None,
+        }
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台线程（当前用户处理完、保存进度后退出）"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # 下一轮从已保存的游标重试
+                self.stats["errors"] += 1
+            self._stop_event.wait(self.interval)
+
+    def run_once(self) -> bool:
+        """从保存的游标继续执行一轮维护，返回本轮是否完整结束（被stop中断时为False）"""
+        state = self.storage.get_maintenance_state(self.STATE_NAME) or {"cursor": "", "cycles": 0}
+
+        while not self._stop_event.is_set():
+            user_ids = self.storage.get_user_ids_page(state["cursor"], self.chunk_size)
+            for user_id in user_ids:
+                if self._stop_event.is_set():
+                    break
+                self.stats["forgotten"] += self.forget(user_id)
+                self.stats["users"] += 1
+                state["cursor"] = user_id
+                self._throttle()
+
+            if user_ids:
+                self.storage.save_maintenance_state(self.STATE_NAME, state)
+            if len(user_ids) == self.chunk_size or self._stop_event.is_set():
+                continue
+
+            # 本轮用户已遍历完：清理过期会话，游标归零
+            if not self._cleanup_sessions():
+                break
+            now = datetime.now().isoformat()
+            state = {"cursor": "", "cycles": state["cycles"] + 1, "last_cycle_at": now}
+            self.storage.save_maintenance_state(self.STATE_NAME, state)
+            self.stats["cycles"] += 1
+            self.stats["last_cycle_at"] = now
+            return True
+
+        return False
+
+    def _cleanup_sessions(self) -> bool:
+        """分批清理过期会话，返回是否清理完（被stop中断时为False）"""
+        while not self._stop_event.is_set():
+            deleted = self.storage.cleanup_old_sessions(self.session_days, limit=self.chunk_size)
+            self.stats["sessions_deleted"] += deleted
+            if deleted < self.chunk_size:
+                return True
+            self._throttle()
+        return False
+
+    def _throttle(self):
+        """限速：每处理一个单位后暂停 1/rate 秒（rate<=0 时不限速）"""
+        if self.rate > 0:
+            self._stop_event.wait(1.0 / self.rate)
@@ -3,20 +3,31 @@
 负责记忆的存储、检索、压缩和遗忘
 """
 import os
+import threading
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Dict, Any, Tuple
 
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from memory_core import codec
 from memory_core.models import (
     WorkingMemory, Episode, Fact, UserProfile,
     Message, MessageRole, MemoryContext
 )
 from memory_core.extractor import MemoryExtractor, RuleBasedExtractor, create_extractor
 from memory_core.llm_client import create_llm_client, LLMClient
-from storage.sqlite_storage import SQLiteStorage
+from memory_core.embedding import create_embedding_provider
+from memory_core.vector_index import VectorIndex
+from memory_core.embedding_pipeline import EmbeddingQueue, backfill_embeddings
+from memory_core.jobs import ExtractionJob, ExtractionJobQueue
+from memory_core.cache import UserContextCache
+from memory_core.maintenance import MaintenanceScheduler
+from storage.base import StorageBackend, create_storage
+from storage.async_storage import AsyncStorage
+from storage.writer import deferred_writes
 from config import MemoryConfig
 
 
@@ -27,7 +38,9 @@ class MemoryManager:
         self.config = config or MemoryConfig()
         
         # 初始化存储
-        self.storage = SQLiteStorage(self.config)
+        self.storage: StorageBackend = create_storage(self.config)
+        # 异步接口使用：读线程池 + 单写线程，避免阻塞事件循环
+        self.async_storage = AsyncStorage(self.storage, readers=self.config.db_pool_size)
         
         # 初始化LLM客户端
         self.llm_client = create_llm_client(self.config)
@@ -39,8 +52,66 @@ class MemoryManager:
             llm_client=self.llm_client
         )
         
+        # 向量检索（可选）
+        self.embedder = None
+        self.vector_index: Optional[VectorIndex] = None
+        self.embedding_queue: Optional[EmbeddingQueue] = None
+        if self.config.enable_vector_search:
+            self.embedder = create_embedding_provider(self.config)
+            self.vector_index = VectorIndex(self.config, self.storage.get_episode_embeddings)
+            self.embedding_queue = EmbeddingQueue(
+                self.embedder,
+                self.storage,
+                self.vector_index,
+                batch_size=self.config.embedding_batch_size,
+                max_wait=self.config.embedding_max_wait
+            )
+        
+        # 用户上下文缓存（画像/默认情景记忆/默认事实），长期记忆写入时失效
+        self.context_cache: Optional[UserContextCache] = None
+        if self.config.enable_cache:
+            self.context_cache = UserContextCache(
+                max_users=self.config.context_cache_users,
+                ttl=self.config.cache_ttl
+            )
+            self.storage.add_write_listener(self.context_cache.invalidate)
+        
+        # 后台提取队列（首次使用时在事件循环中创建）
+        self._job_queue: Optional[ExtractionJobQueue] = None
+        
         # 工作记忆缓存（内存中）
         self._working_memory_cache: Dict[str, WorkingMemory] = {}
+        
+        # 写回缓冲：会话ID -> 未落盘的消息数
+        self._dirty_sessions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        
+        # 访问计数累积器：情景记忆ID -> (所属用户, 累计次数, 最后访问时间)
+        self._pending_access: Dict[str, Tuple[str, int, datetime]] = {}
+        
+        # 后台刷新统计：失败的数据留在缓冲中等待下一轮，错误次数和最近一次错误记录在这里
+        self.flush_stats: Dict[str, Any] = {"runs": 0, "errors": 0, "last_error": None}
+        
+        self._stop_event = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        if self.config.working_memory_write_behind or self.config.episode_access_write_behind:
+            self._flush_thread = threading.Thread(
+                target=self._flush_loop, name="memory-flush", daemon=True
+            )
+            self._flush_thread.start()
+        
+        # 后台维护（遗忘 + 过期会话清理）
+        self.maintenance: Optional[MaintenanceScheduler] = None
+        if self.config.maintenance_enabled:
+            self.maintenance = MaintenanceScheduler(
+                self.storage,
+                self.run_forgetting,
+                chunk_size=self.config.maintenance_chunk_size,
+                rate=self.config.maintenance_rate,
+                interval=self.config.maintenance_interval,
+                session_days=self.config.session_retention_days
+            )
+            self.maintenance.start()
     
     # ========== 会话管理 ==========
     
@@ -78,58 +149,248 @@ class MemoryManager:
                 raise ValueError(f"会话不存在: {session_id}")
             self._working_memory_cache[session_id] = working_memory
         
-        working_memory = self._working_memory_cache[session_id]
-        msg_role = MessageRole(role) if isinstance(role, str) else role
-        working_memory.add_message(msg_role, content, metadata or {})
-        
-        # 限制工作记忆大小
-        max_messages = self.config.working_memory_size * 2  # 每轮2条消息
-        if len(working_memory.messages) > max_messages:
-            working_memory.messages = working_memory.messages[-max_messages:]
+        with self._lock:
+            working_memory = self._working_memory_cache[session_id]
+            msg_role = MessageRole(role) if isinstance(role, str) else role
+            working_memory.add_message(msg_role, content, metadata or {})
+            
+            # 限制工作记忆大小
+            max_messages = self.config.working_memory_size * 2  # 每轮2条消息
+            if len(working_memory.messages) > max_messages:
+                working_memory.messages = working_memory.messages[-max_messages:]
+            # 在锁内取出本次的消息，释放锁后其他线程可能已经追加了新消息
+            new_messages = working_memory.messages[-1:]
+            
+            if self.config.working_memory_write_behind:
+                # 写回模式：只标记为脏，达到未落盘上限时立即刷新
+                pending = self._dirty_sessions.get(session_id, 0) + 1
+                self._dirty_sessions[session_id] = pending
+                if pending < self.config.working_memory_max_unflushed:
+                    return
         
         # 持久化
-        self.storage.save_working_memory(working_memory)
+        if self.config.working_memory_write_behind:
+            self.flush_working_memory([session_id])
+        else:
+            self.storage.append_messages(working_memory, new_messages)
+    
+    def flush_working_memory(self, session_ids: List[str] = None) -> int:
+        """将写回缓冲中的脏会话合并写入存储，返回刷新的会话数"""
+        with self._lock:
+            targets = list(self._dirty_sessions) if session_ids is None else [
+                sid for sid in session_ids if sid in self._dirty_sessions
+            ]
+            pending = {sid: self._dirty_sessions.pop(sid) for sid in targets}
+            entries = []
+            for sid in targets:
+                wm = self._working_memory_cache.get(sid)
+                if wm is not None:
+                    # 在锁内取出未落盘的消息，落盘在锁外进行
+                    entries.append((wm, wm.messages[-pending[sid]:]))
+        
+        try:
+            self.storage.append_messages_batch(entries)
+        except Exception:
+            # 写入失败：重新标记为脏，等待下一次刷新
+            with self._lock:
+                for sid, count in pending.items():
+                    if sid in self._working_memory_cache:
+                        self._dirty_sessions[sid] = self._dirty_sessions.get(sid, 0) + count
+            raise
+        return len(entries)
+    
+    def _flush_loop(self):
+        """后台定时刷新写回缓冲和访问计数"""
+        while not self._stop_event.wait(self.config.working_memory_flush_interval):
+            self.flush_stats["runs"] += 1
+            # 两类缓冲分别刷新，一类失败不影响另一类
+            for flush in (self.flush_working_memory, self.flush_episode_access):
+                try:
+                    flush()
+                except Exception as e:
+                    # 未写入的数据已放回缓冲，下一轮重试
+                    self.flush_stats["errors"] += 1
+                    self.flush_stats["last_error"] = f"{flush.__name__}: {e!r}"
+    
+    def _record_episode_access(self, episodes: List[Episode]):
+        """记录情景记忆被检索（累积模式下只更新内存计数，不占用写锁）"""
+        if not episodes:
+            return
+        if not self.config.episode_access_write_behind:
+            # 按所属用户分组，分片存储只写对应用户的分片
+            by_user: Dict[str, List[str]] = {}
+            for ep in episodes:
+                by_user.setdefault(ep.user_id, []).append(ep.id)
+            with deferred_writes() as futures:
+                for user_id, episode_ids in by_user.items():
+                    self.storage.update_episodes_access(episode_ids, user_id=user_id)
+            for future in futures:
+                future.result()
+            return
+        now = datetime.now()
+        with self._lock:
+            for ep in episodes:
+                _, count, _ = self._pending_access.get(ep.id, (ep.user_id, 0, now))
+                self._pending_access[ep.id] = (ep.user_id, count + 1, now)
+    
+    def flush_episode_access(self) -> int:
+        """将累积的访问计数批量落盘（同一用户、相同次数和最后访问时间的记忆合并为一条UPDATE），返回更新的记忆数
+
+        各组的写操作在组提交模式下合并为一个事务
+        """
+        with self._lock:
+            pending, self._pending_access = self._pending_access, {}
+        if not pending:
+            return 0
+        
+        # 同一次检索命中的记忆访问时间相同，按时间分组不会产生过多的UPDATE
+        groups: Dict[Tuple[str, int, datetime], List[str]] = {}
+        for episode_id, entry in pending.items():
+            groups.setdefault(entry, []).append(episode_id)
+        # 每组对应的Future区间，用于判断哪些组已经写入
+        spans: Dict[Tuple[str, int, datetime], Tuple[int, int]] = {}
+        error: Optional[Exception] = None
+        with deferred_writes() as futures:
+            for key, episode_ids in groups.items():
+                user_id, count, accessed_at = key
+                start = len(futures)
+                try:
+                    self.storage.update_episodes_access(
+                        episode_ids, increment=count, accessed_at=accessed_at, user_id=user_id
+                    )
+                except Exception as e:
+                    error = e
+                    break
+                spans[key] = (start, len(futures))
+        done = set()
+        for key, (start, end) in spans.items():
+            try:
+                for future in futures[start:end]:
+                    future.result()
+                done.add(key)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            # 未写入的计数放回累积器，下次重试
+            with self._lock:
+                for episode_id, (user_id, count, ts) in pending.items():
+                    if (user_id, count, ts) in done:
+                        continue
+                    _, current, latest = self._pending_access.get(episode_id, (user_id, 0, ts))
+                    self._pending_access[episode_id] = (user_id, current + count, max(ts, latest))
+            raise error
+        return len(pending)
     
     async def end_session(self, session_id: str, extract_memory: bool = True) -> Optional[Episode]:
         """结束会话，提取记忆"""
-        if session_id not in self._working_memory_cache:
-            working_memory = self.storage.get_working_memory(session_id)
-            if not working_memory:
-                return None
-        else:
-            working_memory = self._working_memory_cache[session_id]
+        working_memory = self._prepare_end_session(session_id)
+        if not working_memory:
+            return None
+        return await self._finish_session(working_memory, extract_memory)
+    
+    async def submit_end_session(self, session_id: str) -> Optional[ExtractionJob]:
+        """结束会话，记忆提取放入后台队列执行，立即返回任务
         
-        episode = None
+        队列满时抛出 ExtractionQueueFull。任务完成前工作记忆仍保留在存储中，
+        进程退出导致任务丢失时可以重新结束该会话
+        """
+        working_memory = self._prepare_end_session(session_id)
+        if not working_memory:
+            return None
+        job = await self._get_job_queue().submit(working_memory, self.config.llm_provider)
+        with self._lock:
+            self._working_memory_cache.pop(session_id, None)
+        return job
+    
+    def get_job(self, job_id: str) -> Optional[ExtractionJob]:
+        """查询后台提取任务"""
+        return self._job_queue.get(job_id) if self._job_queue else None
+    
+    def _get_job_queue(self) -> ExtractionJobQueue:
+        if self._job_queue is None:
+            self._job_queue = ExtractionJobQueue(
+                self._finish_sessions,
+                batch_size=self.config.batch_size,
+                batch_wait=self.config.extraction_batch_wait,
+                workers=self.config.extraction_workers,
+                max_size=self.config.extraction_queue_size,
+                max_concurrency=self.config.llm_max_concurrency,
+                enqueue_timeout=self.config.extraction_enqueue_timeout,
+                history=self.config.extraction_job_history
+            )
+        return self._job_queue
+    
+    def _prepare_end_session(self, session_id: str) -> Optional[WorkingMemory]:
+        """取出待结束的会话，并落盘未刷新的消息（提取过程中崩溃也不会丢失对话）"""
+        working_memory = self._working_memory_cache.get(session_id)
+        if working_memory is None:
+            return self.storage.get_working_memory(session_id)
+        self.flush_working_memory([session_id])
+        return working_memory
+    
+    async def _finish_session(
+        self, 
+        working_memory: WorkingMemory, 
+        extract_memory: bool = True
+    ) -> Optional[Episode]:
+        """提取记忆（对话足够长时）并清理工作记忆"""
+        if not extract_memory:
+            await self.async_storage.write(self._discard_sessions, [working_memory])
+            return None
+        return (await self._finish_sessions([working_memory]))[0]
+    
+    async def _finish_sessions(self, working_memories: List[WorkingMemory]) -> List[Optional[Episode]]:
+        """批量结束会话：对足够长的对话合并提取记忆，然后清理工作记忆"""
+        min_messages = self.config.episode_compress_threshold * 2
+        to_extract = [wm for wm in working_memories if len(wm.messages) >= min_messages]
         
         # 如果对话足够长，提取记忆
-        if extract_memory and len(working_memory.messages) >= self.config.episode_compress_threshold * 2:
-            episode = await self._extract_and_store_memory(working_memory)
+        extracted = {}
+        if to_extract:
+            episodes = await self._extract_and_store_batch(to_extract)
+            extracted = {wm.session_id: ep for wm, ep in zip(to_extract, episodes)}
         
-        # 清理工作记忆
-        if session_id in self._working_memory_cache:
-            del self._working_memory_cache[session_id]
-        self.storage.delete_working_memory(session_id)
-        
-        return episode
+        await self.async_storage.write(self._discard_sessions, working_memories)
+        return [extracted.get(wm.session_id) for wm in working_memories]
+    
+    def _discard_sessions(self, working_memories: List[WorkingMemory]):
+        """清理工作记忆"""
+        for wm in working_memories:
+            with self._lock:
+                self._working_memory_cache.pop(wm.session_id, None)
+                self._dirty_sessions.pop(wm.session_id, None)
+            self.storage.delete_working_memory(wm.session_id)
     
     async def _extract_and_store_memory(self, working_memory: WorkingMemory) -> Episode:
         """提取并存储记忆"""
-        user_id = working_memory.user_id
-        session_id = working_memory.session_id
+        return (await self._extract_and_store_batch([working_memory]))[0]
+    
+    async def _extract_and_store_batch(self, working_memories: List[WorkingMemory]) -> List[Episode]:
+        """批量提取并存储记忆（LLM提取器把多段对话合并为一次调用）"""
+        conversations = [
+            (wm.messages, wm.user_id, wm.session_id) for wm in working_memories
+        ]
         
         # 使用提取器
         if isinstance(self.extractor, MemoryExtractor):
-            extraction = await self.extractor.extract_from_conversation(
-                working_memory.messages,
-                user_id,
-                session_id
-            )
+            extractions = await self.extractor.extract_batch(conversations)
         else:
-            extraction = self.extractor.extract_from_conversation(
-                working_memory.messages,
-                user_id,
-                session_id
-            )
+            extractions = [
+                self.extractor.extract_from_conversation(*conversation)
+                for conversation in conversations
+            ]
+        
+        return await self.async_storage.write(
+            lambda: [
+                self._store_extraction(wm, extraction)
+                for wm, extraction in zip(working_memories, extractions)
+            ]
+        )
+    
+    def _store_extraction(self, working_memory: WorkingMemory, extraction: Dict) -> Episode:
+        """保存提取结果：情景记忆、知识事实和用户画像更新"""
+        user_id = working_memory.user_id
+        session_id = working_memory.session_id
         
         # 创建并保存情景记忆
         episode = self.extractor.create_episode_from_extraction(
@@ -143,6 +404,9 @@ class MemoryManager:
             source_session_id=session_id
         )
         self.storage.save_episode(episode)
+        if self.embedding_queue is not None:
+            # 向量异步攒批计算，写回后自动加入向量索引
+            self.embedding_queue.submit(episode)
         
         # 保存知识事实
         if isinstance(self.extractor, MemoryExtractor):
@@ -192,46 +456,67 @@ class MemoryManager:
         query: str = None
     ) -> MemoryContext:
         """获取记忆上下文（用于增强LLM对话）"""
-        # 获取工作记忆
+        context = self._build_memory_context(session_id, query)
+        self._record_episode_access(context.relevant_episodes)
+        return context
+    
+    def _build_memory_context(self, session_id: str, query: str = None) -> MemoryContext:
+        """组装记忆上下文（只读，不更新访问记录）"""
+        # 工作记忆优先取内存缓存，其余数据在一个读事务内一次取出
         working_memory = self._working_memory_cache.get(session_id)
-        if not working_memory:
-            working_memory = self.storage.get_working_memory(session_id)
-        
-        if not working_memory:
-            return MemoryContext()
-        
-        user_id = working_memory.user_id
-        
-        # 获取用户画像
-        profile = self.storage.get_user_profile(user_id)
-        
-        # 检索相关情景记忆
-        if query:
-            keywords = self._extract_query_keywords(query)
-            episodes = self.storage.search_episodes_by_keywords(
-                user_id, keywords, limit=3
-            )
-        else:
-            episodes = self.storage.get_episodes(
-                user_id, limit=3, min_importance=0.5
+        keywords = self._extract_query_keywords(query) if query else None
+        
+        # 带查询时只有画像可以缓存，不带查询时整个长期记忆部分都可以
+        cached, version = None, None
+        parts = ("profile",) if query else UserContextCache.PARTS
+        if self.context_cache is not None and working_memory is not None:
+            version = self.context_cache.version(working_memory.user_id)
+            cached = self.context_cache.get(working_memory.user_id, parts)
+        
+        context = self.storage.get_context_bundle(
+            session_id,
+            query=query,
+            keywords=keywords,
+            working_memory=working_memory,
+            cached=cached
+        )
+        if not context.working_memory:
+            return context
+        
+        if version is not None and cached is None:
+            fetched = {
+                "profile": context.user_profile,
+                "episodes": list(context.relevant_episodes),
+                "facts": list(context.relevant_facts),
+            }
+            self.context_cache.put(
+                working_memory.user_id, version, **{part: fetched[part] for part in parts}
             )
         
-        # 更新访问记录
-        for ep in episodes:
-            self.storage.update_episode_access(ep.id)
-        
-        # 检索相关事实
-        if query:
-            facts = self.storage.search_facts(user_id, query, limit=5)
-        else:
-            facts = self.storage.get_facts(user_id, limit=5)
+        # 合并向量检索结果
+        if query and self.vector_index is not None:
+            context.relevant_episodes = self._merge_vector_hits(
+                context.working_memory.user_id, query, context.relevant_episodes
+            )
         
-        return MemoryContext(
-            working_memory=working_memory,
-            relevant_episodes=episodes,
-            user_profile=profile,
-            relevant_facts=facts
+        return context
+    
+    def _merge_vector_hits(
+        self, 
+        user_id: str, 
+        query: str, 
+        episodes: List[Episode]
+    ) -> List[Episode]:
+        """把向量检索结果合并到关键词检索结果之后（去重）"""
+        limit = self.config.max_retrieval_results
+        query_vector = self.embedder.embed([query])[0]
+        hits = self.vector_index.search(
+            user_id, query_vector, k=limit, threshold=self.config.similarity_threshold
         )
+        seen = {ep.id for ep in episodes}
+        new_ids = [episode_id for episode_id, _ in hits if episode_id not in seen]
+        merged = episodes + self.storage.get_episodes_by_ids(new_ids, user_id=user_id)
+        return merged[:max(limit, len(episodes))]
     
     def _extract_query_keywords(self, query: str) -> List[str]:
         """从查询中提取关键词"""
@@ -249,7 +534,15 @@ class MemoryManager:
     
     def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
         """获取用户画像"""
-        return self.storage.get_user_profile(user_id)
+        if self.context_cache is None:
+            return self.storage.get_user_profile(user_id)
+        version = self.context_cache.version(user_id)
+        cached = self.context_cache.get(user_id, ("profile",))
+        if cached is not None:
+            return cached["profile"]
+        profile = self.storage.get_user_profile(user_id)
+        self.context_cache.put(user_id, version, profile=profile)
+        return profile
     
     def update_user_profile(self, profile: UserProfile):
         """更新用户画像"""
@@ -260,10 +553,13 @@ class MemoryManager:
     
     def run_forgetting(self, user_id: str) -> int:
         """运行遗忘机制"""
-        return self.storage.delete_weak_episodes(
+        deleted = self.storage.delete_weak_episodes(
             user_id, 
             min_strength=self.config.min_importance_threshold
         )
+        if deleted and self.vector_index is not None:
+            self.vector_index.invalidate(user_id)
+        return deleted
     
     def cleanup(self, days: int = 7) -> int:
         """清理过期数据"""
@@ -272,38 +568,229 @@ class MemoryManager:
     def get_stats(self, user_id: str) -> Dict[str, Any]:
         """获取统计信息"""
         return self.storage.get_stats(user_id)
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """缓存命中统计"""
+        stats = {}
+        if self.context_cache is not None:
+            stats["context"] = self.context_cache.stats()
+        extraction_cache = getattr(self.llm_client, "cache", None)
+        if extraction_cache is not None:
+            stats["extraction"] = extraction_cache.stats()
+        return stats
+    
+    def backfill_embeddings(self, chunk_size: int = 256) -> Dict[str, float]:
+        """为尚未计算向量的存量情景记忆回填向量"""
+        if self.embedder is None:
+            raise RuntimeError("未启用向量检索")
+        stats = backfill_embeddings(self.storage, self.embedder, chunk_size)
+        self.vector_index.invalidate()
+        return stats
+    
+    def close(self):
+        """释放资源（刷新写回缓冲并关闭数据库连接）"""
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        if self._flush_thread is not None:
+            self._stop_event.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush_working_memory()
+        self.flush_episode_access()
+        if self.embedding_queue is not None:
+            self.embedding_queue.close()
+        self.async_storage.close()
+        self.storage.close()
+    
+    async def aclose(self):
+        """异步释放资源（等待后台提取完成、关闭LLM连接池后执行close）"""
+        if self._job_queue is not None:
+            await self._job_queue.close()
+        await self.llm_client.aclose()
+        self.close()
     
     # ========== 导出/导入 ==========
     
     def export_user_memory(self, user_id: str) -> Dict:
-        """导出用户所有记忆"""
+        """导出用户所有记忆（不限条数）"""
+        chunk_size = self.config.export_chunk_size
         profile = self.storage.get_user_profile(user_id)
-        episodes = self.storage.get_episodes(user_id, limit=1000)
-        facts = self.storage.get_facts(user_id, limit=1000)
         
         return {
             "user_id": user_id,
             "export_time": datetime.now().isoformat(),
             "profile": profile.to_dict() if profile else None,
-            "episodes": [ep.to_dict() for ep in episodes],
-            "facts": [f.to_dict() for f in facts]
+            "episodes": [ep.to_dict() for ep in self.storage.iter_episodes(user_id, chunk_size)],
+            "facts": [f.to_dict() for f in self.storage.iter_facts(user_id, chunk_size)]
         }
     
+    def iter_export_json(self, user_id: str) -> Iterator[str]:
+        """流式导出一个用户的记忆
+        
+        逐块产出与 export_user_memory 结构相同的JSON文本，
+        记忆按页从存储中读取，内存占用与记忆条数无关
+        """
+        chunk_size = self.config.export_chunk_size
+        profile = self.storage.get_user_profile(user_id)
+        head = codec.dumps({
+            "user_id": user_id,
+            "export_time": datetime.now().isoformat(),
+            "profile": profile.to_dict() if profile else None,
+        })
+        
+        yield head[:-1] + ',"episodes":['
+        yield from self._iter_json_items(
+            (ep.to_dict() for ep in self.storage.iter_episodes(user_id, chunk_size)), chunk_size
+        )
+        yield '],"facts":['
+        yield from self._iter_json_items(
+            (f.to_dict() for f in self.storage.iter_facts(user_id, chunk_size)), chunk_size
+        )
+        yield ']}'
+    
+    def iter_export_ndjson(self, user_ids: Iterable[str] = None) -> Iterator[str]:
+        """流式导出多个用户（默认全部用户），每行一个用户，可直接用于 import_users"""
+        if user_ids is None:
+            user_ids = self.storage.iter_user_ids(self.config.export_chunk_size)
+        for user_id in user_ids:
+            yield from self.iter_export_json(user_id)
+            yield "\n"
+    
+    @staticmethod
+    def _iter_json_items(items: Iterable[Dict], chunk_size: int) -> Iterator[str]:
+        """把对象序列编码为逗号分隔的JSON片段，每 chunk_size 个对象产出一次"""
+        items = iter(items)
+        first = True
+        for chunk in iter(lambda: list(islice(items, chunk_size)), []):
+            text = ",".join(codec.dumps(item) for item in chunk)
+            yield text if first else "," + text
+            first = False
+    
     def import_user_memory(self, data: Dict):
-        """导入用户记忆"""
-        user_id = data["user_id"]
-        
-        # 导入画像
-        if data.get("profile"):
-            profile = UserProfile.from_dict(data["profile"])
-            self.storage.save_user_profile(profile)
-        
-        # 导入情景记忆
-        for ep_data in data.get("episodes", []):
-            episode = Episode.from_dict(ep_data)
-            self.storage.save_episode(episode)
-        
-        # 导入事实
-        for fact_data in data.get("facts", []):
-            fact = Fact.from_dict(fact_data)
-            self.storage.save_fact(fact)
+        """导入用户记忆（先校验全部数据，再在一个事务中批量写入）"""
+        self.import_users([data])
+    
+    def import_users(self, payloads: Iterable[Dict]) -> int:
+        """批量导入多个用户的记忆，返回导入的用户数
+        
+        payloads 为 export_user_memory 格式的字典序列（可以是生成器）；
+        每 import_batch_users 个用户校验后合并为一次 bulk_import（一个事务）。
+        某批数据无效时抛出 ValueError，之前的批次已经提交
+        """
+        payloads = iter(payloads)
+        imported = 0
+        while True:
+            chunk = list(islice(payloads, max(1, self.config.import_batch_users)))
+            if not chunk:
+                return imported
+            profiles, episodes, facts = [], [], []
+            for data in chunk:
+                profile, user_episodes, user_facts = self._parse_import(data)
+                if profile is not None:
+                    profiles.append(profile)
+                episodes.extend(user_episodes)
+                facts.extend(user_facts)
+            
+            self.storage.bulk_import(profiles, episodes, facts)
+            if self.embedding_queue is not None:
+                for episode in episodes:
+                    self.embedding_queue.submit(episode)
+            imported += len(chunk)
+    
+    @staticmethod
+    def _parse_import(data: Dict) -> Tuple[Optional[UserProfile], List[Episode], List[Fact]]:
+        """校验并解析一个用户的导入数据"""
+        user_id = data.get("user_id") if isinstance(data, dict) else None
+        if not user_id:
+            raise ValueError("导入数据缺少 user_id")
+        try:
+            profile = UserProfile.from_dict(data["profile"]) if data.get("profile") else None
+            episodes = [Episode.from_dict(ep_data) for ep_data in data.get("episodes") or []]
+            facts = [Fact.from_dict(fact_data) for fact_data in data.get("facts") or []]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"用户 {user_id} 的导入数据无效: {e!r}") from e
+        
+        records = ([profile] if profile else []) + episodes + facts
+        if any(record.user_id != user_id for record in records):
+            raise ValueError(f"用户 {user_id} 的导入数据包含其他用户的记录")
+        return profile, episodes, facts
+    
+    # ========== 异步接口 ==========
+    # 供事件循环中调用：读操作在读线程池中执行，写操作在单写线程中执行；
+    # 不需要写入结果的调用使用 submit()，写操作交给组提交线程后不阻塞写线程，并发请求的写入合并提交
+    
+    async def astart_session(self, user_id: str, session_id: str = None) -> WorkingMemory:
+        """开始新会话（异步）"""
+        return await self.async_storage.submit(self.start_session, user_id, session_id)
+    
+    async def aadd_message(
+        self, 
+        session_id: str, 
+        role: str, 
+        content: str,
+        metadata: Dict = None
+    ):
+        """添加消息到工作记忆（异步）"""
+        if self.config.working_memory_write_behind:
+            # 写回模式下刷新失败要把会话重新标记为脏，需要同步得到写入结果
+            await self.async_storage.write(self.add_message, session_id, role, content, metadata)
+        else:
+            await self.async_storage.submit(self.add_message, session_id, role, content, metadata)
+    
+    async def aend_session(self, session_id: str, extract_memory: bool = True) -> Optional[Episode]:
+        """结束会话，提取记忆（异步）"""
+        working_memory = await self.async_storage.write(self._prepare_end_session, session_id)
+        if not working_memory:
+            return None
+        return await self._finish_session(working_memory, extract_memory)
+    
+    async def asubmit_end_session(self, session_id: str) -> Optional[ExtractionJob]:
+        """结束会话并提交后台提取任务（异步）"""
+        working_memory = await self.async_storage.write(self._prepare_end_session, session_id)
+        if not working_memory:
+            return None
+        job = await self._get_job_queue().submit(working_memory, self.config.llm_provider)
+        with self._lock:
+            self._working_memory_cache.pop(session_id, None)
+        return job
+    
+    async def aget_memory_context(self, session_id: str, query: str = None) -> MemoryContext:
+        """获取记忆上下文（异步）"""
+        context = await self.async_storage.read(self._build_memory_context, session_id, query)
+        if self.config.episode_access_write_behind:
+            self._record_episode_access(context.relevant_episodes)
+        else:
+            await self.async_storage.submit(self._record_episode_access, context.relevant_episodes)
+        return context
+    
+    async def aget_user_profile(self, user_id: str) -> Optional[UserProfile]:
+        """获取用户画像（异步）"""
+        return await self.async_storage.read(self.get_user_profile, user_id)
+    
+    async def aupdate_user_profile(self, profile: UserProfile):
+        """更新用户画像（异步）"""
+        await self.async_storage.submit(self.update_user_profile, profile)
+    
+    async def arun_forgetting(self, user_id: str) -> int:
+        """运行遗忘机制（异步）"""
+        return await self.async_storage.write(self.run_forgetting, user_id)
+    
+    async def acleanup(self, days: int = 7) -> int:
+        """清理过期数据（异步）"""
+        return await self.async_storage.write(self.cleanup, days)
+    
+    async def aget_stats(self, user_id: str) -> Dict[str, Any]:
+        """获取统计信息（异步）"""
+        return await self.async_storage.read(self.get_stats, user_id)
+    
+    async def aexport_user_memory(self, user_id: str) -> Dict:
+        """导出用户所有记忆（异步）"""
+        return await self.async_storage.read(self.export_user_memory, user_id)
+    
+    async def aimport_user_memory(self, data: Dict):
+        """导入用户记忆（异步）"""
+        await self.async_storage.write(self.import_user_memory, data)
+    
+    async def aimport_users(self, payloads: List[Dict]) -> int:
+        """批量导入多个用户的记忆（异步）"""
+        return await self.async_storage.write(self.import_users, payloads)
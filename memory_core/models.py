@@ -1,12 +1,64 @@
 """
 记忆数据模型定义
 """
-from dataclasses import dataclass, field
+import calendar
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 from enum import Enum
 import uuid
-import json
+
+from memory_core import codec
+
+
+def _lazy_json(name: str, default_factory) -> property:
+    """延迟解析的JSON字段：从数据库读出时只保存原始文本（_<name>_raw），首次访问时才解析"""
+    value_slot, raw_slot = f"_{name}", f"_{name}_raw"
+    
+    def getter(self):
+        raw = getattr(self, raw_slot)
+        if raw is not None:
+            setattr(self, value_slot, codec.loads(raw) if raw else default_factory())
+            setattr(self, raw_slot, None)
+        return getattr(self, value_slot)
+    
+    def setter(self, value):
+        setattr(self, value_slot, value)
+        setattr(self, raw_slot, None)
+    
+    return property(getter, setter)
+
+
+def _add_slots(lazy: Dict[str, Any] = None):
+    """类装饰器：为dataclass重建一个带 __slots__ 的类（Python 3.9 的 dataclass 不支持 slots=True）
+
+    实例不再有 __dict__，每个对象省下一个字典；lazy 中的字段（字段名 -> 默认值工厂）
+    改为 _lazy_json 属性，占用 _<name> 和 _<name>_raw 两个槽
+    """
+    lazy = lazy or {}
+    
+    def wrap(cls):
+        names = [f.name for f in fields(cls)]
+        namespace = dict(cls.__dict__)
+        for name in names:
+            # 默认值已保存在生成的 __init__ 中，类属性会与同名槽冲突
+            namespace.pop(name, None)
+        namespace.pop("__dict__", None)
+        namespace.pop("__weakref__", None)
+        
+        slots = [name for name in names if name not in lazy]
+        for name, default_factory in lazy.items():
+            slots += [f"_{name}", f"_{name}_raw"]
+            namespace[name] = _lazy_json(name, default_factory)
+        namespace["__slots__"] = tuple(slots)
+        return type(cls)(cls.__name__, cls.__bases__, namespace)
+    
+    return wrap
+
+
+def epoch_seconds(dt: datetime) -> int:
+    """把（本地时间的）datetime按字面值转为整数秒，与SQLite的 strftime('%s', ...) 一致"""
+    return calendar.timegm(dt.timetuple())
 
 
 class MemoryType(Enum):
@@ -23,6 +75,7 @@ class MessageRole(Enum):
     SYSTEM = "system"
 
 
+@_add_slots(lazy={"metadata": dict})
 @dataclass
 class Message:
     """单条对话消息"""
@@ -82,6 +135,7 @@ class WorkingMemory:
         }
 
 
+@_add_slots(lazy={"metadata": dict})
 @dataclass
 class Episode:
     """情景记忆：对话摘要或重要事件"""
@@ -105,12 +159,20 @@ class Episode:
         self.access_count += 1
         self.last_accessed = datetime.now()
     
-    def calculate_strength(self, decay_days: int = 30) -> float:
-        """计算记忆强度（考虑时间衰减和访问频率）"""
+    def calculate_strength(
+        self,
+        decay_days: int = 30,
+        time_weight: float = 0.7,
+        access_weight: float = 0.3
+    ) -> float:
+        """计算记忆强度（考虑时间衰减和访问频率）
+        
+        SQLite存储中的 STRENGTH_SQL 是同一公式的SQL表达式，修改时需同步
+        """
         days_passed = (datetime.now() - self.last_accessed).days
         time_factor = max(0, 1 - days_passed / decay_days)
         access_factor = min(1, self.access_count / 10)
-        return self.importance * (0.7 * time_factor + 0.3 * access_factor)
+        return self.importance * (time_weight * time_factor + access_weight * access_factor)
     
     def to_dict(self) -> Dict:
         return {
@@ -144,6 +206,7 @@ class Episode:
         )
 
 
+@_add_slots(lazy={"preferences": dict})
 @dataclass
 class UserProfile:
     """用户画像（语义记忆的一部分）"""
@@ -190,6 +253,7 @@ class UserProfile:
         )
 
 
+@_add_slots()
 @dataclass
 class Fact:
     """知识事实（语义记忆的一部分）"""
@@ -0,0 +1,138 @@
+"""
+向量索引：按用户懒加载的内存向量索引
+默认暴力矩阵乘检索；向量数超过阈值且安装了faiss时使用HNSW近似检索
+"""
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MemoryConfig
+
+
+class UserVectorIndex:
+    """单个用户的向量集合"""
+
+    def __init__(self, dim: int, ann_threshold: int = 5000):
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self.ids: List[str] = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+        self._positions: Dict[str, int] = {}
+        self._ann = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def load(self, items: List[Tuple[str, List[float]]]):
+        """一次性载入全部向量"""
+        items = [(episode_id, v) for episode_id, v in items if len(v) == self.dim]
+        self.ids = [episode_id for episode_id, _ in items]
+        self._positions = {episode_id: i for i, episode_id in enumerate(self.ids)}
+        if items:
+            self.matrix = np.asarray([v for _, v in items], dtype=np.float32)
+        self._ann = None
+
+    def add(self, episode_id: str, vector: List[float]):
+        """添加或替换一个向量"""
+        row = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        if episode_id in self._positions:
+            self.matrix[self._positions[episode_id]] = row
+        else:
+            self._positions[episode_id] = len(self.ids)
+            self.ids.append(episode_id)
+            self.matrix = np.vstack([self.matrix, row])
+        self._ann = None
+
+    def search(self, query: List[float], k: int) -> List[Tuple[str, float]]:
+        """返回内积最大的k个 (episode_id, 相似度)"""
+        if not self.ids or k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32).reshape(1, self.dim)
+
+        ann = self._get_ann()
+        if ann is not None:
+            scores, positions = ann.search(q, min(k, len(self.ids)))
+            return [
+                (self.ids[p], float(s))
+                for p, s in zip(positions[0], scores[0]) if p >= 0
+            ]
+
+        scores = self.matrix @ q[0]
+        k = min(k, len(self.ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[p], float(scores[p])) for p in top]
+
+    def _get_ann(self):
+        """向量数较多时构建HNSW索引（需要faiss）"""
+        if len(self.ids) < self.ann_threshold:
+            return None
+        if self._ann is None:
+            try:
+                import faiss
+            except ImportError:
+                return None
+            index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.add(self.matrix)
+            self._ann = index
+        return self._ann
+
+
+class VectorIndex:
+    """按用户懒加载的向量索引：首次检索某用户时从存储读取其全部向量"""
+
+    def __init__(
+        self,
+        config: MemoryConfig,
+        loader: Callable[[str], List[Tuple[str, List[float]]]]
+    ):
+        if np is None:
+            raise ImportError("向量检索需要numpy: pip install toy-memory-system[vector]")
+        self.config = config
+        self._loader = loader
+        self._users: Dict[str, UserVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def _get_user(self, user_id: str) -> UserVectorIndex:
+        """获取用户索引（调用方需持有锁）"""
+        index = self._users.get(user_id)
+        if index is None:
+            index = UserVectorIndex(self.config.vector_dim, self.config.vector_ann_threshold)
+            index.load(self._loader(user_id))
+            self._users[user_id] = index
+        return index
+
+    def add(self, user_id: str, episode_id: str, vector: List[float]):
+        """新增向量（用户索引未加载时跳过，下次懒加载会包含它）"""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.add(episode_id, vector)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """丢弃用户（或全部）已加载的索引"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def search(
+        self,
+        user_id: str,
+        query: List[float],
+        k: int,
+        threshold: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """检索与query最相似且相似度不低于threshold的情景记忆"""
+        with self._lock:
+            hits = self._get_user(user_id).search(query, k)
+        return [(episode_id, score) for episode_id, score in hits if score >= threshold]
@@ -1,4 +1,9 @@
 # Storage Package
+# memory_core 依赖 storage，先完整加载 memory_core，避免单独导入 storage（如 python -m storage.xxx）时循环导入失败
+import memory_core  # noqa: F401
+from storage.base import StorageBackend, create_storage
 from storage.sqlite_storage import SQLiteStorage
+from storage.memory_storage import MemoryStorage
+from storage.sharded_storage import ShardedSQLiteStorage
 
-__all__ = ["SQLiteStorage"]
+__all__ = ["StorageBackend", "create_storage", "SQLiteStorage", "MemoryStorage", "ShardedSQLiteStorage"]
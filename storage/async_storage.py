@@ -0,0 +1,73 @@
+"""
+异步存储适配：在线程池中执行同步存储操作，避免阻塞事件循环
+读操作在读线程池中并发执行，写操作在单个写线程中串行执行
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from storage.writer import deferred_writes
+
+# 按方法名前缀判定为读操作，其余视为写操作
+READ_PREFIXES = ("get_", "search_")
+
+
+class AsyncStorage:
+    """同步存储的异步包装
+
+    - await storage.get_user_profile(...) 等价于在读线程池中调用同步方法
+    - await storage.save_episode(...) 在唯一的写线程中执行，写入互不争抢SQLite写锁
+    - read()/write() 可在对应线程中执行任意函数（例如一组存储调用）
+    - submit() 同样在写线程中执行，但其中的组提交写操作只入队不等待，写线程随即处理下一个调用，
+      连续的写入因此能被合并为一个事务；提交完成后 submit() 才返回
+    """
+
+    def __init__(self, storage, readers: int = 4):
+        self.storage = storage
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers), thread_name_prefix="storage-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-write")
+
+    async def read(self, fn: Callable, *args, **kwargs) -> Any:
+        """在读线程池中执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(fn, *args, **kwargs))
+
+    async def write(self, fn: Callable, *args, **kwargs) -> Any:
+        """在写线程中执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(fn, *args, **kwargs))
+
+    async def submit(self, fn: Callable, *args, **kwargs) -> Any:
+        """在写线程中执行（fn不能依赖其中写操作的返回值），异步等待其写操作提交"""
+        loop = asyncio.get_running_loop()
+        result, futures = await loop.run_in_executor(
+            self._writer, functools.partial(_run_deferred, fn, *args, **kwargs)
+        )
+        if futures:
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+        return result
+
+    def __getattr__(self, name: str):
+        method = getattr(self.storage, name)
+        if not callable(method) or name.startswith("_"):
+            return method
+        run = self.read if name.startswith(READ_PREFIXES) else self.write
+
+        async def call(*args, **kwargs):
+            return await run(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def close(self):
+        """等待执行中的操作完成后关闭线程池（不关闭底层存储）"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+def _run_deferred(fn: Callable, *args, **kwargs):
+    """执行fn并收集其中未等待的写操作"""
+    with deferred_writes() as futures:
+        result = fn(*args, **kwargs)
+    return result, futures
@@ -0,0 +1,307 @@
+"""
+存储后端接口：MemoryManager 使用的全部存储操作
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.models import (
+    Episode, UserProfile, Fact, WorkingMemory,
+    Message, MemoryContext
+)
+from config import MemoryConfig
+
+
+class StorageBackend(ABC):
+    """存储后端基类
+
+    实现需要保证与SQLite相同的淘汰语义：
+    - 情景记忆超过 max_episodes_per_user 时删除重要性最低、最久未访问的记忆
+    - 知识事实超过 max_facts_per_user 时删除置信度最低的事实
+    - 工作记忆只保留最近 working_memory_size * 2 条消息
+    """
+
+    def __init__(self, config: MemoryConfig):
+        self.config = config
+        # 长期记忆写入回调（参数为user_id），用于使上层缓存失效
+        self._write_listeners: List[Callable[[str], None]] = []
+        # 后台维护任务进度（持久化后端覆盖 get/save_maintenance_state）
+        self._maintenance_state: Dict[str, Dict[str, Any]] = {}
+
+    def add_write_listener(self, listener: Callable[[str], None]):
+        """注册长期记忆（画像/情景/事实）写入回调"""
+        self._write_listeners.append(listener)
+
+    def _notify_write(self, user_id: str):
+        for listener in self._write_listeners:
+            listener(user_id)
+
+    def close(self):
+        """释放资源"""
+        pass
+
+    # ========== 用户画像 ==========
+
+    @abstractmethod
+    def save_user_profile(self, profile: UserProfile):
+        """保存用户画像"""
+        pass
+
+    @abstractmethod
+    def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
+        """获取用户画像"""
+        pass
+
+    # ========== 情景记忆 ==========
+
+    @abstractmethod
+    def save_episode(self, episode: Episode):
+        """保存情景记忆（超出数量上限时淘汰）"""
+        pass
+
+    @abstractmethod
+    def get_episodes(self, user_id: str, limit: int = 10, min_importance: float = 0.0) -> List[Episode]:
+        """按重要性、最近访问时间获取情景记忆"""
+        pass
+
+    @abstractmethod
+    def search_episodes_by_keywords(self, user_id: str, keywords: List[str], limit: int = 5) -> List[Episode]:
+        """通过关键词搜索情景记忆"""
+        pass
+
+    @abstractmethod
+    def get_episodes_by_ids(self, episode_ids: List[str], user_id: str = None) -> List[Episode]:
+        """按ID批量获取情景记忆（保持传入顺序）
+
+        已知记忆所属用户时传入 user_id（分片存储只访问该用户的分片），以下批量方法相同
+        """
+        pass
+
+    @abstractmethod
+    def get_episode_embeddings(self, user_id: str) -> List[Tuple[str, List[float]]]:
+        """获取用户所有已计算的情景记忆向量"""
+        pass
+
+    @abstractmethod
+    def get_episodes_without_embedding(self, after_rowid: int = 0, limit: int = 256) -> List[Tuple[int, Episode]]:
+        """按写入顺序分块获取尚未计算向量的情景记忆"""
+        pass
+
+    @abstractmethod
+    def update_episode_embeddings(self, items: List[Tuple[str, List[float]]], user_id: str = None):
+        """批量写入情景记忆向量"""
+        pass
+
+    def update_episode_access(self, episode_id: str):
+        """更新情景记忆的访问记录"""
+        self.update_episodes_access([episode_id])
+
+    @abstractmethod
+    def update_episodes_access(
+        self,
+        episode_ids: List[str],
+        increment: int = 1,
+        accessed_at: datetime = None,
+        user_id: str = None
+    ):
+        """批量更新访问记录"""
+        pass
+
+    @abstractmethod
+    def delete_weak_episodes(self, user_id: str, min_strength: float = 0.2) -> int:
+        """删除弱记忆（遗忘机制），返回删除数量"""
+        pass
+
+    # ========== 知识事实 ==========
+
+    @abstractmethod
+    def save_fact(self, fact: Fact):
+        """保存知识事实（相同三元组去重，超出数量上限时淘汰）"""
+        pass
+
+    @abstractmethod
+    def get_facts(self, user_id: str, limit: int = 20) -> List[Fact]:
+        """按置信度获取知识事实"""
+        pass
+
+    @abstractmethod
+    def search_facts(self, user_id: str, query: str, limit: int = 10) -> List[Fact]:
+        """搜索相关知识事实"""
+        pass
+
+    # ========== 工作记忆 ==========
+
+    @abstractmethod
+    def save_working_memory(self, memory: WorkingMemory):
+        """保存工作记忆（整体覆盖）"""
+        pass
+
+    def append_messages(self, memory: WorkingMemory, messages: List[Message]):
+        """追加消息到工作记忆"""
+        self.append_messages_batch([(memory, messages)])
+
+    @abstractmethod
+    def append_messages_batch(self, entries: List[Tuple[WorkingMemory, List[Message]]]):
+        """批量追加消息，并裁剪到滑动窗口大小"""
+        pass
+
+    @abstractmethod
+    def get_working_memory(self, session_id: str) -> Optional[WorkingMemory]:
+        """获取工作记忆"""
+        pass
+
+    @abstractmethod
+    def delete_working_memory(self, session_id: str):
+        """删除工作记忆"""
+        pass
+
+    @abstractmethod
+    def cleanup_old_sessions(self, days: int = 7, limit: int = None) -> int:
+        """清理旧的工作记忆，返回删除的会话数（limit 限制单次最多删除的会话数）"""
+        pass
+
+    # ========== 后台维护进度 ==========
+
+    def get_maintenance_state(self, name: str) -> Optional[Dict[str, Any]]:
+        """读取后台维护任务的进度（默认只保存在内存中）"""
+        state = self._maintenance_state.get(name)
+        return dict(state) if state is not None else None
+
+    def save_maintenance_state(self, name: str, state: Dict[str, Any]):
+        """保存后台维护任务的进度"""
+        self._maintenance_state[name] = dict(state)
+
+    # ========== 批量导入 ==========
+
+    def bulk_import(self, profiles: List[UserProfile], episodes: List[Episode], facts: List[Fact]):
+        """批量导入多个用户的画像、情景记忆和事实（默认逐条保存，后端可覆盖为批量写入）"""
+        for profile in profiles:
+            self.save_user_profile(profile)
+        for episode in episodes:
+            self.save_episode(episode)
+        for fact in facts:
+            self.save_fact(fact)
+
+    # ========== 分页遍历（流式导出） ==========
+
+    @abstractmethod
+    def get_episodes_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Episode]]:
+        """按写入顺序分页获取用户的情景记忆，返回 (游标, 记忆)"""
+        pass
+
+    @abstractmethod
+    def get_facts_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Fact]]:
+        """按写入顺序分页获取用户的知识事实，返回 (游标, 事实)"""
+        pass
+
+    @abstractmethod
+    def get_user_ids_page(self, after: str = "", limit: int = 500) -> List[str]:
+        """按user_id排序分页获取有长期记忆（画像/情景/事实）的用户"""
+        pass
+
+    def iter_episodes(self, user_id: str, chunk_size: int = 500) -> Iterator[Episode]:
+        """逐页遍历用户的全部情景记忆"""
+        return _iter_pages(lambda after: self.get_episodes_page(user_id, after, chunk_size), 0, chunk_size)
+
+    def iter_facts(self, user_id: str, chunk_size: int = 500) -> Iterator[Fact]:
+        """逐页遍历用户的全部知识事实"""
+        return _iter_pages(lambda after: self.get_facts_page(user_id, after, chunk_size), 0, chunk_size)
+
+    def iter_user_ids(self, chunk_size: int = 500) -> Iterator[str]:
+        """逐页遍历全部用户ID"""
+        after = ""
+        while True:
+            page = self.get_user_ids_page(after, chunk_size)
+            yield from page
+            if len(page) < chunk_size:
+                return
+            after = page[-1]
+
+    # ========== 上下文组装与统计 ==========
+
+    def get_context_bundle(
+        self,
+        session_id: str,
+        query: str = None,
+        keywords: List[str] = None,
+        working_memory: WorkingMemory = None,
+        cached: Dict[str, Any] = None,
+        episode_limit: int = 3,
+        fact_limit: int = 5
+    ) -> MemoryContext:
+        """取出组装上下文所需的全部数据
+
+        working_memory: 调用方已缓存的工作记忆（传入时不再查询）
+        keywords: 情景记忆检索词（为空时按重要性取最近的记忆）
+        cached: 调用方缓存中已有的部分（profile/episodes/facts），这些部分不再查询
+        访问计数由调用方另行更新
+        """
+        if working_memory is None:
+            working_memory = self.get_working_memory(session_id)
+        if working_memory is None:
+            return MemoryContext()
+
+        user_id = working_memory.user_id
+        cached = cached or {}
+
+        if "profile" in cached:
+            profile = cached["profile"]
+        else:
+            profile = self.get_user_profile(user_id)
+
+        if query:
+            episodes = self.search_episodes_by_keywords(user_id, keywords or [], limit=episode_limit)
+            facts = self.search_facts(user_id, query, limit=fact_limit)
+        else:
+            if "episodes" in cached:
+                episodes = list(cached["episodes"])
+            else:
+                episodes = self.get_episodes(user_id, limit=episode_limit, min_importance=0.5)
+            if "facts" in cached:
+                facts = list(cached["facts"])
+            else:
+                facts = self.get_facts(user_id, limit=fact_limit)
+
+        return MemoryContext(
+            working_memory=working_memory,
+            relevant_episodes=episodes,
+            user_profile=profile,
+            relevant_facts=facts
+        )
+
+    @abstractmethod
+    def get_stats(self, user_id: str) -> Dict[str, Any]:
+        """获取用户记忆统计信息"""
+        pass
+
+
+def _iter_pages(fetch: Callable[[int], List[Tuple[int, Any]]], after: int, chunk_size: int) -> Iterator[Any]:
+    """按游标分页遍历：每页一次短查询，不长期占用连接和读事务"""
+    while True:
+        page = fetch(after)
+        for _, item in page:
+            yield item
+        if len(page) < chunk_size:
+            return
+        after = page[-1][0]
+
+
+def create_storage(config: MemoryConfig) -> StorageBackend:
+    """工厂函数：按 config.storage_backend 创建存储后端"""
+    backend = config.storage_backend.lower()
+
+    if backend == "sqlite":
+        from storage.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(config)
+    elif backend == "sharded":
+        from storage.sharded_storage import ShardedSQLiteStorage
+        return ShardedSQLiteStorage(config)
+    elif backend == "memory":
+        from storage.memory_storage import MemoryStorage
+        return MemoryStorage(config)
+    else:
+        raise ValueError(f"不支持的存储后端: {backend}")
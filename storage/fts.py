@@ -0,0 +1,61 @@
+"""
+全文检索分词：为FTS5索引准备中文文本
+中文按重叠二元组切分（"霸王龙" → "霸王 王龙"），字母数字按单词切分，
+不依赖jieba，写入和查询使用同一套规则，保证结果稳定。
+每个词元前拼接所属用户的前缀，倒排表按用户分开，检索只读取该用户的条目
+"""
+import hashlib
+import re
+from typing import Iterable, List, Optional
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'[{_CJK}]+|[A-Za-z0-9]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """切分为索引词元"""
+    tokens = []
+    for run in _TOKEN_RE.findall(text or ""):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def user_prefix(user_id: Optional[str]) -> str:
+    """用户前缀（字母数字，与词元连成一个FTS5词）；哈希冲突的用户由查询中的 user_id 条件区分"""
+    return "u" + hashlib.blake2b((user_id or "").encode("utf-8"), digest_size=5).hexdigest()
+
+
+def to_index_text(text: Optional[str]) -> str:
+    """转换为写入FTS5的文本（词元以空格分隔）"""
+    return " ".join(tokenize(text))
+
+
+def to_user_index_text(user_id: Optional[str], text: Optional[str]) -> str:
+    """转换为写入FTS5的文本，每个词元带用户前缀"""
+    prefix = user_prefix(user_id)
+    return " ".join(prefix + token for token in tokenize(text))
+
+
+def build_match_query(terms: Iterable[str], user_id: Optional[str] = None) -> Optional[str]:
+    """把检索词转换为FTS5 MATCH表达式（每个词一个短语，OR连接）
+
+    传入 user_id 时词元带用户前缀，只匹配该用户的索引条目；
+    含单个汉字片段的词无法用二元组精确匹配，此时返回None，由调用方回退到LIKE
+    """
+    prefix = user_prefix(user_id) if user_id is not None else ""
+    phrases = []
+    for term in terms:
+        runs = _TOKEN_RE.findall(term or "")
+        if any(len(run) == 1 and _CJK_RE.match(run) for run in runs):
+            return None
+        tokens = tokenize(term)
+        if tokens:
+            phrases.append('"' + " ".join(prefix + token for token in tokens) + '"')
+    return " OR ".join(phrases) if phrases else None
@@ -0,0 +1,274 @@
+"""
+纯内存存储：基于字典的存储后端，无磁盘I/O
+适合压测、担心闪存磨损的边缘设备以及单元测试；进程退出后数据丢失
+"""
+import copy
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.models import (
+    Episode, UserProfile, Fact, WorkingMemory, Message, epoch_seconds
+)
+from storage.base import StorageBackend
+from config import MemoryConfig
+
+
+class MemoryStorage(StorageBackend):
+    """内存存储引擎
+
+    读写都返回/保存对象的副本，行为与SQLite一致（修改返回值不影响已存数据）
+    """
+
+    def __init__(self, config: MemoryConfig):
+        super().__init__(config)
+        self._profiles: Dict[str, UserProfile] = {}
+        self._episodes: Dict[str, Episode] = {}
+        self._user_episodes: Dict[str, Dict[str, None]] = {}
+        # 情景记忆的写入序号（对应SQLite的rowid，用于回填分块）
+        self._episode_rowids: Dict[str, int] = {}
+        self._facts: Dict[str, Dict[str, Fact]] = {}
+        self._fact_rowids: Dict[str, int] = {}
+        self._working: Dict[str, WorkingMemory] = {}
+        self._rowid = itertools.count(1)
+        self._lock = threading.RLock()
+
+    # ========== 用户画像操作 ==========
+
+    def save_user_profile(self, profile: UserProfile):
+        with self._lock:
+            self._profiles[profile.user_id] = copy.deepcopy(profile)
+        self._notify_write(profile.user_id)
+
+    def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
+        with self._lock:
+            return copy.deepcopy(self._profiles.get(user_id))
+
+    # ========== 情景记忆操作 ==========
+
+    def save_episode(self, episode: Episode):
+        with self._lock:
+            ids = self._user_episodes.setdefault(episode.user_id, {})
+            count = len(ids)
+            if count >= self.config.max_episodes_per_user:
+                # 删除最旧且重要性最低的记忆
+                victims = sorted(
+                    (self._episodes[i] for i in ids),
+                    key=lambda ep: (ep.importance, ep.last_accessed)
+                )[:count - self.config.max_episodes_per_user + 1]
+                for ep in victims:
+                    self._remove_episode(ep.id)
+
+            if episode.id in self._episodes:
+                self._remove_episode(episode.id)
+            self._episodes[episode.id] = copy.deepcopy(episode)
+            self._user_episodes.setdefault(episode.user_id, {})[episode.id] = None
+            self._episode_rowids[episode.id] = next(self._rowid)
+        self._notify_write(episode.user_id)
+
+    def _remove_episode(self, episode_id: str):
+        """删除一条情景记忆（调用方需持有锁）"""
+        ep = self._episodes.pop(episode_id, None)
+        if ep is not None:
+            self._user_episodes.get(ep.user_id, {}).pop(episode_id, None)
+            self._episode_rowids.pop(episode_id, None)
+
+    def _user_episode_list(self, user_id: str) -> List[Episode]:
+        return [self._episodes[i] for i in self._user_episodes.get(user_id, {})]
+
+    @staticmethod
+    def _by_importance(episodes: List[Episode]) -> List[Episode]:
+        return sorted(episodes, key=lambda ep: (ep.importance, ep.last_accessed), reverse=True)
+
+    def get_episodes(self, user_id: str, limit: int = 10, min_importance: float = 0.0) -> List[Episode]:
+        with self._lock:
+            episodes = [ep for ep in self._user_episode_list(user_id) if ep.importance >= min_importance]
+            return copy.deepcopy(self._by_importance(episodes)[:limit])
+
+    def search_episodes_by_keywords(self, user_id: str, keywords: List[str], limit: int = 5) -> List[Episode]:
+        """子串匹配摘要和关键词，按重要性排序（与SQLite的LIKE回退一致）"""
+        if not keywords:
+            return []
+        with self._lock:
+            matched = [
+                ep for ep in self._user_episode_list(user_id)
+                if any(kw in ep.summary or any(kw in k for k in ep.keywords) for kw in keywords)
+            ]
+            return copy.deepcopy(self._by_importance(matched)[:limit])
+
+    def get_episodes_by_ids(self, episode_ids: List[str], user_id: str = None) -> List[Episode]:
+        with self._lock:
+            return [copy.deepcopy(self._episodes[i]) for i in episode_ids if i in self._episodes]
+
+    def get_episode_embeddings(self, user_id: str) -> List[Tuple[str, List[float]]]:
+        with self._lock:
+            return [
+                (ep.id, list(ep.embedding))
+                for ep in self._user_episode_list(user_id) if ep.embedding
+            ]
+
+    def get_episodes_without_embedding(self, after_rowid: int = 0, limit: int = 256) -> List[Tuple[int, Episode]]:
+        with self._lock:
+            rows = sorted(
+                (rowid, episode_id) for episode_id, rowid in self._episode_rowids.items()
+                if rowid > after_rowid and not self._episodes[episode_id].embedding
+            )[:limit]
+            return [(rowid, copy.deepcopy(self._episodes[episode_id])) for rowid, episode_id in rows]
+
+    def update_episode_embeddings(self, items: List[Tuple[str, List[float]]], user_id: str = None):
+        with self._lock:
+            for episode_id, vector in items:
+                ep = self._episodes.get(episode_id)
+                if ep is not None:
+                    ep.embedding = list(vector)
+
+    def update_episodes_access(
+        self,
+        episode_ids: List[str],
+        increment: int = 1,
+        accessed_at: datetime = None,
+        user_id: str = None
+    ):
+        accessed_at = accessed_at or datetime.now()
+        with self._lock:
+            for episode_id in dict.fromkeys(episode_ids):
+                ep = self._episodes.get(episode_id)
+                if ep is not None:
+                    ep.access_count += increment
+                    ep.last_accessed = accessed_at
+
+    def delete_weak_episodes(self, user_id: str, min_strength: float = 0.2) -> int:
+        with self._lock:
+            weak_ids = [
+                ep.id for ep in self._user_episode_list(user_id)
+                if ep.calculate_strength(
+                    self.config.memory_decay_days,
+                    self.config.time_decay_weight,
+                    self.config.access_count_weight
+                ) < min_strength
+            ]
+            for episode_id in weak_ids:
+                self._remove_episode(episode_id)
+        if weak_ids:
+            self._notify_write(user_id)
+        return len(weak_ids)
+
+    # ========== 知识事实操作 ==========
+
+    def save_fact(self, fact: Fact):
+        with self._lock:
+            facts = self._facts.setdefault(fact.user_id, {})
+            existing = next(
+                (f for f in facts.values()
+                 if (f.subject, f.predicate, f.object) == (fact.subject, fact.predicate, fact.object)),
+                None
+            )
+            if existing is not None:
+                # 更新已存在的事实
+                existing.confidence = fact.confidence
+                existing.last_verified = datetime.now()
+            else:
+                count = len(facts)
+                if count >= self.config.max_facts_per_user:
+                    # 删除置信度最低的事实，同置信度先删最久未验证的（与SQLite的 ORDER BY 相同）
+                    victims = sorted(facts.values(), key=lambda f: (f.confidence, epoch_seconds(f.last_verified)))
+                    for f in victims[:count - self.config.max_facts_per_user + 1]:
+                        del facts[f.id]
+                        self._fact_rowids.pop(f.id, None)
+                facts[fact.id] = copy.deepcopy(fact)
+                self._fact_rowids[fact.id] = next(self._rowid)
+        self._notify_write(fact.user_id)
+
+    @staticmethod
+    def _by_confidence(facts: List[Fact]) -> List[Fact]:
+        return sorted(facts, key=lambda f: (f.confidence, f.last_verified), reverse=True)
+
+    def get_facts(self, user_id: str, limit: int = 20) -> List[Fact]:
+        with self._lock:
+            facts = list(self._facts.get(user_id, {}).values())
+            return copy.deepcopy(self._by_confidence(facts)[:limit])
+
+    def search_facts(self, user_id: str, query: str, limit: int = 10) -> List[Fact]:
+        """子串匹配主语/谓语/宾语，按置信度排序（与SQLite的LIKE回退一致）"""
+        with self._lock:
+            facts = [
+                f for f in self._facts.get(user_id, {}).values()
+                if query in f.subject or query in f.predicate or query in f.object
+            ]
+            return copy.deepcopy(self._by_confidence(facts)[:limit])
+
+    # ========== 工作记忆操作 ==========
+
+    def save_working_memory(self, memory: WorkingMemory):
+        with self._lock:
+            self._working[memory.session_id] = copy.deepcopy(memory)
+
+    def append_messages_batch(self, entries: List[Tuple[WorkingMemory, List[Message]]]):
+        keep = self.config.working_memory_size * 2  # 每轮2条消息
+        with self._lock:
+            for memory, messages in entries:
+                stored = self._working.get(memory.session_id)
+                if stored is None:
+                    stored = copy.deepcopy(memory)
+                    stored.messages = []
+                    self._working[memory.session_id] = stored
+                stored.updated_at = memory.updated_at
+                stored.messages.extend(copy.deepcopy(messages))
+                stored.messages = stored.messages[-keep:]
+
+    def get_working_memory(self, session_id: str) -> Optional[WorkingMemory]:
+        with self._lock:
+            return copy.deepcopy(self._working.get(session_id))
+
+    def delete_working_memory(self, session_id: str):
+        with self._lock:
+            self._working.pop(session_id, None)
+
+    def cleanup_old_sessions(self, days: int = 7, limit: int = None) -> int:
+        cutoff = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        with self._lock:
+            stale = [sid for sid, wm in self._working.items() if wm.updated_at < cutoff][:limit]
+            for sid in stale:
+                del self._working[sid]
+            return len(stale)
+
+    # ========== 分页遍历 ==========
+
+    def get_episodes_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Episode]]:
+        with self._lock:
+            rows = sorted(
+                (self._episode_rowids[i], i) for i in self._user_episodes.get(user_id, {})
+                if self._episode_rowids[i] > after_rowid
+            )[:limit]
+            return [(rowid, copy.deepcopy(self._episodes[i])) for rowid, i in rows]
+
+    def get_facts_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Fact]]:
+        with self._lock:
+            facts = self._facts.get(user_id, {})
+            rows = sorted(
+                (self._fact_rowids[i], i) for i in facts if self._fact_rowids[i] > after_rowid
+            )[:limit]
+            return [(rowid, copy.deepcopy(facts[i])) for rowid, i in rows]
+
+    def get_user_ids_page(self, after: str = "", limit: int = 500) -> List[str]:
+        with self._lock:
+            users = set(self._profiles)
+            users.update(u for u, ids in self._user_episodes.items() if ids)
+            users.update(u for u, facts in self._facts.items() if facts)
+        return sorted(u for u in users if u > after)[:limit]
+
+    # ========== 统计信息 ==========
+
+    def get_stats(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "user_id": user_id,
+                "episode_count": len(self._user_episodes.get(user_id, {})),
+                "fact_count": len(self._facts.get(user_id, {})),
+                "has_profile": user_id in self._profiles,
+            }
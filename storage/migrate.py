@@ -0,0 +1,48 @@
+"""
+表结构迁移命令行（先在数据库副本上演练并统计耗时，原库不变）：
+    python -m storage.migrate --data-dir ./data --dry-run
+
+单独成模块、不被 storage 包导入，python -m 执行时不会与已加载的模块冲突
+"""
+import argparse
+import os
+import sqlite3
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.migrations import MigrationRunner, dry_run, register_functions
+
+
+def main():
+    """命令行入口：查看版本、演练或执行迁移"""
+    parser = argparse.ArgumentParser(description="数据库表结构迁移")
+    parser.add_argument("--data-dir", default="./data", help="数据目录")
+    parser.add_argument("--db-name", default="memory.db", help="数据库文件名")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="分块迁移每块的行数")
+    parser.add_argument("--pause", type=float, default=0.0, help="块之间暂停的秒数")
+    parser.add_argument("--dry-run", action="store_true", help="在副本上执行并统计耗时，不修改原库")
+    args = parser.parse_args()
+
+    db_path = os.path.join(args.data_dir, args.db_name)
+    if not os.path.exists(db_path):
+        parser.error(f"数据库不存在: {db_path}")
+
+    if args.dry_run:
+        results = dry_run(db_path, chunk_size=args.chunk_size)
+    else:
+        conn = sqlite3.connect(db_path, timeout=30.0)
+        try:
+            register_functions(conn)
+            results = MigrationRunner(conn, chunk_size=args.chunk_size, pause=args.pause).run()
+        finally:
+            conn.close()
+
+    if not results:
+        print("没有待执行的迁移")
+    for r in results:
+        print(f"v{r['version']} {r['description']}：{r['rows']} 行，{r['chunks']} 块，{r['seconds']:.3f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+SQLite表结构版本迁移
+版本号保存在 PRAGMA user_version 中，启动时按顺序执行尚未应用的迁移。
+大表的数据迁移分块执行，每块单独提交，避免长时间持有写锁。
+
+命令行见 storage.migrate
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import fts
+
+
+@dataclass
+class Migration:
+    """一个版本迁移
+
+    - apply: 表结构变更，与版本号在同一事务内提交
+    - chunk: 分块数据迁移，每次处理至多 limit 行并返回处理的行数，返回0表示完成；
+      每块单独提交，中断后重启会重新执行 apply 并继续剩余的块，因此两者都必须可重复执行
+    """
+    version: int
+    description: str
+    apply: Optional[Callable[[sqlite3.Connection], None]] = None
+    chunk: Optional[Callable[[sqlite3.Connection, int], int]] = None
+
+
+# 整数秒时间列（用于排序、范围过滤和索引）-> 对应的ISO文本列（保留微秒，读取时使用）
+# 列按此顺序追加，保证新建库与迁移后的旧库列顺序一致
+TIMESTAMP_COLUMNS = {
+    "episodes": [("last_accessed_ts", "last_accessed"), ("created_at_ts", "created_at")],
+    "facts": [("created_at_ts", "created_at"), ("last_verified_ts", "last_verified")],
+    "working_memory": [("updated_at_ts", "updated_at")],
+}
+
+# 热点查询使用的复合索引
+INDEXES = [
+    # 按用户取情景记忆/淘汰：WHERE user_id = ? ORDER BY importance, last_accessed
+    'CREATE INDEX IF NOT EXISTS idx_episodes_user_rank ON episodes(user_id, importance DESC, last_accessed_ts DESC)',
+    # 按用户取事实/淘汰：WHERE user_id = ? ORDER BY confidence, last_verified
+    'CREATE INDEX IF NOT EXISTS idx_facts_user_rank ON facts(user_id, confidence DESC, last_verified_ts DESC)',
+    # 过期会话清理：WHERE updated_at_ts < ? ORDER BY updated_at_ts, session_id
+    'CREATE INDEX IF NOT EXISTS idx_working_updated ON working_memory(updated_at_ts, session_id)',
+]
+
+
+def _create_base_tables(conn: sqlite3.Connection):
+    """v1：初始表结构（引入版本号之前的库已包含这些表，IF NOT EXISTS 保证可重复执行）"""
+    # 用户画像表
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id TEXT PRIMARY KEY,
+            name TEXT,
+            age INTEGER,
+            gender TEXT,
+            tags TEXT,
+            preferences TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+    # 情景记忆表
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS episodes (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            summary TEXT,
+            keywords TEXT,
+            emotion TEXT,
+            importance REAL,
+            access_count INTEGER,
+            created_at TEXT,
+            last_accessed TEXT,
+            source_session_id TEXT,
+            metadata TEXT,
+            embedding BLOB
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_episodes_user ON episodes(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_episodes_importance ON episodes(importance)')
+
+    # 知识事实表
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facts (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            subject TEXT,
+            predicate TEXT,
+            object TEXT,
+            confidence REAL,
+            source TEXT,
+            created_at TEXT,
+            last_verified TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facts_user ON facts(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facts_subject ON facts(subject)')
+
+    # 工作记忆表（用于持久化当前会话）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS working_memory (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            messages TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_working_user ON working_memory(user_id)')
+
+
+def _create_working_messages(conn: sqlite3.Connection):
+    """v2：工作记忆消息表（追加写入，按seq裁剪滑动窗口）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS working_messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT,
+            content TEXT,
+            ts TEXT,
+            metadata TEXT,
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _split_working_memory_blobs(conn: sqlite3.Connection, limit: int) -> int:
+    """v2：把 working_memory.messages 中的JSON数组拆分到 working_messages"""
+    rows = conn.execute(
+        "SELECT session_id, messages FROM working_memory "
+        "WHERE messages IS NOT NULL AND messages != '' LIMIT ?",
+        (limit,)
+    ).fetchall()
+    for session_id, blob in rows:
+        messages = json.loads(blob)
+        conn.execute('DELETE FROM working_messages WHERE session_id = ?', (session_id,))
+        conn.executemany('''
+            INSERT INTO working_messages (session_id, seq, role, content, ts, metadata)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                session_id,
+                seq,
+                m['role'],
+                m['content'],
+                m['timestamp'],
+                json.dumps(m.get('metadata', {}), ensure_ascii=False)
+            )
+            for seq, m in enumerate(messages, start=1)
+        ])
+        conn.execute('UPDATE working_memory SET messages = NULL WHERE session_id = ?', (session_id,))
+    return len(rows)
+
+
+def _add_timestamp_columns(conn: sqlite3.Connection):
+    """v3：添加整数秒时间列（*_ts）"""
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for ts_column, _ in columns:
+            if ts_column not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {ts_column} INTEGER')
+
+
+def _backfill_timestamp_columns(conn: sqlite3.Connection, limit: int) -> int:
+    """v3：从ISO文本列回填整数秒时间列（每次只处理一列中尚未回填的至多 limit 行）"""
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for ts_column, text_column in columns:
+            seconds = f"CAST(strftime('%s', {text_column}) AS INTEGER)"
+            cursor = conn.execute(f'''
+                UPDATE {table} SET {ts_column} = {seconds}
+                WHERE rowid IN (
+                    SELECT rowid FROM {table}
+                    WHERE {ts_column} IS NULL AND strftime('%s', {text_column}) IS NOT NULL
+                    LIMIT ?
+                )
+            ''', (limit,))
+            if cursor.rowcount:
+                return cursor.rowcount
+    return 0
+
+
+def _create_rank_indexes(conn: sqlite3.Connection):
+    """v4：热点查询复合索引（idx_episodes_importance 已被 idx_episodes_user_rank 取代）"""
+    conn.execute('DROP INDEX IF EXISTS idx_episodes_importance')
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+def _create_maintenance_state(conn: sqlite3.Connection):
+    """v5：后台维护任务进度（重启后从游标处继续）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY,
+            state TEXT,
+            updated_at TEXT
+        )
+    ''')
+
+
+FTS_TRIGGERS = [
+    f"{table}_fts_{event}"
+    for table in ("episodes", "facts")
+    for event in ("insert", "delete", "update")
+]
+
+
+def _drop_unscoped_fts(conn: sqlite3.Connection):
+    """v6：删除不带用户前缀的全文索引，启动时由 SQLiteStorage 按新格式重建并回填"""
+    for trigger in FTS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    existing = {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('episodes_fts', 'facts_fts')"
+        )
+    }
+    for table in existing:
+        conn.execute(f'DROP TABLE {table}')
+
+
+# 按版本号顺序排列，只能追加，不能修改已发布的迁移
+MIGRATIONS = [
+    Migration(1, "初始表结构", apply=_create_base_tables),
+    Migration(2, "工作记忆消息拆分为 working_messages",
+              apply=_create_working_messages, chunk=_split_working_memory_blobs),
+    Migration(3, "整数秒时间列", apply=_add_timestamp_columns, chunk=_backfill_timestamp_columns),
+    Migration(4, "热点查询复合索引", apply=_create_rank_indexes),
+    Migration(5, "后台维护进度表", apply=_create_maintenance_state),
+    Migration(6, "全文索引按用户分区", apply=_drop_unscoped_fts),
+]
+
+
+class MigrationRunner:
+    """按 PRAGMA user_version 执行尚未应用的迁移
+
+    - 每个迁移的 apply 在一个事务内执行；chunk 每块一个事务，块之间可暂停 pause 秒让出写锁
+    - 全部块完成后才更新版本号，中断后重启从该迁移继续
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        migrations: Optional[List[Migration]] = None,
+        chunk_size: int = 1000,
+        pause: float = 0.0
+    ):
+        self.conn = conn
+        self.migrations = sorted(migrations or MIGRATIONS, key=lambda m: m.version)
+        self.chunk_size = max(1, chunk_size)
+        self.pause = pause
+
+    @property
+    def latest_version(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+    def current_version(self) -> int:
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def pending(self) -> List[Migration]:
+        """尚未应用的迁移"""
+        current = self.current_version()
+        if current > self.latest_version:
+            raise RuntimeError(
+                f"数据库版本 {current} 高于程序支持的版本 {self.latest_version}，请升级程序"
+            )
+        return [m for m in self.migrations if m.version > current]
+
+    @contextmanager
+    def _transaction(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    def run(self) -> List[Dict[str, Any]]:
+        """执行全部待执行的迁移，返回每个迁移的版本、说明、处理行数、块数和耗时（秒）"""
+        results = []
+        for migration in self.pending():
+            start = time.perf_counter()
+            rows = chunks = 0
+
+            if migration.apply is not None:
+                with self._transaction():
+                    migration.apply(self.conn)
+
+            if migration.chunk is not None:
+                while True:
+                    with self._transaction():
+                        done = migration.chunk(self.conn, self.chunk_size)
+                    if not done:
+                        break
+                    rows += done
+                    chunks += 1
+                    if self.pause > 0:
+                        time.sleep(self.pause)
+
+            with self._transaction():
+                self.conn.execute(f'PRAGMA user_version = {migration.version}')
+
+            results.append({
+                "version": migration.version,
+                "description": migration.description,
+                "rows": rows,
+                "chunks": chunks,
+                "seconds": round(time.perf_counter() - start, 4),
+            })
+        return results
+
+
+def register_functions(conn: sqlite3.Connection):
+    """注册触发器依赖的自定义SQL函数（与 SQLiteStorage 使用的连接一致）"""
+    conn.create_function("fts_tokenize", 1, fts.to_index_text, deterministic=True)
+    conn.create_function("fts_tokenize", 2, fts.to_user_index_text, deterministic=True)
+
+
+def dry_run(db_path: str, chunk_size: int = 1000) -> List[Dict[str, Any]]:
+    """在数据库的临时副本上执行待执行的迁移并统计耗时，原库不变"""
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(db_path))) as tmp:
+        copy_path = os.path.join(tmp, os.path.basename(db_path))
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(copy_path)
+        try:
+            # 在线备份：WAL中尚未检查点的数据也会被复制
+            source.backup(target)
+        finally:
+            source.close()
+        try:
+            register_functions(target)
+            return MigrationRunner(target, chunk_size=chunk_size).run()
+        finally:
+            target.close()
@@ -0,0 +1,108 @@
+"""
+SQLite连接池：复用长连接，避免每次操作都重新建立连接
+每个连接在创建时只设置一次PRAGMA
+"""
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class ConnectionPool:
+    """有界SQLite连接池
+
+    - 连接按需创建，最多 size 个，用完放回空闲队列
+    - 同一线程内嵌套获取连接时复用已持有的连接，避免池耗尽导致死锁
+    - 归还连接时回滚未提交的事务，保证下一个使用者拿到干净的连接
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        size: int = 5,
+        pragmas: Optional[Dict[str, object]] = None,
+        timeout: float = 30.0,
+        on_connect: Optional[Callable[[sqlite3.Connection], None]] = None
+    ):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._pragmas = pragmas or {}
+        self._on_connect = on_connect
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建新连接并应用PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if self._on_connect:
+            self._on_connect(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """从池中取出一个连接（池满时阻塞等待）"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"等待数据库连接超时（连接池大小: {self.size}）")
+
+    def release(self, conn: sqlite3.Connection):
+        """归还连接"""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """获取连接（上下文管理器，支持同线程嵌套）"""
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self.release(conn)
+
+    def close(self):
+        """关闭所有空闲连接，使用中的连接在归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
@@ -0,0 +1,32 @@
+"""
+分片数变化后迁移用户的命令行：
+    python -m storage.reshard --data-dir ./data --from-shards 4 --to-shards 8
+
+单独成模块、不被 storage 包导入，python -m 执行时不会与已加载的模块冲突
+"""
+import argparse
+import os
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.sharded_storage import rebalance
+from config import MemoryConfig
+
+
+def main():
+    """命令行入口：分片数变化后迁移用户"""
+    parser = argparse.ArgumentParser(description="分片存储重新平衡")
+    parser.add_argument("--data-dir", default="./data", help="数据目录")
+    parser.add_argument("--db-name", default="memory.db", help="数据库文件名")
+    parser.add_argument("--from-shards", type=int, required=True, help="原分片数")
+    parser.add_argument("--to-shards", type=int, required=True, help="新分片数")
+    args = parser.parse_args()
+
+    config = MemoryConfig(data_dir=args.data_dir, db_name=args.db_name, db_shards=args.to_shards)
+    stats = rebalance(config, args.from_shards)
+    print(f"分片 {stats['from_shards']} -> {stats['to_shards']}，迁移用户 {stats['moved_users']} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+数据库行解码：每张表一个解码器，按查询结果的列顺序生成
+直接填充模型的槽（不经过 __init__），延迟解析的JSON字段只保存原始文本，首次访问时才解析
+"""
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core import codec
+from memory_core.models import Episode, Fact, Message, MessageRole, UserProfile
+
+# 特殊转换：列原样写入延迟字段的 _<name>_raw 槽（NULL 记为 ""，访问时得到默认值）
+LAZY = "lazy"
+
+
+def _json_list(value: Optional[str]) -> list:
+    return codec.loads(value) if value else []
+
+
+def _text(value: Optional[str]) -> str:
+    return value or ""
+
+
+# 表 -> (模型类, {列名: (字段名, 转换)})；转换为None表示原样赋值，查询结果中不在表里的列（rowid、*_ts、embedding）被忽略
+TABLES: Dict[str, Tuple[type, Dict[str, Tuple[str, Any]]]] = {
+    "user_profiles": (UserProfile, {
+        "user_id": ("user_id", None),
+        "name": ("name", _text),
+        "age": ("age", None),
+        "gender": ("gender", _text),
+        "tags": ("tags", _json_list),
+        "preferences": ("preferences", LAZY),
+        "created_at": ("created_at", datetime.fromisoformat),
+        "updated_at": ("updated_at", datetime.fromisoformat),
+    }),
+    "episodes": (Episode, {
+        "id": ("id", None),
+        "user_id": ("user_id", None),
+        "summary": ("summary", None),
+        "keywords": ("keywords", _json_list),
+        "emotion": ("emotion", _text),
+        "importance": ("importance", None),
+        "access_count": ("access_count", None),
+        "created_at": ("created_at", datetime.fromisoformat),
+        "last_accessed": ("last_accessed", datetime.fromisoformat),
+        "source_session_id": ("source_session_id", _text),
+        "metadata": ("metadata", LAZY),
+    }),
+    "facts": (Fact, {
+        "id": ("id", None),
+        "user_id": ("user_id", None),
+        "subject": ("subject", None),
+        "predicate": ("predicate", None),
+        "object": ("object", None),
+        "confidence": ("confidence", None),
+        "source": ("source", _text),
+        "created_at": ("created_at", datetime.fromisoformat),
+        "last_verified": ("last_verified", datetime.fromisoformat),
+    }),
+    "working_messages": (Message, {
+        "role": ("role", MessageRole),
+        "content": ("content", None),
+        "ts": ("timestamp", datetime.fromisoformat),
+        "metadata": ("metadata", LAZY),
+    }),
+}
+
+# 查询结果中没有对应列的字段的取值（如 episodes.embedding 只在向量索引中使用，不随行读出）
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "episodes": {"embedding": None},
+}
+
+_decoders: Dict[Tuple[str, Tuple[str, ...]], Callable] = {}
+_lock = threading.Lock()
+
+
+def decoder(table: str, description: Sequence[tuple]) -> Callable[[Sequence], Any]:
+    """获取（首次调用时生成）按 cursor.description 列顺序解码一行的函数"""
+    columns = tuple(d[0] for d in description)
+    key = (table, columns)
+    decode = _decoders.get(key)
+    if decode is None:
+        with _lock:
+            decode = _decoders.get(key) or _build(table, columns)
+            _decoders[key] = decode
+    return decode
+
+
+def _build(table: str, columns: Tuple[str, ...]) -> Callable[[Sequence], Any]:
+    """生成解码函数源码：每列一条直接赋值语句，省去按列名查找和逐字段的循环"""
+    model, mapping = TABLES[table]
+    env: Dict[str, Any] = {"_new": object.__new__, "_model": model}
+    lines = ["def decode(row):", "    obj = _new(_model)"]
+    assigned = set()
+    for i, column in enumerate(columns):
+        if column not in mapping:
+            continue
+        name, convert = mapping[column]
+        if convert is LAZY:
+            lines.append(f"    obj._{name}_raw = row[{i}] or ''")
+        elif convert is None:
+            lines.append(f"    obj.{name} = row[{i}]")
+        else:
+            env[f"_c{i}"] = convert
+            lines.append(f"    obj.{name} = _c{i}(row[{i}])")
+        assigned.add(name)
+
+    missing = set(name for name, _ in mapping.values()) - assigned
+    if missing:
+        raise ValueError(f"查询结果缺少 {table} 的列: {sorted(missing)}")
+    for name, value in DEFAULTS.get(table, {}).items():
+        env[f"_d_{name}"] = value
+        lines.append(f"    obj.{name} = _d_{name}")
+    lines.append("    return obj")
+
+    exec("\n".join(lines), env)
+    return env["decode"]
+
+
+def decode_all(table: str, cursor) -> list:
+    """解码游标中剩余的全部行"""
+    decode = decoder(table, cursor.description)
+    return [decode(row) for row in cursor.fetchall()]
@@ -0,0 +1,344 @@
+"""
+分片SQLite存储：按 user_id 的稳定哈希把用户分配到 N 个数据库文件
+每个用户只访问自己的分片，不同分片的写入互不阻塞
+分片数变化后用 storage.reshard 命令行迁移用户
+"""
+import dataclasses
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_core.models import (
+    Episode, UserProfile, Fact, WorkingMemory, Message, MemoryContext
+)
+from storage.base import StorageBackend
+from storage.sqlite_storage import SQLiteStorage
+from config import MemoryConfig
+
+# 按用户迁移的表（working_messages 按会话跟随 working_memory）
+USER_TABLES = ("user_profiles", "episodes", "facts", "working_memory")
+
+
+def shard_index(user_id: str, shards: int) -> int:
+    """用户所在的分片（crc32取模，跨进程、跨版本稳定）"""
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+
+def shard_db_name(db_name: str, index: int) -> str:
+    """分片文件名：memory.db -> memory_shard0.db"""
+    stem, ext = os.path.splitext(db_name)
+    return f"{stem}_shard{index}{ext or '.db'}"
+
+
+def shard_config(config: MemoryConfig, index: int) -> MemoryConfig:
+    """第index个分片的配置"""
+    return dataclasses.replace(config, db_name=shard_db_name(config.db_name, index))
+
+
+class ShardedSQLiteStorage(StorageBackend):
+    """分片SQLite存储引擎
+
+    - 按用户的操作路由到该用户的分片
+    - 按情景记忆ID的操作（批量取、访问计数、向量写回）发给所有分片，各分片忽略不存在的ID
+    - 会话 -> 分片的映射缓存在内存中，未命中时依次查询各分片
+    - 清理过期会话和分片统计并行执行
+    """
+
+    def __init__(self, config: MemoryConfig):
+        super().__init__(config)
+        self.shards: List[SQLiteStorage] = [
+            SQLiteStorage(shard_config(config, i)) for i in range(max(1, config.db_shards))
+        ]
+        for shard in self.shards:
+            shard.add_write_listener(self._notify_write)
+        self._sessions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+    # ========== 路由 ==========
+
+    def _shard_for_user(self, user_id: str) -> SQLiteStorage:
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def _remember_session(self, session_id: str, user_id: str):
+        with self._lock:
+            self._sessions[session_id] = shard_index(user_id, len(self.shards))
+
+    def _shard_for_session(self, session_id: str) -> Optional[SQLiteStorage]:
+        """会话所在的分片（不存在时返回None）"""
+        with self._lock:
+            index = self._sessions.get(session_id)
+        if index is not None:
+            return self.shards[index]
+        for shard in self.shards:
+            memory = shard.get_working_memory(session_id)
+            if memory is not None:
+                self._remember_session(session_id, memory.user_id)
+                return shard
+        return None
+
+    def _fan_out(self, fn: Callable[[SQLiteStorage], Any]) -> List[Any]:
+        """在所有分片上并行执行，按分片顺序返回结果"""
+        return list(self._executor.map(fn, self.shards))
+
+    # ========== 用户画像 ==========
+
+    def save_user_profile(self, profile: UserProfile):
+        self._shard_for_user(profile.user_id).save_user_profile(profile)
+
+    def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
+        return self._shard_for_user(user_id).get_user_profile(user_id)
+
+    # ========== 情景记忆 ==========
+
+    def save_episode(self, episode: Episode):
+        self._shard_for_user(episode.user_id).save_episode(episode)
+
+    def get_episodes(self, user_id: str, limit: int = 10, min_importance: float = 0.0) -> List[Episode]:
+        return self._shard_for_user(user_id).get_episodes(user_id, limit, min_importance)
+
+    def search_episodes_by_keywords(self, user_id: str, keywords: List[str], limit: int = 5) -> List[Episode]:
+        return self._shard_for_user(user_id).search_episodes_by_keywords(user_id, keywords, limit)
+
+    def get_episodes_by_ids(self, episode_ids: List[str], user_id: str = None) -> List[Episode]:
+        if not episode_ids:
+            return []
+        if user_id is not None:
+            return self._shard_for_user(user_id).get_episodes_by_ids(episode_ids)
+        # 不知道所属用户时只能查询全部分片
+        found = {
+            ep.id: ep
+            for episodes in self._fan_out(lambda shard: shard.get_episodes_by_ids(episode_ids))
+            for ep in episodes
+        }
+        return [found[i] for i in episode_ids if i in found]
+
+    def get_episode_embeddings(self, user_id: str) -> List[Tuple[str, List[float]]]:
+        return self._shard_for_user(user_id).get_episode_embeddings(user_id)
+
+    def get_episodes_without_embedding(self, after_rowid: int = 0, limit: int = 256) -> List[Tuple[int, Episode]]:
+        """全局游标 = 分片内rowid * 分片数 + 分片序号，按游标顺序合并各分片的结果"""
+        n = len(self.shards)
+        rows = []
+        for i, shard in enumerate(self.shards):
+            shard_after = max(0, (after_rowid - i) // n)
+            for rowid, episode in shard.get_episodes_without_embedding(shard_after, limit):
+                cursor = rowid * n + i
+                if cursor > after_rowid:
+                    rows.append((cursor, episode))
+        rows.sort(key=lambda row: row[0])
+        return rows[:limit]
+
+    def update_episode_embeddings(self, items: List[Tuple[str, List[float]]], user_id: str = None):
+        if not items:
+            return
+        if user_id is not None:
+            self._shard_for_user(user_id).update_episode_embeddings(items)
+        else:
+            # 不知道所属用户时每个分片都要开一个写事务，调用方应尽量传入 user_id
+            self._fan_out(lambda shard: shard.update_episode_embeddings(items))
+
+    def update_episodes_access(
+        self,
+        episode_ids: List[str],
+        increment: int = 1,
+        accessed_at: datetime = None,
+        user_id: str = None
+    ):
+        if not episode_ids:
+            return
+        accessed_at = accessed_at or datetime.now()
+        if user_id is not None:
+            self._shard_for_user(user_id).update_episodes_access(episode_ids, increment, accessed_at)
+        else:
+            self._fan_out(lambda shard: shard.update_episodes_access(episode_ids, increment, accessed_at))
+
+    def delete_weak_episodes(self, user_id: str, min_strength: float = 0.2) -> int:
+        return self._shard_for_user(user_id).delete_weak_episodes(user_id, min_strength)
+
+    # ========== 知识事实 ==========
+
+    def save_fact(self, fact: Fact):
+        self._shard_for_user(fact.user_id).save_fact(fact)
+
+    def get_facts(self, user_id: str, limit: int = 20) -> List[Fact]:
+        return self._shard_for_user(user_id).get_facts(user_id, limit)
+
+    def search_facts(self, user_id: str, query: str, limit: int = 10) -> List[Fact]:
+        return self._shard_for_user(user_id).search_facts(user_id, query, limit)
+
+    # ========== 工作记忆 ==========
+
+    def save_working_memory(self, memory: WorkingMemory):
+        self._remember_session(memory.session_id, memory.user_id)
+        self._shard_for_user(memory.user_id).save_working_memory(memory)
+
+    def append_messages_batch(self, entries: List[Tuple[WorkingMemory, List[Message]]]):
+        by_shard: Dict[int, List[Tuple[WorkingMemory, List[Message]]]] = {}
+        for memory, messages in entries:
+            self._remember_session(memory.session_id, memory.user_id)
+            by_shard.setdefault(shard_index(memory.user_id, len(self.shards)), []).append((memory, messages))
+        for index, shard_entries in by_shard.items():
+            self.shards[index].append_messages_batch(shard_entries)
+
+    def get_working_memory(self, session_id: str) -> Optional[WorkingMemory]:
+        shard = self._shard_for_session(session_id)
+        return shard.get_working_memory(session_id) if shard is not None else None
+
+    def delete_working_memory(self, session_id: str):
+        shard = self._shard_for_session(session_id)
+        if shard is not None:
+            shard.delete_working_memory(session_id)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def cleanup_old_sessions(self, days: int = 7, limit: int = None) -> int:
+        """各分片并行清理（limit 作用于每个分片）"""
+        deleted = sum(self._fan_out(lambda shard: shard.cleanup_old_sessions(days, limit)))
+        with self._lock:
+            self._sessions.clear()
+        return deleted
+
+    # ========== 后台维护进度 ==========
+
+    def get_maintenance_state(self, name: str) -> Optional[Dict[str, Any]]:
+        """维护进度统一保存在第一个分片"""
+        return self.shards[0].get_maintenance_state(name)
+
+    def save_maintenance_state(self, name: str, state: Dict[str, Any]):
+        self.shards[0].save_maintenance_state(name, state)
+
+    # ========== 批量导入 ==========
+
+    def bulk_import(self, profiles: List[UserProfile], episodes: List[Episode], facts: List[Fact]):
+        """按分片拆分后并行导入，每个分片一个事务"""
+        n = len(self.shards)
+        parts: List[Tuple[list, list, list]] = [([], [], []) for _ in range(n)]
+        for kind, records in enumerate((profiles, episodes, facts)):
+            for record in records:
+                parts[shard_index(record.user_id, n)][kind].append(record)
+
+        def load(index: int):
+            if any(parts[index]):
+                self.shards[index].bulk_import(*parts[index])
+
+        list(self._executor.map(load, range(n)))
+
+    # ========== 分页遍历 ==========
+
+    def get_episodes_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Episode]]:
+        return self._shard_for_user(user_id).get_episodes_page(user_id, after_rowid, limit)
+
+    def get_facts_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Fact]]:
+        return self._shard_for_user(user_id).get_facts_page(user_id, after_rowid, limit)
+
+    def get_user_ids_page(self, after: str = "", limit: int = 500) -> List[str]:
+        """合并各分片的下一页"""
+        pages = self._fan_out(lambda shard: shard.get_user_ids_page(after, limit))
+        return sorted(set().union(*pages))[:limit]
+
+    # ========== 上下文组装与统计 ==========
+
+    def get_context_bundle(self, session_id: str, query: str = None, **kwargs) -> MemoryContext:
+        """路由到会话所在分片，在该分片的一个读事务内组装"""
+        working_memory = kwargs.get("working_memory")
+        if working_memory is not None:
+            shard = self._shard_for_user(working_memory.user_id)
+        else:
+            shard = self._shard_for_session(session_id)
+        if shard is None:
+            return MemoryContext()
+        return shard.get_context_bundle(session_id, query, **kwargs)
+
+    def get_stats(self, user_id: str) -> Dict[str, Any]:
+        return self._shard_for_user(user_id).get_stats(user_id)
+
+    def get_shard_stats(self) -> List[Dict[str, int]]:
+        """各分片的数据量（并行统计）"""
+        def count(shard: SQLiteStorage) -> Dict[str, int]:
+            with shard._get_connection() as conn:
+                return {
+                    table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for table in USER_TABLES
+                }
+        return self._fan_out(count)
+
+
+def rebalance(config: MemoryConfig, from_shards: int) -> Dict[str, int]:
+    """分片数从 from_shards 变为 config.db_shards 后，把用户迁移到新的分片
+
+    逐个用户在源分片连接上 ATTACH 目标分片，在一个事务中复制后删除；
+    中断后重新运行会继续迁移剩余用户
+    """
+    to_shards = max(1, config.db_shards)
+    # 确保所有分片文件和表结构存在
+    for i in range(max(from_shards, to_shards)):
+        SQLiteStorage(dataclasses.replace(shard_config(config, i), db_group_commit=False)).close()
+
+    moved = 0
+    for source in range(from_shards):
+        path = shard_config(config, source).get_db_path()
+        conn = sqlite3.connect(path, timeout=config.db_timeout)
+        SQLiteStorage._register_functions(conn)
+        # INSERT OR REPLACE 覆盖旧行时也触发删除触发器，保持全文索引一致
+        conn.execute('PRAGMA recursive_triggers=ON')
+        try:
+            users = [row[0] for row in conn.execute(
+                ' UNION '.join(f'SELECT user_id FROM {table}' for table in USER_TABLES)
+            )]
+            for user_id in users:
+                target = shard_index(user_id, to_shards)
+                if target == source:
+                    continue
+                _move_user(conn, shard_config(config, target).get_db_path(), user_id)
+                moved += 1
+        finally:
+            conn.close()
+
+    return {"from_shards": from_shards, "to_shards": to_shards, "moved_users": moved}
+
+
+def _move_user(conn: sqlite3.Connection, target_path: str, user_id: str):
+    """把一个用户的全部数据从当前连接的库移到目标库"""
+    conn.execute('ATTACH DATABASE ? AS dst', (target_path,))
+    try:
+        with conn:
+            columns = _columns(conn, "working_messages")
+            conn.execute(f'''
+                INSERT OR REPLACE INTO dst.working_messages ({columns})
+                SELECT {columns} FROM main.working_messages WHERE session_id IN (
+                    SELECT session_id FROM main.working_memory WHERE user_id = ?
+                )
+            ''', (user_id,))
+            conn.execute('''
+                DELETE FROM main.working_messages WHERE session_id IN (
+                    SELECT session_id FROM main.working_memory WHERE user_id = ?
+                )
+            ''', (user_id,))
+            for table in USER_TABLES:
+                columns = _columns(conn, table)
+                conn.execute(
+                    f'INSERT OR REPLACE INTO dst.{table} ({columns}) '
+                    f'SELECT {columns} FROM main.{table} WHERE user_id = ?',
+                    (user_id,)
+                )
+                conn.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+    finally:
+        conn.execute('DETACH DATABASE dst')
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> str:
+    """按列名复制（源库和目标库的列顺序可能因迁移先后而不同）"""
+    return ", ".join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
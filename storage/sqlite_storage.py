@@ -2,209 +2,303 @@
 存储层：基于SQLite的持久化存储
 轻量级，适合嵌入式设备
 """
+import dataclasses
 import sqlite3
-import json
 import os
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from contextlib import contextmanager
+from typing import Callable, List, Optional, Dict, Any, Tuple
 
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from memory_core.models import (
     Episode, UserProfile, Fact, WorkingMemory, 
-    Message, MessageRole
+    Message, MemoryContext, epoch_seconds
 )
+from memory_core.embedding import pack_embedding, unpack_embedding
+from memory_core import codec
+from storage.base import StorageBackend
+from storage.pool import ConnectionPool
+from storage.writer import GroupCommitWriter, deferred_futures
+from storage.migrations import MigrationRunner, register_functions
+from storage import fts, rows
 from config import MemoryConfig
 
+PROFILE_UPSERT = '''
+    INSERT OR REPLACE INTO user_profiles 
+    (user_id, name, age, gender, tags, preferences, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
 
-class SQLiteStorage:
+EPISODE_UPSERT = '''
+    INSERT OR REPLACE INTO episodes 
+    (id, user_id, summary, keywords, emotion, importance, access_count,
+     created_at, last_accessed, source_session_id, metadata, embedding,
+     last_accessed_ts, created_at_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# 记忆强度 = 重要性 × (时间权重 × 时间衰减 + 访问权重 × 访问因子)，与 Episode.calculate_strength 相同
+# 参数依次为：当前时间(秒)、衰减天数、时间权重、访问权重
+STRENGTH_SQL = '''
+    importance * (
+        ? * MAX(0.0, 1.0 - ((? - last_accessed_ts) / 86400) / CAST(? AS REAL))
+        + ? * MIN(1.0, access_count / 10.0)
+    )
+'''
+
+FACT_UPSERT = '''
+    INSERT OR REPLACE INTO facts 
+    (id, user_id, subject, predicate, object, confidence, source, created_at, last_verified,
+     created_at_ts, last_verified_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class SQLiteStorage(StorageBackend):
     """SQLite存储引擎"""
     
     def __init__(self, config: MemoryConfig):
-        self.config = config
+        super().__init__(config)
         self.db_path = config.get_db_path()
         
         # 确保数据目录存在
         os.makedirs(config.data_dir, exist_ok=True)
         
+        # 连接池（PRAGMA在每个连接创建时设置一次）
+        self._pool = ConnectionPool(
+            self.db_path,
+            size=config.db_pool_size,
+            timeout=config.db_timeout,
+            pragmas={
+                "journal_mode": config.db_journal_mode,
+                "synchronous": config.db_synchronous,
+                "cache_size": -config.db_cache_size_kb,
+                "temp_store": "MEMORY",
+                # 让 INSERT OR REPLACE 的隐式删除也触发全文索引同步触发器
+                "recursive_triggers": "ON",
+            },
+            on_connect=self._register_functions
+        )
+        self._fts_enabled = False
+        # 组提交写线程（关闭时每次写操作在调用线程中单独提交）
+        self._writer: Optional[GroupCommitWriter] = None
+        
         # 初始化数据库
         self._init_database()
+        
+        if config.db_group_commit:
+            self._writer = GroupCommitWriter(self._pool, max_batch=config.db_group_commit_max_ops)
     
     def _init_database(self):
-        """初始化数据库表结构"""
+        """执行尚未应用的表结构迁移（见 storage.migrations）"""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
+            MigrationRunner(conn, chunk_size=self.config.db_migration_chunk_size).run()
             
-            # 用户画像表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    user_id TEXT PRIMARY KEY,
-                    name TEXT,
-                    age INTEGER,
-                    gender TEXT,
-                    tags TEXT,
-                    preferences TEXT,
-                    created_at TEXT,
-                    updated_at TEXT
-                )
-            ''')
-            
-            # 情景记忆表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS episodes (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    summary TEXT,
-                    keywords TEXT,
-                    emotion TEXT,
-                    importance REAL,
-                    access_count INTEGER,
-                    created_at TEXT,
-                    last_accessed TEXT,
-                    source_session_id TEXT,
-                    metadata TEXT,
-                    embedding BLOB
-                )
-            ''')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_episodes_user ON episodes(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_episodes_importance ON episodes(importance)')
+            # 全文索引（FTS5不可用时回退到LIKE检索，不计入版本号，每次启动重新检测）
+            self._fts_enabled = self._init_fts(conn.cursor())
             
-            # 知识事实表
+            conn.commit()
+    
+    @staticmethod
+    def _register_functions(conn: sqlite3.Connection):
+        """为每个连接注册自定义SQL函数"""
+        register_functions(conn)
+    
+    def _init_fts(self, cursor) -> bool:
+        """创建FTS5全文索引及同步触发器，首次创建时回填已有数据
+
+        词元带用户前缀（见 storage.fts），MATCH 只读取该用户的倒排条目
+        """
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('episodes_fts', 'facts_fts')"
+        )
+        existing = {row['name'] for row in cursor.fetchall()}
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS episodes_fts USING fts5(summary, keywords)'
+            )
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(subject, predicate, object)'
+            )
+        except sqlite3.OperationalError:
+            return False
+        
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS episodes_fts_insert AFTER INSERT ON episodes BEGIN
+                INSERT INTO episodes_fts (rowid, summary, keywords)
+                VALUES (new.rowid, fts_tokenize(new.user_id, new.summary), fts_tokenize(new.user_id, new.keywords));
+            END;
+            CREATE TRIGGER IF NOT EXISTS episodes_fts_delete AFTER DELETE ON episodes BEGIN
+                DELETE FROM episodes_fts WHERE rowid = old.rowid;
+            END;
+            CREATE TRIGGER IF NOT EXISTS episodes_fts_update AFTER UPDATE OF user_id, summary, keywords ON episodes BEGIN
+                DELETE FROM episodes_fts WHERE rowid = old.rowid;
+                INSERT INTO episodes_fts (rowid, summary, keywords)
+                VALUES (new.rowid, fts_tokenize(new.user_id, new.summary), fts_tokenize(new.user_id, new.keywords));
+            END;
+            
+            CREATE TRIGGER IF NOT EXISTS facts_fts_insert AFTER INSERT ON facts BEGIN
+                INSERT INTO facts_fts (rowid, subject, predicate, object)
+                VALUES (new.rowid, fts_tokenize(new.user_id, new.subject), fts_tokenize(new.user_id, new.predicate), fts_tokenize(new.user_id, new.object));
+            END;
+            CREATE TRIGGER IF NOT EXISTS facts_fts_delete AFTER DELETE ON facts BEGIN
+                DELETE FROM facts_fts WHERE rowid = old.rowid;
+            END;
+            CREATE TRIGGER IF NOT EXISTS facts_fts_update AFTER UPDATE OF user_id, subject, predicate, object ON facts BEGIN
+                DELETE FROM facts_fts WHERE rowid = old.rowid;
+                INSERT INTO facts_fts (rowid, subject, predicate, object)
+                VALUES (new.rowid, fts_tokenize(new.user_id, new.subject), fts_tokenize(new.user_id, new.predicate), fts_tokenize(new.user_id, new.object));
+            END;
+        ''')
+        
+        if 'episodes_fts' not in existing:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS facts (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    subject TEXT,
-                    predicate TEXT,
-                    object TEXT,
-                    confidence REAL,
-                    source TEXT,
-                    created_at TEXT,
-                    last_verified TEXT
-                )
+                INSERT INTO episodes_fts (rowid, summary, keywords)
+                SELECT rowid, fts_tokenize(user_id, summary), fts_tokenize(user_id, keywords) FROM episodes
             ''')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_facts_user ON facts(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_facts_subject ON facts(subject)')
-            
-            # 工作记忆表（用于持久化当前会话）
+        if 'facts_fts' not in existing:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS working_memory (
-                    session_id TEXT PRIMARY KEY,
-                    user_id TEXT,
-                    messages TEXT,
-                    created_at TEXT,
-                    updated_at TEXT
-                )
+                INSERT INTO facts_fts (rowid, subject, predicate, object)
+                SELECT rowid, fts_tokenize(user_id, subject), fts_tokenize(user_id, predicate), fts_tokenize(user_id, object) FROM facts
             ''')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_working_user ON working_memory(user_id)')
-            
-            conn.commit()
+        return True
     
-    @contextmanager
     def _get_connection(self):
-        """获取数据库连接（上下文管理器）"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """获取数据库连接（上下文管理器，从连接池中复用）"""
+        return self._pool.connection()
+    
+    def close(self):
+        """关闭写线程（先提交队列中剩余的写操作）和连接池"""
+        if self._writer is not None:
+            self._writer.close()
+        self._pool.close()
+    
+    def _write(self, fn: Callable, *args):
+        """执行写操作 fn(conn, *args)，返回其结果
+        
+        组提交模式下交给写线程，与其他写操作合并为一个事务，提交后返回；
+        在写线程内嵌套调用时直接在当前事务中执行；
+        在 deferred_writes 上下文中只入队，返回None
+        """
+        if self._writer is not None and not self._writer.in_writer_thread():
+            future = self.submit_write(fn, *args)
+            futures = deferred_futures()
+            if futures is not None:
+                futures.append(future)
+                return None
+            return future.result()
+        with self._get_connection() as conn:
+            result = fn(conn, *args)
+            if self._writer is None:
+                conn.commit()
+            return result
+    
+    def submit_write(self, fn: Callable, *args) -> Future:
+        """提交写操作 fn(conn, *args)，立即返回Future（提交完成后得到结果）"""
+        if self._writer is not None:
+            return self._writer.submit(fn, *args)
+        future: Future = Future()
         try:
-            yield conn
-        finally:
-            conn.close()
+            future.set_result(self._write(fn, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def _notify_write(self, user_id: str):
+        """写操作尚未提交时（deferred_writes），提交完成后再通知，避免并发读在提交前把旧数据放回缓存"""
+        futures = deferred_futures()
+        if futures:
+            futures[-1].add_done_callback(lambda _: super(SQLiteStorage, self)._notify_write(user_id))
+        else:
+            super()._notify_write(user_id)
+    
+    def write_stats(self) -> Dict[str, float]:
+        """组提交统计"""
+        return self._writer.stats() if self._writer is not None else {}
     
     # ========== 用户画像操作 ==========
     
     def save_user_profile(self, profile: UserProfile):
         """保存用户画像"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_profiles 
-                (user_id, name, age, gender, tags, preferences, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                profile.user_id,
-                profile.name,
-                profile.age,
-                profile.gender,
-                json.dumps(profile.tags, ensure_ascii=False),
-                json.dumps(profile.preferences, ensure_ascii=False),
-                profile.created_at.isoformat(),
-                profile.updated_at.isoformat()
-            ))
-            conn.commit()
+        self._write(self._save_user_profile, profile)
+        self._notify_write(profile.user_id)
+    
+    def _save_user_profile(self, conn, profile: UserProfile):
+        conn.execute(PROFILE_UPSERT, self._profile_row(profile))
+    
+    @staticmethod
+    def _profile_row(profile: UserProfile) -> tuple:
+        return (
+            profile.user_id,
+            profile.name,
+            profile.age,
+            profile.gender,
+            codec.dumps(profile.tags),
+            codec.dumps(profile.preferences),
+            profile.created_at.isoformat(),
+            profile.updated_at.isoformat()
+        )
     
     def get_user_profile(self, user_id: str) -> Optional[UserProfile]:
         """获取用户画像"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM user_profiles WHERE user_id = ?', (user_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return UserProfile(
-                    user_id=row['user_id'],
-                    name=row['name'] or "",
-                    age=row['age'],
-                    gender=row['gender'] or "",
-                    tags=json.loads(row['tags']) if row['tags'] else [],
-                    preferences=json.loads(row['preferences']) if row['preferences'] else {},
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    updated_at=datetime.fromisoformat(row['updated_at'])
-                )
-            return None
+            profiles = rows.decode_all("user_profiles", cursor)
+            return profiles[0] if profiles else None
     
     # ========== 情景记忆操作 ==========
     
     def save_episode(self, episode: Episode):
         """保存情景记忆"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 检查用户情景数量限制
-            cursor.execute(
-                'SELECT COUNT(*) FROM episodes WHERE user_id = ?', 
-                (episode.user_id,)
-            )
-            count = cursor.fetchone()[0]
-            
-            if count >= self.config.max_episodes_per_user:
-                # 删除最旧且重要性最低的记忆
-                cursor.execute('''
-                    DELETE FROM episodes WHERE id IN (
-                        SELECT id FROM episodes 
-                        WHERE user_id = ? 
-                        ORDER BY importance ASC, last_accessed ASC 
-                        LIMIT ?
-                    )
-                ''', (episode.user_id, count - self.config.max_episodes_per_user + 1))
-            
-            # 插入新记忆
-            embedding_blob = None
-            if episode.embedding:
-                import struct
-                embedding_blob = struct.pack(f'{len(episode.embedding)}f', *episode.embedding)
-            
+        self._write(self._save_episode, episode)
+        self._notify_write(episode.user_id)
+    
+    def _save_episode(self, conn, episode: Episode):
+        cursor = conn.cursor()
+        
+        # 检查用户情景数量限制
+        cursor.execute(
+            'SELECT COUNT(*) FROM episodes WHERE user_id = ?', 
+            (episode.user_id,)
+        )
+        count = cursor.fetchone()[0]
+        
+        if count >= self.config.max_episodes_per_user:
+            # 删除最旧且重要性最低的记忆
             cursor.execute('''
-                INSERT OR REPLACE INTO episodes 
-                (id, user_id, summary, keywords, emotion, importance, access_count,
-                 created_at, last_accessed, source_session_id, metadata, embedding)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                episode.id,
-                episode.user_id,
-                episode.summary,
-                json.dumps(episode.keywords, ensure_ascii=False),
-                episode.emotion,
-                episode.importance,
-                episode.access_count,
-                episode.created_at.isoformat(),
-                episode.last_accessed.isoformat(),
-                episode.source_session_id,
-                json.dumps(episode.metadata, ensure_ascii=False),
-                embedding_blob
-            ))
-            conn.commit()
+                DELETE FROM episodes WHERE id IN (
+                    SELECT id FROM episodes 
+                    WHERE user_id = ? 
+                    ORDER BY importance ASC, last_accessed_ts ASC
+                    LIMIT ?
+                )
+            ''', (episode.user_id, count - self.config.max_episodes_per_user + 1))
+        
+        # 插入新记忆
+        cursor.execute(EPISODE_UPSERT, self._episode_row(episode))
+    
+    @staticmethod
+    def _episode_row(episode: Episode) -> tuple:
+        return (
+            episode.id,
+            episode.user_id,
+            episode.summary,
+            codec.dumps(episode.keywords),
+            episode.emotion,
+            episode.importance,
+            episode.access_count,
+            episode.created_at.isoformat(),
+            episode.last_accessed.isoformat(),
+            episode.source_session_id,
+            codec.dumps(episode.metadata),
+            pack_embedding(episode.embedding),
+            epoch_seconds(episode.last_accessed),
+            epoch_seconds(episode.created_at)
+        )
     
     def get_episodes(
         self, 
@@ -218,28 +312,11 @@ class SQLiteStorage:
             cursor.execute('''
                 SELECT * FROM episodes 
                 WHERE user_id = ? AND importance >= ?
-                ORDER BY importance DESC, last_accessed DESC
+                ORDER BY importance DESC, last_accessed_ts DESC
                 LIMIT ?
             ''', (user_id, min_importance, limit))
             
-            episodes = []
-            for row in cursor.fetchall():
-                ep = Episode(
-                    id=row['id'],
-                    user_id=row['user_id'],
-                    summary=row['summary'],
-                    keywords=json.loads(row['keywords']) if row['keywords'] else [],
-                    emotion=row['emotion'] or "",
-                    importance=row['importance'],
-                    access_count=row['access_count'],
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    last_accessed=datetime.fromisoformat(row['last_accessed']),
-                    source_session_id=row['source_session_id'] or "",
-                    metadata=json.loads(row['metadata']) if row['metadata'] else {}
-                )
-                episodes.append(ep)
-            
-            return episodes
+            return rows.decode_all("episodes", cursor)
     
     def search_episodes_by_keywords(
         self, 
@@ -247,7 +324,87 @@ class SQLiteStorage:
         keywords: List[str],
         limit: int = 5
     ) -> List[Episode]:
-        """通过关键词搜索情景记忆"""
+        """通过关键词搜索情景记忆（FTS5全文索引，按bm25结合重要性排序）"""
+        if not keywords:
+            return []
+        
+        match = fts.build_match_query(keywords, user_id) if self._fts_enabled else None
+        if match is None:
+            return self._search_episodes_like(user_id, keywords, limit)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            # bm25越小越相关（负数），乘以(0.5 + importance)使重要记忆排在前面
+            cursor.execute('''
+                SELECT e.* FROM episodes_fts
+                JOIN episodes e ON e.rowid = episodes_fts.rowid
+                WHERE episodes_fts MATCH ? AND e.user_id = ?
+                ORDER BY bm25(episodes_fts) * (0.5 + e.importance), e.last_accessed_ts DESC
+                LIMIT ?
+            ''', (match, user_id, limit))
+            
+            return rows.decode_all("episodes", cursor)
+    
+    def get_episodes_by_ids(self, episode_ids: List[str], user_id: str = None) -> List[Episode]:
+        """按ID批量获取情景记忆（保持传入顺序，不存在的ID被忽略）"""
+        if not episode_ids:
+            return []
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ','.join(['?' for _ in episode_ids])
+            cursor.execute(
+                f'SELECT * FROM episodes WHERE id IN ({placeholders})',
+                episode_ids
+            )
+            found = {episode.id: episode for episode in rows.decode_all("episodes", cursor)}
+            return [found[i] for i in episode_ids if i in found]
+    
+    def get_episode_embeddings(self, user_id: str) -> List[Tuple[str, List[float]]]:
+        """获取用户所有已计算的情景记忆向量"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT id, embedding FROM episodes WHERE user_id = ? AND embedding IS NOT NULL',
+                (user_id,)
+            )
+            return [(row['id'], unpack_embedding(row['embedding'])) for row in cursor.fetchall()]
+    
+    def get_episodes_without_embedding(
+        self, 
+        after_rowid: int = 0, 
+        limit: int = 256
+    ) -> List[Tuple[int, Episode]]:
+        """按rowid顺序分块获取尚未计算向量的情景记忆（用于回填）"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT rowid, * FROM episodes
+                WHERE embedding IS NULL AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            ''', (after_rowid, limit))
+            return self._decode_page("episodes", cursor)
+    
+    def update_episode_embeddings(self, items: List[Tuple[str, List[float]]], user_id: str = None):
+        """批量写入情景记忆向量（单个事务）"""
+        if not items:
+            return
+        self._write(self._update_episode_embeddings, items)
+    
+    def _update_episode_embeddings(self, conn, items: List[Tuple[str, List[float]]]):
+        cursor = conn.cursor()
+        cursor.executemany(
+            'UPDATE episodes SET embedding = ? WHERE id = ?',
+            [(pack_embedding(vector), episode_id) for episode_id, vector in items]
+        )
+    
+    def _search_episodes_like(
+        self, 
+        user_id: str, 
+        keywords: List[str],
+        limit: int
+    ) -> List[Episode]:
+        """LIKE子串匹配检索（全文索引不可用时的回退方案）"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
@@ -258,131 +415,129 @@ class SQLiteStorage:
                 conditions.append("(summary LIKE ? OR keywords LIKE ?)")
                 params.extend([f'%{kw}%', f'%{kw}%'])
             
-            if not conditions:
-                return []
-            
             query = f'''
                 SELECT * FROM episodes 
                 WHERE user_id = ? AND ({" OR ".join(conditions)})
-                ORDER BY importance DESC, last_accessed DESC
+                ORDER BY importance DESC, last_accessed_ts DESC
                 LIMIT ?
             '''
             params.append(limit)
             
             cursor.execute(query, params)
             
-            episodes = []
-            for row in cursor.fetchall():
-                ep = Episode(
-                    id=row['id'],
-                    user_id=row['user_id'],
-                    summary=row['summary'],
-                    keywords=json.loads(row['keywords']) if row['keywords'] else [],
-                    emotion=row['emotion'] or "",
-                    importance=row['importance'],
-                    access_count=row['access_count'],
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    last_accessed=datetime.fromisoformat(row['last_accessed']),
-                    source_session_id=row['source_session_id'] or "",
-                    metadata=json.loads(row['metadata']) if row['metadata'] else {}
-                )
-                episodes.append(ep)
-            
-            return episodes
+            return rows.decode_all("episodes", cursor)
     
-    def update_episode_access(self, episode_id: str):
-        """更新情景记忆的访问记录"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+    def update_episodes_access(
+        self,
+        episode_ids: List[str],
+        increment: int = 1,
+        accessed_at: datetime = None,
+        user_id: str = None
+    ):
+        """批量更新访问记录：一个事务内 UPDATE ... WHERE id IN (...)"""
+        episode_ids = list(dict.fromkeys(episode_ids))
+        if not episode_ids:
+            return
+        accessed_at = accessed_at or datetime.now()
+        
+        self._write(self._update_episodes_access, episode_ids, increment, accessed_at)
+    
+    def _update_episodes_access(self, conn, episode_ids: List[str], increment: int, accessed_at: datetime):
+        cursor = conn.cursor()
+        # 分块避免超过SQLite的参数个数上限
+        for i in range(0, len(episode_ids), 500):
+            chunk = episode_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f'''
                 UPDATE episodes 
-                SET access_count = access_count + 1, 
-                    last_accessed = ?
-                WHERE id = ?
-            ''', (datetime.now().isoformat(), episode_id))
-            conn.commit()
+                SET access_count = access_count + ?, 
+                    last_accessed = ?,
+                    last_accessed_ts = ?
+                WHERE id IN ({placeholders})
+            ''', [increment, accessed_at.isoformat(), epoch_seconds(accessed_at)] + chunk)
     
     def delete_weak_episodes(self, user_id: str, min_strength: float = 0.2) -> int:
-        """删除弱记忆（遗忘机制）"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 获取所有记忆并计算强度
-            episodes = self.get_episodes(user_id, limit=1000, min_importance=0)
-            weak_ids = []
-            
-            for ep in episodes:
-                strength = ep.calculate_strength(self.config.memory_decay_days)
-                if strength < min_strength:
-                    weak_ids.append(ep.id)
-            
-            if weak_ids:
-                placeholders = ','.join(['?' for _ in weak_ids])
-                cursor.execute(
-                    f'DELETE FROM episodes WHERE id IN ({placeholders})', 
-                    weak_ids
-                )
-                conn.commit()
-            
-            return len(weak_ids)
+        """删除弱记忆（遗忘机制）：在SQL中计算记忆强度，一条DELETE完成"""
+        deleted = self._write(self._delete_weak_episodes, user_id, min_strength, datetime.now())
+        if deleted:
+            self._notify_write(user_id)
+        return deleted
+    
+    def _delete_weak_episodes(self, conn, user_id: str, min_strength: float, now: datetime) -> int:
+        cursor = conn.execute(f'''
+            DELETE FROM episodes
+            WHERE user_id = ? AND {STRENGTH_SQL} < ?
+        ''', (
+            user_id,
+            self.config.time_decay_weight,
+            epoch_seconds(now),
+            self.config.memory_decay_days,
+            self.config.access_count_weight,
+            min_strength
+        ))
+        return cursor.rowcount
     
     # ========== 知识事实操作 ==========
     
     def save_fact(self, fact: Fact):
         """保存知识事实"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 检查是否存在相同的事实（去重）
+        self._write(self._save_fact, fact)
+        self._notify_write(fact.user_id)
+    
+    def _save_fact(self, conn, fact: Fact):
+        cursor = conn.cursor()
+        
+        # 检查是否存在相同的事实（去重）
+        cursor.execute('''
+            SELECT id FROM facts 
+            WHERE user_id = ? AND subject = ? AND predicate = ? AND object = ?
+        ''', (fact.user_id, fact.subject, fact.predicate, fact.object))
+        
+        existing = cursor.fetchone()
+        if existing:
+            # 更新已存在的事实
+            now = datetime.now()
             cursor.execute('''
-                SELECT id FROM facts 
-                WHERE user_id = ? AND subject = ? AND predicate = ? AND object = ?
-            ''', (fact.user_id, fact.subject, fact.predicate, fact.object))
+                UPDATE facts 
+                SET confidence = ?, last_verified = ?, last_verified_ts = ?
+                WHERE id = ?
+            ''', (fact.confidence, now.isoformat(), epoch_seconds(now), existing['id']))
+        else:
+            # 检查数量限制
+            cursor.execute(
+                'SELECT COUNT(*) FROM facts WHERE user_id = ?', 
+                (fact.user_id,)
+            )
+            count = cursor.fetchone()[0]
             
-            existing = cursor.fetchone()
-            if existing:
-                # 更新已存在的事实
+            if count >= self.config.max_facts_per_user:
+                # 删除置信度最低的事实
                 cursor.execute('''
-                    UPDATE facts 
-                    SET confidence = ?, last_verified = ?
-                    WHERE id = ?
-                ''', (fact.confidence, datetime.now().isoformat(), existing['id']))
-            else:
-                # 检查数量限制
-                cursor.execute(
-                    'SELECT COUNT(*) FROM facts WHERE user_id = ?', 
-                    (fact.user_id,)
-                )
-                count = cursor.fetchone()[0]
-                
-                if count >= self.config.max_facts_per_user:
-                    # 删除置信度最低的事实
-                    cursor.execute('''
-                        DELETE FROM facts WHERE id IN (
-                            SELECT id FROM facts 
-                            WHERE user_id = ? 
-                            ORDER BY confidence ASC 
-                            LIMIT ?
-                        )
-                    ''', (fact.user_id, count - self.config.max_facts_per_user + 1))
-                
-                cursor.execute('''
-                    INSERT INTO facts 
-                    (id, user_id, subject, predicate, object, confidence, source, created_at, last_verified)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    fact.id,
-                    fact.user_id,
-                    fact.subject,
-                    fact.predicate,
-                    fact.object,
-                    fact.confidence,
-                    fact.source,
-                    fact.created_at.isoformat(),
-                    fact.last_verified.isoformat()
-                ))
+                    DELETE FROM facts WHERE id IN (
+                        SELECT id FROM facts 
+                        WHERE user_id = ? 
+                        ORDER BY confidence ASC, last_verified_ts ASC
+                        LIMIT ?
+                    )
+                ''', (fact.user_id, count - self.config.max_facts_per_user + 1))
             
-            conn.commit()
+            cursor.execute(FACT_UPSERT, self._fact_row(fact))
+    
+    @staticmethod
+    def _fact_row(fact: Fact) -> tuple:
+        return (
+            fact.id,
+            fact.user_id,
+            fact.subject,
+            fact.predicate,
+            fact.object,
+            fact.confidence,
+            fact.source,
+            fact.created_at.isoformat(),
+            fact.last_verified.isoformat(),
+            epoch_seconds(fact.created_at),
+            epoch_seconds(fact.last_verified)
+        )
     
     def get_facts(self, user_id: str, limit: int = 20) -> List[Fact]:
         """获取用户的知识事实"""
@@ -391,26 +546,11 @@ class SQLiteStorage:
             cursor.execute('''
                 SELECT * FROM facts 
                 WHERE user_id = ?
-                ORDER BY confidence DESC, last_verified DESC
+                ORDER BY confidence DESC, last_verified_ts DESC
                 LIMIT ?
             ''', (user_id, limit))
             
-            facts = []
-            for row in cursor.fetchall():
-                fact = Fact(
-                    id=row['id'],
-                    user_id=row['user_id'],
-                    subject=row['subject'],
-                    predicate=row['predicate'],
-                    object=row['object'],
-                    confidence=row['confidence'],
-                    source=row['source'] or "",
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    last_verified=datetime.fromisoformat(row['last_verified'])
-                )
-                facts.append(fact)
-            
-            return facts
+            return rows.decode_all("facts", cursor)
     
     def search_facts(
         self, 
@@ -418,7 +558,25 @@ class SQLiteStorage:
         query: str,
         limit: int = 10
     ) -> List[Fact]:
-        """搜索相关知识事实"""
+        """搜索相关知识事实（FTS5全文索引，按bm25结合置信度排序）"""
+        match = fts.build_match_query([query], user_id) if self._fts_enabled else None
+        if match is None:
+            return self._search_facts_like(user_id, query, limit)
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT f.* FROM facts_fts
+                JOIN facts f ON f.rowid = facts_fts.rowid
+                WHERE facts_fts MATCH ? AND f.user_id = ?
+                ORDER BY bm25(facts_fts) * (0.5 + f.confidence), f.last_verified_ts DESC
+                LIMIT ?
+            ''', (match, user_id, limit))
+            
+            return rows.decode_all("facts", cursor)
+    
+    def _search_facts_like(self, user_id: str, query: str, limit: int) -> List[Fact]:
+        """LIKE子串匹配检索（全文索引不可用时的回退方案）"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
@@ -426,45 +584,87 @@ class SQLiteStorage:
                 WHERE user_id = ? AND (
                     subject LIKE ? OR predicate LIKE ? OR object LIKE ?
                 )
-                ORDER BY confidence DESC
+                ORDER BY confidence DESC, last_verified_ts DESC
                 LIMIT ?
             ''', (user_id, f'%{query}%', f'%{query}%', f'%{query}%', limit))
             
-            facts = []
-            for row in cursor.fetchall():
-                fact = Fact(
-                    id=row['id'],
-                    user_id=row['user_id'],
-                    subject=row['subject'],
-                    predicate=row['predicate'],
-                    object=row['object'],
-                    confidence=row['confidence'],
-                    source=row['source'] or "",
-                    created_at=datetime.fromisoformat(row['created_at']),
-                    last_verified=datetime.fromisoformat(row['last_verified'])
-                )
-                facts.append(fact)
-            
-            return facts
+            return rows.decode_all("facts", cursor)
     
     # ========== 工作记忆操作 ==========
     
     def save_working_memory(self, memory: WorkingMemory):
-        """保存工作记忆"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO working_memory 
-                (session_id, user_id, messages, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                memory.session_id,
-                memory.user_id,
-                json.dumps([m.to_dict() for m in memory.messages], ensure_ascii=False),
-                memory.created_at.isoformat(),
-                memory.updated_at.isoformat()
-            ))
-            conn.commit()
+        """保存工作记忆（整体覆盖会话的全部消息）"""
+        self._write(self._save_working_memory, memory)
+    
+    def _save_working_memory(self, conn, memory: WorkingMemory):
+        cursor = conn.cursor()
+        self._upsert_working_header(cursor, memory)
+        cursor.execute(
+            'DELETE FROM working_messages WHERE session_id = ?',
+            (memory.session_id,)
+        )
+        self._insert_working_messages(cursor, memory.session_id, memory.messages, 1)
+    
+    def append_messages_batch(self, entries: List[Tuple[WorkingMemory, List[Message]]]):
+        """批量追加消息（单个事务），并按seq裁剪到滑动窗口大小"""
+        if not entries:
+            return
+        keep = self.config.working_memory_size * 2  # 每轮2条消息
+        self._write(self._append_messages_batch, entries, keep)
+    
+    def _append_messages_batch(self, conn, entries: List[Tuple[WorkingMemory, List[Message]]], keep: int):
+        cursor = conn.cursor()
+        for memory, messages in entries:
+            self._upsert_working_header(cursor, memory)
+            cursor.execute(
+                'SELECT COALESCE(MAX(seq), 0) FROM working_messages WHERE session_id = ?',
+                (memory.session_id,)
+            )
+            last_seq = cursor.fetchone()[0]
+            self._insert_working_messages(cursor, memory.session_id, messages, last_seq + 1)
+            cursor.execute(
+                'DELETE FROM working_messages WHERE session_id = ? AND seq <= ?',
+                (memory.session_id, last_seq + len(messages) - keep)
+            )
+    
+    def _upsert_working_header(self, cursor, memory: WorkingMemory):
+        """写入会话头信息"""
+        cursor.execute('''
+            INSERT INTO working_memory (session_id, user_id, created_at, updated_at, updated_at_ts)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                updated_at = excluded.updated_at,
+                updated_at_ts = excluded.updated_at_ts
+        ''', (
+            memory.session_id,
+            memory.user_id,
+            memory.created_at.isoformat(),
+            memory.updated_at.isoformat(),
+            epoch_seconds(memory.updated_at)
+        ))
+    
+    def _insert_working_messages(
+        self, 
+        cursor, 
+        session_id: str, 
+        messages: List[Message], 
+        first_seq: int
+    ):
+        """从first_seq开始顺序插入消息"""
+        cursor.executemany('''
+            INSERT INTO working_messages (session_id, seq, role, content, ts, metadata)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                session_id,
+                seq,
+                m.role.value,
+                m.content,
+                m.timestamp.isoformat(),
+                codec.dumps(m.metadata)
+            )
+            for seq, m in enumerate(messages, start=first_seq)
+        ])
     
     def get_working_memory(self, session_id: str) -> Optional[WorkingMemory]:
         """获取工作记忆"""
@@ -477,8 +677,12 @@ class SQLiteStorage:
             row = cursor.fetchone()
             
             if row:
-                messages_data = json.loads(row['messages']) if row['messages'] else []
-                messages = [Message.from_dict(m) for m in messages_data]
+                cursor.execute('''
+                    SELECT role, content, ts, metadata FROM working_messages
+                    WHERE session_id = ?
+                    ORDER BY seq
+                ''', (session_id,))
+                messages = rows.decode_all("working_messages", cursor)
                 
                 return WorkingMemory(
                     user_id=row['user_id'],
@@ -491,31 +695,191 @@ class SQLiteStorage:
     
     def delete_working_memory(self, session_id: str):
         """删除工作记忆"""
+        self._write(self._delete_working_memory, session_id)
+    
+    def _delete_working_memory(self, conn, session_id: str):
+        cursor = conn.cursor()
+        cursor.execute(
+            'DELETE FROM working_messages WHERE session_id = ?', 
+            (session_id,)
+        )
+        cursor.execute(
+            'DELETE FROM working_memory WHERE session_id = ?', 
+            (session_id,)
+        )
+    
+    # ========== 上下文组装 ==========
+    
+    def get_context_bundle(self, session_id: str, query: str = None, **kwargs) -> MemoryContext:
+        """在同一个连接、同一个读事务内取出组装上下文所需的全部数据
+        
+        参数同 StorageBackend.get_context_bundle；
+        语句复用连接上的预编译语句缓存，访问计数由调用方另行更新
+        """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'DELETE FROM working_memory WHERE session_id = ?', 
-                (session_id,)
-            )
-            conn.commit()
+            # 显式开启读事务：WAL模式下所有查询看到同一个快照
+            owns_transaction = not conn.in_transaction
+            if owns_transaction:
+                conn.execute('BEGIN')
+            try:
+                return super().get_context_bundle(session_id, query, **kwargs)
+            finally:
+                if owns_transaction:
+                    conn.commit()
+    
+    def cleanup_old_sessions(self, days: int = 7, limit: int = None) -> int:
+        """清理旧的工作记忆（limit 限制单次最多删除的会话数）"""
+        return self._write(self._cleanup_old_sessions, days, limit)
+    
+    def _cleanup_old_sessions(self, conn, days: int, limit: int = None):
+        cursor = conn.cursor()
+        cutoff = datetime.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        from datetime import timedelta
+        cutoff = cutoff - timedelta(days=days)
+        
+        # 两条DELETE按相同顺序选出同一批会话（LIMIT -1 表示不限）
+        stale = '''
+            SELECT session_id FROM working_memory WHERE updated_at_ts < ?
+            ORDER BY updated_at_ts, session_id LIMIT ?
+        '''
+        params = (epoch_seconds(cutoff), -1 if limit is None else limit)
+        cursor.execute(f'DELETE FROM working_messages WHERE session_id IN ({stale})', params)
+        cursor.execute(f'DELETE FROM working_memory WHERE session_id IN ({stale})', params)
+        deleted = cursor.rowcount
+        return deleted
     
-    def cleanup_old_sessions(self, days: int = 7) -> int:
-        """清理旧的工作记忆"""
+    # ========== 后台维护进度 ==========
+    
+    def get_maintenance_state(self, name: str) -> Optional[Dict[str, Any]]:
+        """读取后台维护任务的进度"""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cutoff = datetime.now().replace(
-                hour=0, minute=0, second=0, microsecond=0
-            )
-            from datetime import timedelta
-            cutoff = cutoff - timedelta(days=days)
-            
+            row = conn.execute(
+                'SELECT state FROM maintenance_state WHERE name = ?', (name,)
+            ).fetchone()
+            return codec.loads(row['state']) if row else None
+    
+    def save_maintenance_state(self, name: str, state: Dict[str, Any]):
+        """保存后台维护任务的进度"""
+        self._write(self._save_maintenance_state, name, state)
+    
+    def _save_maintenance_state(self, conn, name: str, state: Dict[str, Any]):
+        conn.execute(
+            'INSERT OR REPLACE INTO maintenance_state (name, state, updated_at) VALUES (?, ?, ?)',
+            (name, codec.dumps(state), datetime.now().isoformat())
+        )
+    
+    # ========== 批量导入 ==========
+    
+    def bulk_import(self, profiles: List[UserProfile], episodes: List[Episode], facts: List[Fact]):
+        """批量导入（一个事务内executemany写入，每个用户只做一次去重和淘汰）"""
+        self._write(self._bulk_import, profiles, episodes, facts)
+        for user_id in dict.fromkeys(r.user_id for r in [*profiles, *episodes, *facts]):
+            self._notify_write(user_id)
+    
+    def _bulk_import(self, conn, profiles: List[UserProfile], episodes: List[Episode], facts: List[Fact]):
+        cursor = conn.cursor()
+        if profiles:
+            cursor.executemany(PROFILE_UPSERT, [self._profile_row(p) for p in profiles])
+        
+        if episodes:
+            cursor.executemany(EPISODE_UPSERT, [self._episode_row(ep) for ep in episodes])
+            for user_id in dict.fromkeys(ep.user_id for ep in episodes):
+                # 超出上限时只保留重要性最高、最近访问的记忆
+                cursor.execute('''
+                    DELETE FROM episodes WHERE id IN (
+                        SELECT id FROM episodes WHERE user_id = ?
+                        ORDER BY importance DESC, last_accessed_ts DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (user_id, self.config.max_episodes_per_user))
+        
+        facts_by_user: Dict[str, List[Fact]] = {}
+        for fact in facts:
+            facts_by_user.setdefault(fact.user_id, []).append(fact)
+        now = datetime.now()
+        for user_id, user_facts in facts_by_user.items():
+            # 一次查出该用户已有的三元组，已存在的只更新置信度
             cursor.execute(
-                'DELETE FROM working_memory WHERE updated_at < ?',
-                (cutoff.isoformat(),)
+                'SELECT id, subject, predicate, object FROM facts WHERE user_id = ?', (user_id,)
             )
-            deleted = cursor.rowcount
-            conn.commit()
-            return deleted
+            existing = {(row['subject'], row['predicate'], row['object']): row['id'] for row in cursor}
+            updates: Dict[str, float] = {}
+            inserts: Dict[Tuple[str, str, str], Fact] = {}
+            for fact in user_facts:
+                key = (fact.subject, fact.predicate, fact.object)
+                if key in existing:
+                    updates[existing[key]] = fact.confidence
+                elif key in inserts:
+                    # 导入数据内部重复：保留第一条，置信度取最后一条
+                    inserts[key] = dataclasses.replace(
+                        inserts[key], confidence=fact.confidence, last_verified=now
+                    )
+                else:
+                    inserts[key] = fact
+            cursor.executemany(
+                'UPDATE facts SET confidence = ?, last_verified = ?, last_verified_ts = ? WHERE id = ?',
+                [
+                    (confidence, now.isoformat(), epoch_seconds(now), fact_id)
+                    for fact_id, confidence in updates.items()
+                ]
+            )
+            cursor.executemany(FACT_UPSERT, [self._fact_row(f) for f in inserts.values()])
+            # 超出上限时只保留置信度最高的事实
+            cursor.execute('''
+                DELETE FROM facts WHERE id IN (
+                    SELECT id FROM facts WHERE user_id = ?
+                    ORDER BY confidence DESC, last_verified_ts DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (user_id, self.config.max_facts_per_user))
+    
+    # ========== 分页遍历 ==========
+    
+    @staticmethod
+    def _decode_page(table: str, cursor) -> List[Tuple[int, Any]]:
+        """解码 SELECT rowid, * 的结果为 (rowid, 对象) 列表"""
+        decode = rows.decoder(table, cursor.description)
+        return [(row[0], decode(row)) for row in cursor.fetchall()]
+    
+    def get_episodes_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Episode]]:
+        """按rowid分页获取用户的情景记忆（走user_id索引的范围扫描）"""
+        with self._get_connection() as conn:
+            cursor = conn.execute('''
+                SELECT rowid, * FROM episodes
+                WHERE user_id = ? AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            ''', (user_id, after_rowid, limit))
+            return self._decode_page("episodes", cursor)
+    
+    def get_facts_page(self, user_id: str, after_rowid: int = 0, limit: int = 500) -> List[Tuple[int, Fact]]:
+        """按rowid分页获取用户的知识事实"""
+        with self._get_connection() as conn:
+            cursor = conn.execute('''
+                SELECT rowid, * FROM facts
+                WHERE user_id = ? AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?
+            ''', (user_id, after_rowid, limit))
+            return self._decode_page("facts", cursor)
+    
+    def get_user_ids_page(self, after: str = "", limit: int = 500) -> List[str]:
+        """按user_id分页获取用户（三张表各自走索引取下一页后合并）"""
+        with self._get_connection() as conn:
+            cursor = conn.execute('''
+                SELECT user_id FROM (
+                    SELECT * FROM (SELECT user_id FROM user_profiles WHERE user_id > ? ORDER BY user_id LIMIT ?)
+                    UNION
+                    SELECT * FROM (SELECT DISTINCT user_id FROM episodes WHERE user_id > ? ORDER BY user_id LIMIT ?)
+                    UNION
+                    SELECT * FROM (SELECT DISTINCT user_id FROM facts WHERE user_id > ? ORDER BY user_id LIMIT ?)
+                )
+                ORDER BY user_id
+                LIMIT ?
+            ''', (after, limit) * 3 + (limit,))
+            return [row['user_id'] for row in cursor.fetchall()]
     
     # ========== 统计信息 ==========
     
@@ -0,0 +1,131 @@
+"""
+单写线程 + 组提交：所有写操作进入队列，由一个线程在同一个事务中批量提交
+每个操作包在独立的SAVEPOINT中，单个操作失败只回滚它自己
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from storage.pool import ConnectionPool
+
+WriteOp = Tuple[Callable, tuple, dict, Future]
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_writes() -> Iterator[List[Future]]:
+    """在此上下文中，当前线程发起的组提交写操作只入队、不等待提交，其Future收集到返回的列表中
+
+    由调用方稍后统一等待，使同一线程连续发起的写操作能被写线程合并为一个事务；
+    上下文中的代码不能依赖写操作的返回值
+    """
+    previous = getattr(_deferred, "futures", None)
+    _deferred.futures = futures = []
+    try:
+        yield futures
+    finally:
+        _deferred.futures = previous
+
+
+def deferred_futures() -> Optional[List[Future]]:
+    """当前线程处于 deferred_writes 上下文时返回收集Future的列表，否则返回None"""
+    return getattr(_deferred, "futures", None)
+
+
+class GroupCommitWriter:
+    """组提交写线程
+
+    - submit() 立即返回 Future，操作提交（COMMIT成功）后才会完成
+    - 写线程每次取出队列中已有的操作（最多 max_batch 个），在一个 BEGIN IMMEDIATE 事务中执行
+    - 操作函数签名为 fn(conn, *args, **kwargs)，不应自行 commit
+    """
+
+    def __init__(self, pool: ConnectionPool, max_batch: int = 256):
+        self.pool = pool
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Optional[WriteOp]]" = queue.Queue()
+        self.batches = 0
+        self.ops = 0
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def in_writer_thread(self) -> bool:
+        """当前是否在写线程中（嵌套写操作直接在当前事务中执行）"""
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交写操作"""
+        future: Future = Future()
+        if not self._thread.is_alive():
+            future.set_exception(RuntimeError("写线程已停止"))
+            return future
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def close(self):
+        """执行完队列中剩余的操作后停止写线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(batch)
+
+    def _commit_batch(self, batch: List[WriteOp]):
+        results: List[Tuple[Future, bool, Any]] = []
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for fn, args, kwargs, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute('SAVEPOINT write_op')
+                    try:
+                        result = fn(conn, *args, **kwargs)
+                        conn.execute('RELEASE write_op')
+                        results.append((future, True, result))
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO write_op')
+                        conn.execute('RELEASE write_op')
+                        results.append((future, False, e))
+                conn.commit()
+        except Exception as e:
+            # 事务本身失败（例如其他进程持有写锁超时），整批失败
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.ops += len(results)
+        for future, ok, value in results:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self) -> dict:
+        """组提交统计"""
+        return {
+            "batches": self.batches,
+            "ops": self.ops,
+            "ops_per_batch": self.ops / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,157 @@
+"""
+性能基准脚本：测量核心路径的吞吐量
+可以直接运行查看结果
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+
+# 添加项目路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import ConfigPresets
+from memory_core.manager import MemoryManager
+from memory_core.models import Episode, Fact, UserProfile
+
+
+def _timeit(label: str, func, n: int):
+    """执行n次并打印每秒操作数"""
+    start = time.perf_counter()
+    for i in range(n):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"   {label:<24} {n / elapsed:>10.0f} ops/s  ({elapsed * 1000 / n:.3f} ms/op)")
+
+
+def bench_storage(n: int = 500):
+    """对话轮次与上下文检索的吞吐量"""
+    print("=" * 60)
+    print("⏱  存储层基准")
+    print("=" * 60)
+
+    temp_dir = tempfile.mkdtemp()
+    config = ConfigPresets.minimal()
+    config.data_dir = temp_dir
+    manager = MemoryManager(config)
+
+    try:
+        user_id = "bench_user"
+        manager.update_user_profile(UserProfile(user_id=user_id, name="小明", tags=["喜欢恐龙"]))
+        for i in range(20):
+            manager.storage.save_episode(
+                Episode(user_id=user_id, summary=f"聊了恐龙话题{i}", keywords=["恐龙"], importance=0.6)
+            )
+            manager.storage.save_fact(
+                Fact(user_id=user_id, subject="小明", predicate="喜欢", object=f"恐龙{i}")
+            )
+
+        session_id = manager.start_session(user_id).session_id
+
+        _timeit("add_message", lambda i: manager.add_message(session_id, "user", f"消息{i}"), n)
+        _timeit("get_memory_context", lambda i: manager.get_memory_context(session_id), n)
+        _timeit("get_memory_context(query)", lambda i: manager.get_memory_context(session_id, "恐龙"), n)
+    finally:
+        manager.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_concurrent_writes(threads: int = 8, per_thread: int = 200):
+    """多线程并发写入：单独提交 vs 组提交"""
+    print("=" * 60)
+    print("⏱  并发写入基准")
+    print("=" * 60)
+
+    from storage.sqlite_storage import SQLiteStorage
+
+    for group_commit in (False, True):
+        temp_dir = tempfile.mkdtemp()
+        config = ConfigPresets.minimal()
+        config.data_dir = temp_dir
+        config.db_group_commit = group_commit
+        config.db_synchronous = "FULL"
+        config.max_facts_per_user = threads * per_thread
+        storage = SQLiteStorage(config)
+
+        def worker(t: int):
+            for i in range(per_thread):
+                storage.save_fact(Fact(user_id=f"user{t}", subject="小明", predicate="喜欢", object=f"恐龙{i}"))
+
+        try:
+            workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+            start = time.perf_counter()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            elapsed = time.perf_counter() - start
+            label = "组提交" if group_commit else "单独提交"
+            print(f"   {label:<24} {threads * per_thread / elapsed:>10.0f} writes/s  {storage.write_stats()}")
+        finally:
+            storage.close()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_row_decoding(n: int = 200):
+    """读取情景记忆：每次取回n行的吞吐量与每个对象的常驻内存"""
+    print("=" * 60)
+    print("⏱  行解码基准")
+    print("=" * 60)
+
+    import tracemalloc
+    from storage.sqlite_storage import SQLiteStorage
+
+    temp_dir = tempfile.mkdtemp()
+    config = ConfigPresets.minimal()
+    config.data_dir = temp_dir
+    config.max_episodes_per_user = n
+    storage = SQLiteStorage(config)
+
+    try:
+        user_id = "bench_user"
+        storage.bulk_import([], [
+            Episode(user_id=user_id, summary=f"聊了恐龙话题{i}", keywords=["恐龙", "化石"],
+                    emotion="开心", importance=0.6, metadata={"turns": i, "topic": "恐龙"})
+            for i in range(n)
+        ], [])
+
+        _timeit(f"get_episodes({n})", lambda i: storage.get_episodes(user_id, limit=n), 200)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        episodes = storage.get_episodes(user_id, limit=n)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print(f"   {'常驻内存':<24} {used / len(episodes):>10.0f} bytes/episode")
+    finally:
+        storage.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_json_codec(n: int = 2000):
+    """JSON编解码：长会话的消息列表在各可用后端下的编码/解码吞吐量"""
+    print("=" * 60)
+    print("⏱  JSON编解码基准")
+    print("=" * 60)
+
+    from memory_core import codec
+    from memory_core.models import Message, MessageRole
+
+    session = [
+        Message(role=MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT,
+                content=f"我们来聊聊恐龙吧，第{i}轮", metadata={"turn": i, "emotion": "开心"}).to_dict()
+        for i in range(100)
+    ]
+    for name, (dumps, loads) in codec.BACKENDS.items():
+        text = dumps(session)
+        _timeit(f"{name} dumps(100条消息)", lambda i: dumps(session), n)
+        _timeit(f"{name} loads(100条消息)", lambda i: loads(text), n)
+
+
+if __name__ == "__main__":
+    bench_storage()
+    bench_concurrent_writes()
+    bench_row_decoding()
+    bench_json_codec()
@@ -3,6 +3,7 @@
 """
 import pytest
 import asyncio
+import json
 import os
 import sys
 import tempfile
@@ -35,13 +36,17 @@ def temp_config():
 @pytest.fixture
 def storage(temp_config):
     """创建存储实例"""
-    return SQLiteStorage(temp_config)
+    storage = SQLiteStorage(temp_config)
+    yield storage
+    storage.close()
 
 
 @pytest.fixture
 def manager(temp_config):
     """创建管理器实例"""
-    return MemoryManager(temp_config)
+    manager = MemoryManager(temp_config)
+    yield manager
+    manager.close()
 
 
 class TestModels:
@@ -66,6 +71,19 @@ class TestModels:
         assert msg2.role == msg.role
         assert msg2.content == msg.content
     
+    def test_slotted_models(self):
+        """测试模型使用 __slots__，dataclass 行为保持不变"""
+        import copy
+        import dataclasses
+        episode = Episode(user_id="user1", summary="恐龙", metadata={"k": 1})
+        assert not hasattr(episode, "__dict__")
+        with pytest.raises(AttributeError):
+            episode.extra = 1
+        assert copy.deepcopy(episode) == episode
+        assert dataclasses.replace(episode, summary="x").metadata == {"k": 1}
+        assert Fact(subject="a").subject == "a"
+        assert UserProfile(user_id="u").preferences == {}
+    
     def test_working_memory(self):
         """测试工作记忆"""
         wm = WorkingMemory(user_id="user1", session_id="session1")
@@ -199,6 +217,71 @@ class TestStorage:
         results = storage.search_episodes_by_keywords("user1", ["恐龙"])
         assert len(results) >= 2
     
+    def test_episode_fulltext_search(self, storage):
+        """测试全文索引检索：中文子串匹配、按重要性排序、覆盖写入后索引同步"""
+        low = Episode(user_id="user1", summary="去动物园看了霸王龙模型", importance=0.3)
+        high = Episode(user_id="user1", summary="最喜欢的恐龙是霸王龙", importance=0.9)
+        other = Episode(user_id="user2", summary="霸王龙", importance=0.9)
+        for ep in (low, high, other):
+            storage.save_episode(ep)
+        
+        results = storage.search_episodes_by_keywords("user1", ["王龙"])
+        assert [ep.id for ep in results] == [high.id, low.id]
+        
+        # 覆盖写入后旧内容不应再被检索到
+        high.summary = "聊了画画"
+        storage.save_episode(high)
+        results = storage.search_episodes_by_keywords("user1", ["霸王龙"])
+        assert [ep.id for ep in results] == [low.id]
+        
+        # 单个汉字回退到LIKE匹配
+        assert len(storage.search_episodes_by_keywords("user1", ["画"])) == 1
+    
+    def test_fact_fulltext_search(self, storage):
+        """测试事实全文检索"""
+        storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="霸王龙"))
+        storage.save_fact(Fact(user_id="user1", subject="小明", predicate="害怕", object="打雷"))
+        
+        results = storage.search_facts("user1", "霸王龙")
+        assert len(results) == 1
+        assert results[0].object == "霸王龙"
+        assert storage.search_facts("user2", "霸王龙") == []
+    
+    def test_bulk_episode_access(self, storage):
+        """测试批量更新访问计数"""
+        episodes = [Episode(user_id="user1", summary=f"记忆{i}") for i in range(3)]
+        for ep in episodes:
+            storage.save_episode(ep)
+        
+        storage.update_episodes_access([episodes[0].id, episodes[1].id], increment=2)
+        counts = {ep.id: ep.access_count for ep in storage.get_episodes("user1", min_importance=0)}
+        assert counts == {episodes[0].id: 2, episodes[1].id: 2, episodes[2].id: 0}
+    
+    def test_delete_weak_episodes_in_sql(self, storage):
+        """测试SQL中计算的记忆强度与 Episode.calculate_strength 一致"""
+        from datetime import timedelta
+        storage.config.time_decay_weight = 0.6
+        storage.config.access_count_weight = 0.4
+        now = datetime.now()
+        episodes = [
+            Episode(user_id="user1", summary=f"记忆{i}", importance=importance,
+                    access_count=count, last_accessed=now - timedelta(days=days, hours=1))
+            for i, (importance, count, days) in enumerate([
+                (0.9, 0, 0), (0.3, 0, 10), (0.5, 12, 40), (0.2, 1, 3), (0.8, 3, 25), (0.4, 5, 100)
+            ])
+        ]
+        for ep in episodes:
+            storage.save_episode(ep)
+        storage.save_episode(Episode(user_id="user2", summary="其他用户", importance=0.1))
+        
+        expected = {
+            ep.summary for ep in episodes
+            if ep.calculate_strength(30, 0.6, 0.4) >= 0.2
+        }
+        assert storage.delete_weak_episodes("user1", min_strength=0.2) == len(episodes) - len(expected)
+        assert {ep.summary for ep in storage.get_episodes("user1")} == expected
+        assert storage.get_stats("user2")["episode_count"] == 1
+    
     def test_fact_crud(self, storage):
         """测试知识事实CRUD"""
         fact = Fact(
@@ -239,6 +322,164 @@ class TestStorage:
         storage.delete_working_memory("session1")
         assert storage.get_working_memory("session1") is None
     
+    def test_working_messages_append_and_trim(self, storage):
+        """测试消息追加写入并按滑动窗口裁剪"""
+        wm = WorkingMemory(user_id="user1", session_id="session1")
+        storage.save_working_memory(wm)
+        
+        keep = storage.config.working_memory_size * 2
+        for i in range(keep + 3):
+            wm.add_message(MessageRole.USER, f"消息{i}")
+            storage.append_messages(wm, wm.messages[-1:])
+        
+        loaded = storage.get_working_memory("session1")
+        assert len(loaded.messages) == keep
+        assert loaded.messages[0].content == "消息3"
+        assert loaded.messages[-1].content == f"消息{keep + 2}"
+    
+    def test_legacy_working_memory_migration(self, temp_config):
+        """测试旧版JSON消息列迁移到消息表"""
+        import json
+        storage = SQLiteStorage(temp_config)
+        msg = Message(role=MessageRole.USER, content="旧消息")
+        now = datetime.now().isoformat()
+        with storage._get_connection() as conn:
+            conn.execute(
+                'INSERT INTO working_memory (session_id, user_id, messages, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                ("legacy", "user1", json.dumps([msg.to_dict()]), now, now)
+            )
+            # 模拟拆分消息表之前的库版本
+            conn.execute('PRAGMA user_version = 1')
+            conn.commit()
+        storage.close()
+        
+        storage = SQLiteStorage(temp_config)
+        try:
+            loaded = storage.get_working_memory("legacy")
+            assert [m.content for m in loaded.messages] == ["旧消息"]
+        finally:
+            storage.close()
+    
+    def test_row_decoder_lazy_metadata(self, storage):
+        """测试行解码器：metadata 在首次访问时才解析，其余字段与写入一致"""
+        episode = Episode(user_id="user1", summary="恐龙", keywords=["恐龙"], metadata={"source": "test"})
+        storage.save_episode(episode)
+        
+        loaded = storage.get_episodes("user1")[0]
+        assert loaded._metadata_raw == '{"source":"test"}'
+        assert loaded.metadata == {"source": "test"}
+        assert loaded._metadata_raw is None
+        assert loaded == episode
+    
+    def test_timestamp_column_migration(self, temp_config):
+        """测试旧库升级时添加整数秒时间列并从ISO文本回填"""
+        import sqlite3
+        from datetime import timedelta
+        from memory_core.models import epoch_seconds
+        os.makedirs(temp_config.data_dir, exist_ok=True)
+        old = datetime.now() - timedelta(days=30)
+        conn = sqlite3.connect(temp_config.get_db_path())
+        conn.execute('''
+            CREATE TABLE working_memory (
+                session_id TEXT PRIMARY KEY, user_id TEXT, messages TEXT, created_at TEXT, updated_at TEXT
+            )
+        ''')
+        conn.execute(
+            'INSERT INTO working_memory VALUES (?, ?, NULL, ?, ?)',
+            ("legacy", "user1", old.isoformat(), old.isoformat())
+        )
+        conn.commit()
+        conn.close()
+
+        storage = SQLiteStorage(temp_config)
+        try:
+            with storage._get_connection() as conn:
+                ts = conn.execute("SELECT updated_at_ts FROM working_memory").fetchone()[0]
+            assert ts == epoch_seconds(old)
+            assert storage.cleanup_old_sessions(7) == 1
+        finally:
+            storage.close()
+
+    def test_hot_queries_use_indexes(self, temp_config):
+        """EXPLAIN QUERY PLAN 回归：热点查询不全表扫描、不额外排序"""
+        import re
+        from datetime import timedelta
+        temp_config.db_pool_size = 1
+        storage = SQLiteStorage(temp_config)
+        try:
+            statements = []
+            with storage._get_connection() as conn:
+                conn.set_trace_callback(statements.append)
+            old = datetime.now() - timedelta(days=30)
+            storage.config.max_episodes_per_user = 2
+            storage.config.max_facts_per_user = 2
+            for i in range(3):
+                storage.save_episode(Episode(user_id="user1", summary=f"记忆{i}", importance=i / 10))
+                storage.save_fact(Fact(user_id="user1", subject="我", predicate="喜欢", object=f"恐龙{i}"))
+            wm = WorkingMemory(user_id="user1", session_id="s1", updated_at=old)
+            storage.save_working_memory(wm)
+            storage.append_messages(wm, [Message(role=MessageRole.USER, content="你好")])
+            storage.get_user_profile("user1")
+            storage.get_episodes("user1", min_importance=0.1)
+            storage.get_facts("user1")
+            storage.get_stats("user1")
+            storage.get_working_memory("s1")
+            assert storage.search_episodes_by_keywords("user1", ["记忆"])
+            assert storage.search_facts("user1", "恐龙")
+            storage.update_episodes_access([ep.id for ep in storage.get_episodes("user1")])
+            storage.delete_weak_episodes("user1")
+            storage.cleanup_old_sessions(7, limit=10)
+            list(storage.iter_episodes("user1"))
+            list(storage.iter_facts("user1"))
+            with storage._get_connection() as conn:
+                conn.set_trace_callback(None)
+
+            from storage import fts
+            checked = matched = 0
+            with storage._get_connection() as conn:
+                for sql in statements:
+                    if not re.match(r"\s*(SELECT|UPDATE|DELETE)", sql, re.I):
+                        continue
+                    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                    checked += 1
+                    for detail in plan:
+                        assert not re.match(r"SCAN (episodes|facts|working_memory|working_messages)\b", detail), (sql, plan)
+                        if "MATCH" not in sql:
+                            # 全文检索按bm25排序，需要临时排序
+                            assert "TEMP B-TREE FOR ORDER BY" not in detail, (sql, plan)
+                    if "MATCH" in sql:
+                        # 全文检索由FTS索引驱动，匹配的词元带用户前缀，只读取该用户的倒排条目
+                        matched += 1
+                        assert any(re.match(r"SCAN \w+_fts VIRTUAL TABLE", d) for d in plan), (sql, plan)
+                        assert fts.user_prefix("user1") in sql, sql
+            assert checked >= 12, checked
+            assert matched == 2
+        finally:
+            storage.close()
+
+    def test_context_bundle_single_connection(self, storage):
+        """测试上下文在一次连接获取内组装完成"""
+        wm = WorkingMemory(user_id="user1", session_id="s1")
+        wm.add_message(MessageRole.USER, "我喜欢恐龙")
+        storage.save_working_memory(wm)
+        storage.save_user_profile(UserProfile(user_id="user1", name="小明"))
+        storage.save_episode(Episode(user_id="user1", summary="聊了恐龙", keywords=["恐龙"]))
+        storage.save_fact(Fact(user_id="user1", subject="用户", predicate="喜欢", object="恐龙"))
+        
+        acquired = []
+        original = storage._pool.acquire
+        storage._pool.acquire = lambda: acquired.append(1) or original()
+        context = storage.get_context_bundle("s1", query="恐龙", keywords=["恐龙"])
+        storage._pool.acquire = original
+        
+        assert len(acquired) == 1
+        assert len(context.working_memory.messages) == 1
+        assert context.user_profile.name == "小明"
+        assert len(context.relevant_episodes) == 1
+        assert len(context.relevant_facts) == 1
+        assert storage.get_context_bundle("missing").working_memory is None
+    
     def test_stats(self, storage):
         """测试统计功能"""
         user_id = "stats_user"
@@ -254,9 +495,466 @@ class TestStorage:
         assert stats["fact_count"] == 1
 
 
+class TestMemoryStorage:
+    """纯内存存储后端测试"""
+    
+    @pytest.fixture
+    def mem_storage(self, temp_config):
+        from storage.memory_storage import MemoryStorage
+        return MemoryStorage(temp_config)
+    
+    def test_episode_eviction(self, mem_storage):
+        """测试超过数量上限时淘汰重要性最低的情景记忆"""
+        mem_storage.config.max_episodes_per_user = 3
+        for i, importance in enumerate([0.9, 0.1, 0.5, 0.7]):
+            mem_storage.save_episode(Episode(user_id="user1", summary=f"记忆{i}", importance=importance))
+        
+        summaries = [ep.summary for ep in mem_storage.get_episodes("user1")]
+        assert summaries == ["记忆0", "记忆3", "记忆2"]
+    
+    def test_fact_dedup_and_eviction(self, mem_storage):
+        """测试事实去重和按置信度淘汰"""
+        mem_storage.config.max_facts_per_user = 2
+        mem_storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="恐龙", confidence=0.5))
+        mem_storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="恐龙", confidence=0.9))
+        mem_storage.save_fact(Fact(user_id="user1", subject="小明", predicate="害怕", object="打雷", confidence=0.3))
+        mem_storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="画画", confidence=0.8))
+        
+        facts = mem_storage.get_facts("user1")
+        assert [(f.object, f.confidence) for f in facts] == [("恐龙", 0.9), ("画画", 0.8)]
+        assert [f.object for f in mem_storage.search_facts("user1", "恐龙")] == ["恐龙"]
+    
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_fact_eviction_tiebreak_matches_sqlite(self, temp_config, backend):
+        """测试同置信度时两种后端都淘汰最久未验证的事实"""
+        from datetime import timedelta
+        from storage.base import create_storage
+        temp_config.storage_backend = backend
+        temp_config.max_facts_per_user = 2
+        storage = create_storage(temp_config)
+        try:
+            now = datetime.now()
+            storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="恐龙",
+                                   confidence=0.5, last_verified=now - timedelta(days=1)))
+            storage.save_fact(Fact(user_id="user1", subject="小明", predicate="喜欢", object="画画",
+                                   confidence=0.5, last_verified=now - timedelta(days=2)))
+            storage.save_fact(Fact(user_id="user1", subject="小明", predicate="害怕", object="打雷",
+                                   confidence=0.5, last_verified=now))
+            
+            assert sorted(f.object for f in storage.get_facts("user1")) == ["恐龙", "打雷"]
+        finally:
+            storage.close()
+    
+    def test_working_memory_window_and_copies(self, mem_storage):
+        """测试工作记忆裁剪，且返回值是副本"""
+        wm = WorkingMemory(user_id="user1", session_id="s1")
+        mem_storage.save_working_memory(wm)
+        keep = mem_storage.config.working_memory_size * 2
+        for i in range(keep + 3):
+            mem_storage.append_messages(wm, [Message(role=MessageRole.USER, content=f"消息{i}")])
+        
+        loaded = mem_storage.get_working_memory("s1")
+        assert len(loaded.messages) == keep
+        assert loaded.messages[0].content == "消息3"
+        loaded.messages.clear()
+        assert len(mem_storage.get_working_memory("s1").messages) == keep
+    
+    @pytest.mark.asyncio
+    async def test_manager_with_memory_backend(self, temp_config):
+        """测试管理器使用内存后端完成会话流程"""
+        temp_config.storage_backend = "memory"
+        manager = MemoryManager(temp_config)
+        try:
+            session_id = manager.start_session("user1").session_id
+            for i in range(temp_config.episode_compress_threshold):
+                manager.add_message(session_id, "user", f"我喜欢恐龙{i}")
+                manager.add_message(session_id, "assistant", "恐龙真酷")
+            await manager.end_session(session_id)
+            
+            assert manager.get_stats("user1")["episode_count"] == 1
+            assert not os.path.exists(temp_config.get_db_path())
+        finally:
+            manager.close()
+
+
+class TestShardedStorage:
+    """分片存储测试"""
+
+    @pytest.fixture
+    def sharded(self, temp_config):
+        from storage.sharded_storage import ShardedSQLiteStorage
+        temp_config.db_shards = 3
+        storage = ShardedSQLiteStorage(temp_config)
+        yield storage
+        storage.close()
+
+    def test_users_routed_to_own_shard(self, sharded):
+        """测试用户数据只写入其所在分片，按会话和ID的查询跨分片可用"""
+        from storage.sharded_storage import shard_index
+        users = [f"user{i}" for i in range(6)]
+        episodes = []
+        for user_id in users:
+            episode = Episode(user_id=user_id, summary=f"{user_id}的记忆", importance=0.8)
+            sharded.save_episode(episode)
+            episodes.append(episode)
+            sharded.save_working_memory(WorkingMemory(user_id=user_id, session_id=f"s-{user_id}"))
+
+        for user_id in users:
+            own = shard_index(user_id, 3)
+            for i, shard in enumerate(sharded.shards):
+                assert bool(shard.get_episodes(user_id)) == (i == own)
+
+        sharded._sessions.clear()
+        assert sharded.get_working_memory("s-user4").user_id == "user4"
+        ids = [ep.id for ep in reversed(episodes)]
+        assert [ep.id for ep in sharded.get_episodes_by_ids(ids)] == ids
+        assert sum(s["episodes"] for s in sharded.get_shard_stats()) == 6
+
+    def test_user_scoped_batch_updates_hit_one_shard(self, sharded):
+        """测试传入 user_id 的批量更新只在所属分片上开写事务"""
+        from storage.sharded_storage import shard_index
+        episode = Episode(user_id="user1", summary="恐龙", importance=0.8)
+        sharded.save_episode(episode)
+        before = [shard.write_stats()["batches"] for shard in sharded.shards]
+
+        sharded.update_episodes_access([episode.id], user_id="user1")
+        sharded.update_episode_embeddings([(episode.id, [0.1, 0.2])], user_id="user1")
+
+        own = shard_index("user1", 3)
+        deltas = [shard.write_stats()["batches"] - b for shard, b in zip(sharded.shards, before)]
+        assert deltas == [2 if i == own else 0 for i in range(3)]
+        found = sharded.get_episodes_by_ids([episode.id], user_id="user1")
+        assert found[0].access_count == 1
+
+    def test_backfill_cursor_across_shards(self, sharded):
+        """测试待回填向量的全局游标不重复、不遗漏"""
+        for i in range(10):
+            sharded.save_episode(Episode(user_id=f"user{i}", summary=f"记忆{i}"))
+
+        seen, cursor = [], 0
+        while True:
+            rows = sharded.get_episodes_without_embedding(cursor, limit=3)
+            if not rows:
+                break
+            seen.extend(ep.summary for _, ep in rows)
+            cursor = rows[-1][0]
+        assert sorted(seen) == sorted(f"记忆{i}" for i in range(10))
+
+    def test_rebalance(self, temp_config):
+        """测试分片数变化后迁移用户"""
+        from storage.sharded_storage import ShardedSQLiteStorage, rebalance
+        temp_config.db_shards = 2
+        storage = ShardedSQLiteStorage(temp_config)
+        for i in range(8):
+            user_id = f"user{i}"
+            storage.save_episode(Episode(user_id=user_id, summary=f"恐龙{i}"))
+            storage.save_fact(Fact(user_id=user_id, subject=user_id, predicate="喜欢", object="恐龙"))
+            wm = WorkingMemory(user_id=user_id, session_id=f"s{i}")
+            storage.save_working_memory(wm)
+            storage.append_messages(wm, [Message(role=MessageRole.USER, content="你好")])
+        storage.close()
+
+        temp_config.db_shards = 5
+        stats = rebalance(temp_config, from_shards=2)
+        assert stats["moved_users"] > 0
+
+        storage = ShardedSQLiteStorage(temp_config)
+        try:
+            for i in range(8):
+                user_id = f"user{i}"
+                assert storage.get_stats(user_id)["episode_count"] == 1
+                assert [ep.summary for ep in storage.search_episodes_by_keywords(user_id, ["恐龙"])] == [f"恐龙{i}"]
+                assert len(storage.get_facts(user_id)) == 1
+                assert storage.get_working_memory(f"s{i}").messages[0].content == "你好"
+            assert sum(s["episodes"] for s in storage.get_shard_stats()) == 8
+        finally:
+            storage.close()
+
+
+class TestMigrations:
+    """表结构版本迁移测试"""
+
+    @staticmethod
+    def _legacy_db(path, episodes=5):
+        """创建引入版本号之前的库（初始表结构，user_version为0）"""
+        import sqlite3
+        from storage.migrations import _create_base_tables
+        conn = sqlite3.connect(path)
+        _create_base_tables(conn)
+        conn.executemany(
+            'INSERT INTO episodes (id, user_id, importance, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)',
+            [(f"ep{i}", "user1", 0.5, "2024-01-01T00:00:00", f"2024-01-0{i + 1}T00:00:00") for i in range(episodes)]
+        )
+        conn.commit()
+        return conn
+
+    def test_fresh_database_is_current(self, storage):
+        """测试新建库直接到最新版本，再次运行没有待执行的迁移"""
+        from storage.migrations import MigrationRunner, MIGRATIONS
+        with storage._get_connection() as conn:
+            runner = MigrationRunner(conn)
+            assert runner.current_version() == MIGRATIONS[-1].version
+            assert runner.pending() == []
+            assert runner.run() == []
+
+    def test_unscoped_fulltext_index_rebuilt(self, temp_config):
+        """测试v6把不带用户前缀的旧全文索引重建为按用户分区的格式"""
+        import sqlite3
+        from storage import fts
+        storage = SQLiteStorage(temp_config)
+        storage.save_episode(Episode(user_id="user1", summary="霸王龙化石"))
+        storage.close()
+        
+        conn = sqlite3.connect(temp_config.get_db_path())
+        conn.create_function("fts_tokenize", 1, fts.to_index_text)
+        conn.executescript('''
+            DROP TRIGGER episodes_fts_insert;
+            DROP TABLE episodes_fts;
+            CREATE VIRTUAL TABLE episodes_fts USING fts5(summary, keywords);
+            INSERT INTO episodes_fts (rowid, summary, keywords)
+            SELECT rowid, fts_tokenize(summary), fts_tokenize(keywords) FROM episodes;
+            PRAGMA user_version = 5;
+        ''')
+        conn.close()
+        
+        storage = SQLiteStorage(temp_config)
+        try:
+            results = storage.search_episodes_by_keywords("user1", ["霸王龙"])
+            assert [ep.summary for ep in results] == ["霸王龙化石"]
+            with storage._get_connection() as conn:
+                indexed = conn.execute('SELECT summary FROM episodes_fts').fetchone()[0]
+            assert indexed.startswith(fts.user_prefix("user1"))
+        finally:
+            storage.close()
+
+    def test_chunked_backfill(self, temp_config):
+        """测试旧库按块回填，每块单独提交"""
+        from storage.migrations import MigrationRunner, MIGRATIONS
+        os.makedirs(temp_config.data_dir, exist_ok=True)
+        conn = self._legacy_db(temp_config.get_db_path())
+        try:
+            results = MigrationRunner(conn, chunk_size=2).run()
+            assert [r["version"] for r in results] == [m.version for m in MIGRATIONS]
+            backfill = results[2]
+            # 5个情景各两列、共10行，每列按2+2+1分3块
+            assert backfill["rows"] == 10 and backfill["chunks"] == 6
+            assert conn.execute(
+                'SELECT COUNT(*) FROM episodes WHERE last_accessed_ts IS NULL OR created_at_ts IS NULL'
+            ).fetchone()[0] == 0
+        finally:
+            conn.close()
+
+    def test_dry_run_leaves_database_untouched(self, temp_config):
+        """测试演练在副本上执行，原库版本不变"""
+        from storage.migrations import dry_run
+        os.makedirs(temp_config.data_dir, exist_ok=True)
+        self._legacy_db(temp_config.get_db_path()).close()
+
+        from storage.migrations import MIGRATIONS
+        results = dry_run(temp_config.get_db_path(), chunk_size=3)
+        assert len(results) == len(MIGRATIONS) and all(r["seconds"] >= 0 for r in results)
+
+        import sqlite3
+        conn = sqlite3.connect(temp_config.get_db_path())
+        try:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(episodes)')}
+            assert "last_accessed_ts" not in columns
+        finally:
+            conn.close()
+        assert os.listdir(temp_config.data_dir) == [temp_config.db_name]
+
+    def test_newer_database_rejected(self, storage):
+        """测试数据库版本高于程序版本时拒绝启动"""
+        from storage.migrations import MigrationRunner
+        with storage._get_connection() as conn:
+            conn.execute('PRAGMA user_version = 999')
+            conn.commit()
+        storage.close()
+        with pytest.raises(RuntimeError):
+            SQLiteStorage(storage.config)
+
+
+class TestCodec:
+    """JSON编解码后端测试"""
+
+    SAMPLES = [
+        {},
+        [],
+        {"k": "中文 \"引号\" \n 换行", "emoji": "🦖", "nested": {"a": [1, 2.5, True, None]}},
+        ["恐龙", "化石"],
+        {"big": 2 ** 70, "neg": -1, "float": 0.1},
+        {1: "int key"},
+        {"nan": float("nan"), "inf": float("inf"), "-inf": float("-inf")},
+        [1e16, 1.5e-7, 123456.789, -0.0],
+    ]
+
+    def test_round_trip_matches_stdlib(self):
+        """测试各后端的编码文本与标准库一致，且可以互相解码"""
+        from memory_core import codec
+        reference_dumps, reference_loads = codec.BACKENDS["json"]
+        for name, (dumps, loads) in codec.BACKENDS.items():
+            for sample in self.SAMPLES:
+                text = dumps(sample)
+                assert text == reference_dumps(sample), name
+                # 经标准库重新编码比较（NaN 不等于自身，不能直接比较解码结果）
+                assert reference_dumps(loads(text)) == text, name
+                assert reference_dumps(loads(text.encode("utf-8"))) == text, name
+
+    def test_unsupported_types_rejected_like_stdlib(self):
+        """测试标准库不能编码的值（datetime、dataclass）在各后端都抛出 TypeError"""
+        from datetime import date
+        from memory_core import codec
+        samples = [
+            {"at": datetime(2024, 1, 1, 8)},
+            [date(2024, 1, 1)],
+            {"fact": Fact(user_id="user1", subject="小明")},
+        ]
+        for name, (dumps, _) in codec.BACKENDS.items():
+            for sample in samples:
+                with pytest.raises(TypeError):
+                    dumps(sample)
+
+    def test_invalid_json_raises_value_error(self):
+        """测试各后端的解析错误都是 ValueError"""
+        from memory_core import codec
+        for name, (_, loads) in codec.BACKENDS.items():
+            with pytest.raises(ValueError):
+                loads("{not json")
+
+    def test_storage_round_trip_per_backend(self, temp_config):
+        """测试切换后端后存储读写结果不变"""
+        from memory_core import codec
+        previous = codec.backend
+        try:
+            for i, name in enumerate(codec.BACKENDS):
+                codec.set_backend(name)
+                storage = SQLiteStorage(temp_config)
+                try:
+                    episode = Episode(
+                        user_id=f"user{i}", summary="恐龙", keywords=["恐龙", "🦖"],
+                        metadata={"来源": name, "turns": [1, 2]}
+                    )
+                    storage.save_episode(episode)
+                    storage.save_user_profile(UserProfile(user_id=f"user{i}", preferences={"颜色": "绿色"}))
+                    assert storage.get_episodes(f"user{i}") == [episode]
+                    assert storage.get_user_profile(f"user{i}").preferences == {"颜色": "绿色"}
+                finally:
+                    storage.close()
+        finally:
+            codec.set_backend(previous)
+
+    def test_unknown_backend_rejected(self):
+        """测试指定不可用的后端时报错"""
+        from memory_core import codec
+        with pytest.raises(ValueError):
+            codec.set_backend("nonexistent")
+
+
+class TestConnectionPool:
+    """连接池测试"""
+    
+    def test_connection_reused(self, storage):
+        """测试连接在多次操作间复用"""
+        with storage._get_connection() as conn1:
+            pass
+        with storage._get_connection() as conn2:
+            pass
+        assert conn1 is conn2
+    
+    def test_wal_mode(self, storage):
+        """测试PRAGMA只在建连时设置"""
+        with storage._get_connection() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode.lower() == "wal"
+    
+    def test_nested_connection_single_slot(self, temp_config):
+        """测试池大小为1时嵌套获取连接不会死锁"""
+        temp_config.db_pool_size = 1
+        temp_config.db_timeout = 1.0
+        storage = SQLiteStorage(temp_config)
+        try:
+            storage.save_episode(Episode(user_id="user1", summary="test", importance=0.1))
+            # delete_weak_episodes 在写线程中执行，与调用线程轮流使用唯一的连接
+            storage.delete_weak_episodes("user1", min_strength=0.2)
+            assert storage.get_episodes("user1") == []
+        finally:
+            storage.close()
+
+
+class TestGroupCommit:
+    """组提交写线程测试"""
+    
+    def test_concurrent_writes_grouped(self, storage):
+        """测试并发写入全部落盘且合并为较少的事务"""
+        import threading
+        
+        storage.config.max_facts_per_user = 1000
+        
+        def worker(t):
+            for i in range(20):
+                storage.save_fact(Fact(user_id="user1", subject=f"s{t}", predicate="喜欢", object=f"o{i}"))
+        
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert storage.get_stats("user1")["fact_count"] == 100
+        stats = storage.write_stats()
+        assert stats["ops"] == 100
+        assert stats["batches"] <= 100
+    
+    def test_failed_op_isolated(self, storage):
+        """测试同一批中失败的操作只回滚自己，结果通过Future返回"""
+        def boom(conn):
+            conn.execute("INSERT INTO user_profiles (user_id) VALUES ('half')")
+            raise ValueError("失败")
+        
+        futures = [
+            storage.submit_write(boom),
+            storage.submit_write(storage._save_user_profile, UserProfile(user_id="user1")),
+        ]
+        with pytest.raises(ValueError):
+            futures[0].result()
+        futures[1].result()
+        
+        assert storage.get_user_profile("user1") is not None
+        assert storage.get_user_profile("half") is None
+
+
 class TestMemoryManager:
     """记忆管理器测试"""
     
+    def test_concurrent_add_message_persists_own_message(self, manager):
+        """测试释放锁后其他线程追加的消息不会被当成本次消息落盘"""
+        import threading
+        session_id = manager.start_session("user1").session_id
+        inner = manager._lock
+        other = []
+        
+        class InterleavingLock:
+            """第一次释放锁后立即在另一个线程中完整执行一次 add_message"""
+            def __enter__(self):
+                inner.acquire()
+            
+            def __exit__(self, *exc):
+                inner.release()
+                if not other:
+                    other.append(threading.Thread(
+                        target=manager.add_message, args=(session_id, "assistant", "B")
+                    ))
+                    other[0].start()
+                    other[0].join()
+        
+        manager._lock = InterleavingLock()
+        manager.add_message(session_id, "user", "A")
+        manager._lock = inner
+        
+        stored = manager.storage.get_working_memory(session_id).messages
+        assert sorted(msg.content for msg in stored) == ["A", "B"]
+    
     def test_session_lifecycle(self, manager):
         """测试会话生命周期"""
         # 开始会话
@@ -292,6 +990,45 @@ class TestMemoryManager:
         # 应该提取了记忆
         assert episode is not None or True  # Mock模式可能不返回
     
+    @pytest.mark.asyncio
+    async def test_background_end_session(self, manager):
+        """测试后台提取：立即返回任务，完成后可查询结果"""
+        from memory_core.jobs import JobStatus
+        session_id = manager.start_session("user3").session_id
+        for i in range(6):
+            manager.add_message(session_id, "user", f"我喜欢恐龙{i}")
+            manager.add_message(session_id, "assistant", f"回答{i}")
+        
+        job = await manager.submit_end_session(session_id)
+        assert job.session_id == session_id
+        
+        await manager._job_queue.join()
+        job = manager.get_job(job.id)
+        assert job.status == JobStatus.DONE
+        assert job.episode_id is not None
+        assert manager.storage.get_working_memory(session_id) is None
+        await manager._job_queue.close()
+    
+    @pytest.mark.asyncio
+    async def test_extraction_queue_backpressure(self):
+        """测试队列满时入队超时抛出ExtractionQueueFull"""
+        from memory_core.jobs import ExtractionJobQueue, ExtractionQueueFull
+        release = asyncio.Event()
+        
+        async def handler(wms):
+            await release.wait()
+            return [None] * len(wms)
+        
+        queue = ExtractionJobQueue(handler, workers=1, max_size=1, enqueue_timeout=0.05)
+        await queue.submit(WorkingMemory(user_id="u", session_id="s1"))
+        await asyncio.sleep(0)  # 让工作协程取走第一个任务
+        await queue.submit(WorkingMemory(user_id="u", session_id="s2"))
+        with pytest.raises(ExtractionQueueFull):
+            await queue.submit(WorkingMemory(user_id="u", session_id="s3"))
+        
+        release.set()
+        await queue.close()
+    
     def test_user_profile_management(self, manager):
         """测试用户画像管理"""
         profile = UserProfile(user_id="profile_test", name="测试")
@@ -324,6 +1061,800 @@ class TestMemoryManager:
         assert loaded is not None
 
 
+class TestBulkImport:
+    """批量导入测试"""
+
+    @staticmethod
+    def _payload(user_id: str, n_episodes: int = 3) -> dict:
+        return {
+            "user_id": user_id,
+            "profile": UserProfile(user_id=user_id, name=user_id).to_dict(),
+            "episodes": [
+                Episode(user_id=user_id, summary=f"记忆{i}", importance=i / 10).to_dict()
+                for i in range(n_episodes)
+            ],
+            "facts": [
+                Fact(user_id=user_id, subject="我", predicate="喜欢", object="恐龙", confidence=0.5).to_dict(),
+                Fact(user_id=user_id, subject="我", predicate="喜欢", object="恐龙", confidence=0.9).to_dict(),
+            ],
+        }
+
+    def test_bulk_import_eviction_and_dedup(self, storage):
+        """测试批量导入按用户淘汰一次，事实与库中和批内的三元组去重"""
+        storage.config.max_episodes_per_user = 2
+        storage.save_fact(Fact(user_id="user1", subject="我", predicate="害怕", object="打雷", confidence=0.3))
+        episodes = [Episode(user_id="user1", summary=f"记忆{i}", importance=i / 10) for i in range(5)]
+        facts = [
+            Fact(user_id="user1", subject="我", predicate="害怕", object="打雷", confidence=0.8),
+            Fact(user_id="user1", subject="我", predicate="喜欢", object="恐龙", confidence=0.5),
+            Fact(user_id="user1", subject="我", predicate="喜欢", object="恐龙", confidence=0.7),
+        ]
+        storage.bulk_import([UserProfile(user_id="user1")], episodes, facts)
+
+        assert [ep.summary for ep in storage.get_episodes("user1")] == ["记忆4", "记忆3"]
+        assert [(f.object, f.confidence) for f in storage.get_facts("user1")] == [("打雷", 0.8), ("恐龙", 0.7)]
+        assert [ep.summary for ep in storage.search_episodes_by_keywords("user1", ["记忆4"])] == ["记忆4"]
+
+    def test_import_users_validates_payload(self, manager):
+        """测试导入数据无效时整批不写入"""
+        bad = self._payload("user2")
+        bad["episodes"][1]["user_id"] = "someone_else"
+        with pytest.raises(ValueError):
+            manager.import_users([self._payload("user1"), bad])
+        assert manager.get_user_profile("user1") is None
+
+        assert manager.import_users(self._payload(f"u{i}") for i in range(5)) == 5
+        assert manager.get_stats("u3") == {
+            "user_id": "u3", "episode_count": 3, "fact_count": 1, "has_profile": True
+        }
+
+    def test_ndjson_endpoint(self, temp_config):
+        """测试NDJSON流式导入接口"""
+        import json
+        from fastapi.testclient import TestClient
+        from api import server
+
+        temp_config.import_batch_users = 2
+        with TestClient(server.create_app(temp_config)) as client:
+            body = "\n".join(json.dumps(self._payload(f"u{i}"), ensure_ascii=False) for i in range(5))
+            response = client.post("/import/ndjson", content=body.encode("utf-8"))
+            assert response.json() == {"success": True, "imported_users": 5}
+            assert client.get("/stats/u4").json()["episode_count"] == 3
+
+            response = client.post("/import/ndjson", content=b'{"user_id": "x"}\nnot json\n')
+            assert response.status_code == 400
+            assert response.json()["detail"]["imported"] == 0
+
+
+class TestStreamingExport:
+    """流式导出测试"""
+
+    @pytest.mark.parametrize("backend", ["sqlite", "memory", "sharded"])
+    def test_export_pages_all_rows(self, temp_config, backend):
+        """测试分页导出不丢行，JSON与 export_user_memory 一致"""
+        import json
+        temp_config.storage_backend = backend
+        temp_config.max_episodes_per_user = 2000
+        temp_config.export_chunk_size = 7
+        manager = MemoryManager(temp_config)
+        try:
+            manager.import_users(
+                TestBulkImport._payload(f"user{i}", n_episodes=30 if i == 0 else 1) for i in range(12)
+            )
+            assert list(manager.storage.iter_user_ids(5)) == sorted(f"user{i}" for i in range(12))
+
+            data = json.loads("".join(manager.iter_export_json("user0")))
+            assert len(data["episodes"]) == 30
+            expected = manager.export_user_memory("user0")
+            assert {ep["id"] for ep in data["episodes"]} == {ep["id"] for ep in expected["episodes"]}
+            assert data["facts"] == expected["facts"]
+
+            lines = "".join(manager.iter_export_ndjson()).splitlines()
+            assert [json.loads(line)["user_id"] for line in lines] == sorted(f"user{i}" for i in range(12))
+        finally:
+            manager.close()
+
+    def test_export_endpoints(self, temp_config):
+        """测试导出接口的流式输出可以直接重新导入"""
+        import json
+        from fastapi.testclient import TestClient
+        from api import server
+
+        with TestClient(server.create_app(temp_config)) as client:
+            body = "\n".join(json.dumps(TestBulkImport._payload(f"u{i}")) for i in range(3))
+            client.post("/import/ndjson", content=body.encode("utf-8"))
+
+            data = client.get("/export/u1").json()
+            assert data["user_id"] == "u1" and len(data["episodes"]) == 3
+
+            response = client.get("/export", params={"user_id": ["u0", "u2"]})
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            assert [json.loads(line)["user_id"] for line in response.text.splitlines()] == ["u0", "u2"]
+
+
+
+class TestWriteBehind:
+    """工作记忆写回缓冲测试"""
+    
+    @pytest.fixture
+    def wb_manager(self, temp_config):
+        temp_config.working_memory_write_behind = True
+        temp_config.working_memory_flush_interval = 60
+        temp_config.working_memory_max_unflushed = 4
+        manager = MemoryManager(temp_config)
+        yield manager
+        manager.close()
+    
+    def test_messages_buffered_until_flush(self, wb_manager):
+        """测试消息先缓存，显式刷新后落盘"""
+        session_id = wb_manager.start_session("user1").session_id
+        wb_manager.add_message(session_id, "user", "你好")
+        wb_manager.add_message(session_id, "assistant", "你好！")
+        
+        assert len(wb_manager.storage.get_working_memory(session_id).messages) == 0
+        # 读取走内存缓存，不受影响
+        assert len(wb_manager.get_memory_context(session_id).working_memory.messages) == 2
+        
+        assert wb_manager.flush_working_memory() == 1
+        assert len(wb_manager.storage.get_working_memory(session_id).messages) == 2
+    
+    def test_max_unflushed_bounds_loss(self, wb_manager):
+        """测试达到未落盘上限时立即刷新"""
+        session_id = wb_manager.start_session("user1").session_id
+        for i in range(4):
+            wb_manager.add_message(session_id, "user", f"消息{i}")
+        
+        assert len(wb_manager.storage.get_working_memory(session_id).messages) == 4
+    
+    def test_episode_access_accumulated(self, temp_config):
+        """测试访问计数在内存中累积，刷新时批量落盘"""
+        temp_config.episode_access_write_behind = True
+        temp_config.working_memory_flush_interval = 60
+        manager = MemoryManager(temp_config)
+        try:
+            ep = Episode(user_id="user1", summary="喜欢恐龙", keywords=["恐龙"], importance=0.8)
+            manager.storage.save_episode(ep)
+            session_id = manager.start_session("user1").session_id
+            
+            manager.get_memory_context(session_id)
+            manager.get_memory_context(session_id)
+            assert manager.storage.get_episodes("user1")[0].access_count == 0
+            
+            assert manager.flush_episode_access() == 1
+            assert manager.storage.get_episodes("user1")[0].access_count == 2
+        finally:
+            manager.close()
+    
+    def test_flush_loop_records_errors_and_retries(self, temp_config):
+        """测试后台刷新失败时记录错误，缓冲保留到下一轮重试"""
+        import time
+        temp_config.working_memory_write_behind = True
+        temp_config.working_memory_flush_interval = 0.05
+        manager = MemoryManager(temp_config)
+        try:
+            original = manager.storage.append_messages_batch
+            failures = []
+            
+            def flaky(entries):
+                if not failures:
+                    failures.append(1)
+                    raise RuntimeError("磁盘已满")
+                return original(entries)
+            
+            manager.storage.append_messages_batch = flaky
+            session_id = manager.start_session("user1").session_id
+            manager.add_message(session_id, "user", "你好")
+            
+            deadline = time.time() + 5
+            while not manager.storage.get_working_memory(session_id).messages and time.time() < deadline:
+                time.sleep(0.02)
+            assert len(manager.storage.get_working_memory(session_id).messages) == 1
+            assert manager.flush_stats["errors"] == 1
+            assert "磁盘已满" in manager.flush_stats["last_error"]
+        finally:
+            manager.close()
+    
+    def test_episode_access_keeps_own_timestamp(self, temp_config):
+        """测试刷新时每条记忆保留自己的最后访问时间"""
+        temp_config.episode_access_write_behind = True
+        temp_config.working_memory_flush_interval = 60
+        manager = MemoryManager(temp_config)
+        try:
+            old = Episode(user_id="user1", summary="恐龙")
+            new = Episode(user_id="user1", summary="画画")
+            for ep in (old, new):
+                manager.storage.save_episode(ep)
+            old_at, new_at = datetime(2024, 1, 1, 8), datetime(2024, 1, 2, 8)
+            manager._pending_access = {
+                old.id: ("user1", 1, old_at),
+                new.id: ("user1", 1, new_at),
+            }
+            
+            assert manager.flush_episode_access() == 2
+            loaded = {ep.id: ep for ep in manager.storage.get_episodes_by_ids([old.id, new.id])}
+            assert loaded[old.id].last_accessed == old_at
+            assert loaded[new.id].last_accessed == new_at
+        finally:
+            manager.close()
+    
+    def test_close_flushes(self, temp_config):
+        """测试关闭时刷新剩余数据"""
+        temp_config.working_memory_write_behind = True
+        temp_config.working_memory_flush_interval = 60
+        manager = MemoryManager(temp_config)
+        session_id = manager.start_session("user1").session_id
+        manager.add_message(session_id, "user", "你好")
+        manager.close()
+        
+        storage = SQLiteStorage(temp_config)
+        try:
+            assert len(storage.get_working_memory(session_id).messages) == 1
+        finally:
+            storage.close()
+
+
+
+class TestVectorSearch:
+    """向量检索测试"""
+    
+    def test_hashing_embedding(self):
+        """测试哈希向量确定且已归一化"""
+        from memory_core.embedding import HashingEmbeddingProvider
+        provider = HashingEmbeddingProvider(dim=64)
+        v1, v2, v3 = provider.embed(["喜欢霸王龙", "喜欢霸王龙", "今天下雨了"])
+        assert v1 == v2
+        assert abs(sum(x * x for x in v1) - 1.0) < 1e-6
+        assert sum(a * b for a, b in zip(v1, v2)) > sum(a * b for a, b in zip(v1, v3))
+    
+    def test_manager_merges_vector_hits(self, temp_config):
+        """测试向量检索结果与关键词结果合并"""
+        pytest.importorskip("numpy")
+        temp_config.enable_vector_search = True
+        temp_config.vector_dim = 128
+        temp_config.similarity_threshold = 0.0
+        manager = MemoryManager(temp_config)
+        try:
+            wm = WorkingMemory(user_id="user1", session_id="s1")
+            wm.messages = [Message(role=MessageRole.USER, content="我喜欢霸王龍")] * 10
+            episode = asyncio.run(manager._extract_and_store_memory(wm))
+            manager.embedding_queue.flush()
+            assert len(manager.storage.get_episode_embeddings("user1")) == 1
+            
+            session_id = manager.start_session("user1").session_id
+            # 词序打乱后关键词索引无法命中，只能靠向量相似度找到
+            keywords = manager._extract_query_keywords("龍王霸")
+            assert manager.storage.search_episodes_by_keywords("user1", keywords) == []
+            context = manager.get_memory_context(session_id, "龍王霸")
+            assert [ep.id for ep in context.relevant_episodes] == [episode.id]
+        finally:
+            manager.close()
+
+    
+    def test_embedding_queue_batches(self, storage):
+        """测试队列把多个用户的条目攒成一批编码"""
+        from memory_core.embedding import HashingEmbeddingProvider
+        from memory_core.embedding_pipeline import EmbeddingQueue
+        episodes = [Episode(user_id=f"user{i}", summary=f"摘要{i}") for i in range(5)]
+        for ep in episodes:
+            storage.save_episode(ep)
+        
+        q = EmbeddingQueue(HashingEmbeddingProvider(32), storage, batch_size=5, max_wait=1.0)
+        for ep in episodes:
+            q.submit(ep)
+        q.flush()
+        q.close()
+        
+        assert q.stats()["batches"] == 1
+        assert all(storage.get_episode_embeddings(ep.user_id) for ep in episodes)
+    
+    def test_embedding_queue_failure_recorded(self, storage):
+        """测试向量化失败的批次计入统计，条目留给回填任务"""
+        from memory_core.embedding import HashingEmbeddingProvider
+        from memory_core.embedding_pipeline import EmbeddingQueue, backfill_embeddings
+        
+        class BrokenProvider:
+            def embed(self, texts):
+                raise RuntimeError("模型加载失败")
+        
+        episodes = [Episode(user_id="user1", summary=f"摘要{i}") for i in range(3)]
+        for ep in episodes:
+            storage.save_episode(ep)
+        q = EmbeddingQueue(BrokenProvider(), storage, batch_size=3, max_wait=1.0)
+        for ep in episodes:
+            q.submit(ep)
+        q.flush()
+        q.close()
+        
+        stats = q.stats()
+        assert stats["errors"] == 1
+        assert stats["failed_texts"] == 3
+        assert "模型加载失败" in stats["last_error"]
+        assert backfill_embeddings(storage, HashingEmbeddingProvider(32))["processed"] == 3
+    
+    def test_backfill_resumable(self, storage):
+        """测试回填分块进行，中断后从剩余空向量行继续"""
+        from memory_core.embedding import HashingEmbeddingProvider
+        from memory_core.embedding_pipeline import backfill_embeddings
+        for i in range(7):
+            storage.save_episode(Episode(user_id="user1", summary=f"摘要{i}"))
+        provider = HashingEmbeddingProvider(32)
+        
+        assert backfill_embeddings(storage, provider, chunk_size=2, limit=3)["processed"] == 3
+        stats = backfill_embeddings(storage, provider, chunk_size=2)
+        assert stats["processed"] == 4
+        assert stats["texts_per_sec"] > 0
+        assert len(storage.get_episode_embeddings("user1")) == 7
+
+
+
+class TestLLMClient:
+    """LLM客户端测试"""
+    
+    def test_http_client_reused(self, temp_config):
+        """测试同一事件循环内复用长连接客户端，aclose后关闭"""
+        import httpx
+        from memory_core.llm_client import OpenAIClient
+        
+        calls = []
+        
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "好的"}}]})
+        
+        client = OpenAIClient(temp_config)
+        
+        async def run():
+            http = client._get_http()
+            http._transport = httpx.MockTransport(handler)
+            assert await client.chat([{"role": "user", "content": "你好"}]) == "好的"
+            assert await client.chat([{"role": "user", "content": "再见"}]) == "好的"
+            assert await client.extract_json("提取", max_tokens=1600) == {}
+            assert client._get_http() is http
+            await client.aclose()
+            assert http.is_closed
+        
+        asyncio.run(run())
+        assert len(calls) == 3
+        assert json.loads(calls[2].content)["max_tokens"] == 1600
+    
+    def test_http_client_closed_after_its_loop(self, temp_config):
+        """测试每个事件循环使用自己的客户端，循环关闭后的客户端被同步关闭（含套接字）"""
+        import socket
+        import threading
+        from types import SimpleNamespace
+        import httpx
+        from memory_core.llm_client import OpenAIClient
+        
+        def handler(request):
+            return httpx.Response(200, json={"choices": [{"message": {"content": "好的"}}]})
+        
+        class Stream:
+            def __init__(self, sock):
+                self.sock = sock
+            
+            def get_extra_info(self, name):
+                return self.sock if name == "socket" else None
+        
+        client = OpenAIClient(temp_config)
+        used = []
+        
+        async def run():
+            http = client._get_http()
+            http._transport = httpx.MockTransport(handler)
+            used.append(http)
+            return await client.chat([{"role": "user", "content": "你好"}])
+        
+        left, right = socket.socketpair()
+        try:
+            assert asyncio.run(run()) == "好的"
+            assert not used[0].is_closed
+            used[0]._transport._pool = SimpleNamespace(
+                connections=[SimpleNamespace(_connection=SimpleNamespace(_network_stream=Stream(left)))]
+            )
+            assert asyncio.run(run()) == "好的"
+            assert used[1] is not used[0]
+            assert used[0].is_closed and left.fileno() == -1
+            assert list(client._clients.values()) == [used[1]]
+        finally:
+            left.close()
+            right.close()
+        
+        # 其他线程中仍在运行的循环：在该循环中关闭
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            asyncio.run_coroutine_threadsafe(run(), loop).result(timeout=5)
+            asyncio.run(client.aclose())
+            assert client._clients == {}
+            assert used[1].is_closed and used[2].is_closed
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
+
+
+class TestBatchExtraction:
+    """多会话批量提取测试"""
+    
+    class FakeLLM:
+        """按顺序返回预设JSON的假LLM客户端"""
+        
+        def __init__(self, responses):
+            self.responses = list(responses)
+            self.prompts = []
+            self.max_tokens = []
+        
+        async def extract_json(self, prompt, schema_hint="", max_tokens=800):
+            self.prompts.append(prompt)
+            self.max_tokens.append(max_tokens)
+            return self.responses.pop(0)
+    
+    @staticmethod
+    def _conversations(n):
+        return [
+            ([Message(role=MessageRole.USER, content=f"第{i}段对话")], "user_001", f"s{i}")
+            for i in range(1, n + 1)
+        ]
+    
+    def test_output_budget_scales_and_splits(self, temp_config):
+        """测试批量提取的输出token上限按对话数放大，超出单次上限时拆分调用"""
+        from memory_core.extractor import MemoryExtractor
+        
+        temp_config.extraction_max_tokens = 500
+        temp_config.extraction_max_output_tokens = 1500
+        llm = self.FakeLLM([
+            {"results": [{"index": n, "summary": f"第{n}段"} for n in (1, 2, 3)]},
+            {"results": [{"index": n, "summary": f"第{n + 3}段"} for n in (1, 2)]},
+        ])
+        extractor = MemoryExtractor(temp_config, llm)
+        
+        results = asyncio.run(extractor.extract_batch(self._conversations(5)))
+        assert [r["summary"] for r in results] == [f"第{n}段" for n in range(1, 6)]
+        assert llm.max_tokens == [1500, 1000]
+    
+    def test_truncated_batch_falls_back(self, temp_config):
+        """测试批量响应被截断（解析为空）时逐段重新提取"""
+        from memory_core.extractor import MemoryExtractor
+        
+        llm = self.FakeLLM([
+            {},
+            {"summary": "第一段"},
+            {"summary": "第二段"},
+        ])
+        extractor = MemoryExtractor(temp_config, llm)
+        
+        results = asyncio.run(extractor.extract_batch(self._conversations(2)))
+        assert [r["summary"] for r in results] == ["第一段", "第二段"]
+        assert llm.max_tokens == [1600, 800, 800]
+    
+    def test_one_call_for_batch(self, temp_config):
+        """测试多段对话只调用一次LLM，结果按index对应"""
+        from memory_core.extractor import MemoryExtractor
+        
+        llm = self.FakeLLM([{"results": [
+            {"index": 2, "summary": "第二段", "keywords": ["二"]},
+            {"index": 1, "summary": "第一段", "keywords": ["一"]},
+            {"index": 3, "summary": "第三段", "keywords": ["三"]},
+        ]}])
+        extractor = MemoryExtractor(temp_config, llm)
+        results = asyncio.run(extractor.extract_batch(self._conversations(3)))
+        
+        assert [r["summary"] for r in results] == ["第一段", "第二段", "第三段"]
+        assert [r["session_id"] for r in results] == ["s1", "s2", "s3"]
+        assert extractor.stats["llm_calls"] == 1
+        assert extractor.stats["conversations"] == 3
+    
+    def test_malformed_item_falls_back(self, temp_config):
+        """测试缺失或格式错误的条目回退为单独提取"""
+        from memory_core.extractor import MemoryExtractor
+        
+        llm = self.FakeLLM([
+            {"results": [{"index": 1, "summary": "第一段"}, {"index": 2}]},
+            {"summary": "单独提取的第二段"},
+        ])
+        extractor = MemoryExtractor(temp_config, llm)
+        results = asyncio.run(extractor.extract_batch(self._conversations(2)))
+        
+        assert results[0]["summary"] == "第一段"
+        assert results[1]["summary"] == "单独提取的第二段"
+        assert extractor.stats["llm_calls"] == 2
+        assert "第2段对话" in llm.prompts[1]
+
+
+class TestExtractionCache:
+    """提取结果缓存测试"""
+    
+    def test_ttl_and_lru(self):
+        """测试过期失效和LRU淘汰"""
+        from memory_core.cache import ExtractionCache
+        
+        cache = ExtractionCache(ttl=3600, max_entries=2)
+        cache.set("a", {"v": 1})
+        cache.set("b", {"v": 2})
+        assert cache.get("a") == {"v": 1}
+        cache.set("c", {"v": 3})  # 淘汰最久未用的b
+        assert cache.get("b") is None
+        assert cache.get("a") == {"v": 1}
+        
+        expired = ExtractionCache(ttl=0)
+        expired.set("a", {"v": 1})
+        assert expired.get("a") is None
+    
+    def test_persistent_tier(self, temp_config):
+        """测试SQLite持久层在新实例中仍可命中"""
+        from memory_core.cache import ExtractionCache
+        
+        db_path = os.path.join(temp_config.data_dir, "llm_cache.db")
+        cache = ExtractionCache(ttl=3600, db_path=db_path)
+        cache.set("k", {"summary": "恐龙"})
+        cache.close()
+        
+        reopened = ExtractionCache(ttl=3600, db_path=db_path)
+        assert reopened.get("k") == {"summary": "恐龙"}
+        reopened.close()
+    
+    def test_repeated_conversation_not_reextracted(self, temp_config):
+        """测试相同对话（包括批量提取中的）不重复调用LLM"""
+        from memory_core.cache import CachingLLMClient, ExtractionCache
+        from memory_core.extractor import MemoryExtractor
+        
+        llm = TestBatchExtraction.FakeLLM([
+            {"summary": "第一段"},
+            {"summary": "第二段"},
+        ])
+        extractor = MemoryExtractor(temp_config, CachingLLMClient(llm, ExtractionCache(), "fake"))
+        conversations = TestBatchExtraction._conversations(2)
+        
+        async def run():
+            await extractor.extract_from_conversation(*conversations[0])
+            return await extractor.extract_batch(conversations)
+        
+        results = asyncio.run(run())
+        assert [r["summary"] for r in results] == ["第一段", "第二段"]
+        assert "第1段对话" not in llm.prompts[1]
+        
+        again = asyncio.run(extractor.extract_batch(conversations))
+        assert [r["summary"] for r in again] == ["第一段", "第二段"]
+        assert len(llm.prompts) == 2
+    
+    def test_extraction_cached_once(self, temp_config):
+        """测试提取结果只按对话内容缓存一份，未命中只统计一次"""
+        from memory_core.cache import CachingLLMClient, ExtractionCache
+        from memory_core.extractor import MemoryExtractor
+        
+        llm = TestBatchExtraction.FakeLLM([{"summary": "第一段", "keywords": ["一"]}])
+        cache = ExtractionCache()
+        extractor = MemoryExtractor(temp_config, CachingLLMClient(llm, cache, "fake"))
+        messages, user_id, session_id = TestBatchExtraction._conversations(1)[0]
+        
+        for _ in range(2):
+            result = asyncio.run(extractor.extract_from_conversation(messages, user_id, session_id))
+            assert result["summary"] == "第一段"
+        assert len(llm.prompts) == 1
+        assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+class TestContextCache:
+    """用户上下文缓存测试"""
+    
+    def test_repeated_context_hits_cache(self, manager):
+        """测试长期记忆未变化时重复获取上下文命中缓存"""
+        manager.update_user_profile(UserProfile(user_id="user1", name="小明"))
+        session_id = manager.start_session("user1").session_id
+        
+        manager.get_memory_context(session_id)
+        for _ in range(3):
+            context = manager.get_memory_context(session_id)
+        
+        assert context.user_profile.name == "小明"
+        stats = manager.get_cache_stats()["context"]
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+    
+    def test_write_invalidates(self, manager):
+        """测试写入画像/情景记忆/事实后缓存失效"""
+        session_id = manager.start_session("user1").session_id
+        assert manager.get_memory_context(session_id).relevant_episodes == []
+        
+        manager.storage.save_episode(Episode(user_id="user1", summary="聊了恐龙", importance=0.8))
+        assert len(manager.get_memory_context(session_id).relevant_episodes) == 1
+        
+        manager.storage.save_fact(Fact(user_id="user1", subject="用户", predicate="喜欢", object="恐龙"))
+        assert len(manager.get_memory_context(session_id).relevant_facts) == 1
+        
+        profile = UserProfile(user_id="user1", name="小红")
+        manager.update_user_profile(profile)
+        assert manager.get_memory_context(session_id).user_profile.name == "小红"
+        assert manager.get_user_profile("user1").name == "小红"
+    
+    def test_stale_fill_discarded(self):
+        """测试读取期间发生写入时不回填旧数据"""
+        from memory_core.cache import UserContextCache
+        
+        cache = UserContextCache()
+        version = cache.version("user1")
+        cache.invalidate("user1")
+        cache.put("user1", version, profile=None)
+        assert cache.get("user1", ("profile",)) is None
+    
+    def test_versions_bounded_and_stale_fill_still_discarded(self):
+        """测试版本表随淘汰收缩，移除版本号后旧版本的回填仍被放弃"""
+        from memory_core.cache import UserContextCache
+        
+        cache = UserContextCache(max_users=2)
+        stale = cache.version("user0")
+        for i in range(50):
+            cache.invalidate(f"user{i}")
+            cache.put(f"user{i}", cache.version(f"user{i}"), profile=None)
+        assert len(cache._versions) <= 2
+        assert cache.stats()["users"] == 2
+        
+        cache.put("user0", stale, profile=None)
+        assert cache.get("user0", ("profile",)) is None
+        cache.put("user0", cache.version("user0"), profile=None)
+        assert cache.get("user0", ("profile",)) == {"profile": None}
+    
+    def test_mutating_returned_objects_does_not_leak(self, manager):
+        """测试修改取出的画像（未保存）不影响缓存"""
+        manager.update_user_profile(UserProfile(user_id="user1", name="小明"))
+        profile = manager.get_user_profile("user1")
+        profile.name = "小红"
+        profile.preferences["颜色"] = "红色"
+        
+        cached = manager.get_user_profile("user1")
+        assert cached.name == "小明"
+        assert cached.preferences == {}
+        cached.tags.append("恐龙")
+        assert manager.get_user_profile("user1").tags == []
+        assert manager.get_cache_stats()["context"]["hits"] == 2
+
+
+class TestAsyncStorage:
+    """异步存储适配测试"""
+    
+    def test_slow_write_does_not_block_loop(self):
+        """测试慢写入期间事件循环和读操作不被阻塞"""
+        import threading
+        import time
+        from storage.async_storage import AsyncStorage
+        
+        release = threading.Event()
+        
+        class SlowStorage:
+            def save_episode(self, episode):
+                release.wait(timeout=5)
+            
+            def get_stats(self, user_id):
+                return {"user_id": user_id}
+        
+        storage = AsyncStorage(SlowStorage(), readers=2)
+        
+        async def run():
+            write = asyncio.create_task(storage.save_episode(None))
+            start = time.perf_counter()
+            stats = await storage.get_stats("user1")
+            elapsed = time.perf_counter() - start
+            assert not write.done()
+            release.set()
+            await write
+            return stats, elapsed
+        
+        try:
+            stats, elapsed = asyncio.run(run())
+        finally:
+            release.set()
+            storage.close()
+        assert stats == {"user_id": "user1"}
+        assert elapsed < 1
+    
+    @pytest.mark.asyncio
+    async def test_manager_async_api(self, manager):
+        """测试管理器异步接口的完整会话流程"""
+        wm = await manager.astart_session("user1")
+        await manager.aadd_message(wm.session_id, "user", "我叫小明，我喜欢恐龙")
+        await manager.aupdate_user_profile(UserProfile(user_id="user1", name="小明"))
+        
+        context = await manager.aget_memory_context(wm.session_id)
+        assert len(context.working_memory.messages) == 1
+        assert (await manager.aget_user_profile("user1")).name == "小明"
+        assert await manager.aend_session(wm.session_id) is None
+        assert (await manager.aget_stats("user1"))["has_profile"]
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_are_group_committed(self, manager):
+        """测试并发的异步写入不阻塞写线程，被组提交合并"""
+        sessions = [await manager.astart_session(f"user{i}") for i in range(20)]
+        before = manager.storage.write_stats()
+        
+        await asyncio.gather(*(
+            manager.aadd_message(sessions[i % 20].session_id, "user", f"消息{i}")
+            for i in range(200)
+        ))
+        
+        after = manager.storage.write_stats()
+        ops = after["ops"] - before["ops"]
+        batches = after["batches"] - before["batches"]
+        assert ops == 200
+        assert ops / batches > 1
+        loaded = manager.storage.get_working_memory(sessions[0].session_id)
+        assert [m.content for m in loaded.messages] == [f"消息{i}" for i in range(0, 200, 20)]
+
+
+class TestMaintenance:
+    """后台维护调度测试"""
+
+    def test_resume_from_saved_cursor(self, storage):
+        """测试分块遍历全部用户，进度持久化后可从游标继续"""
+        from memory_core.maintenance import MaintenanceScheduler
+        for i in range(7):
+            storage.save_user_profile(UserProfile(user_id=f"user{i}"))
+
+        seen = []
+
+        def forget(user_id):
+            seen.append(user_id)
+            if len(seen) == 4:
+                scheduler._stop_event.set()
+            return 1
+
+        scheduler = MaintenanceScheduler(storage, forget, chunk_size=3, rate=0)
+        assert scheduler.run_once() is False
+        assert storage.get_maintenance_state("forgetting")["cursor"] == "user3"
+
+        # 模拟重启：新的调度器从保存的游标继续
+        scheduler = MaintenanceScheduler(storage, forget, chunk_size=3, rate=0)
+        assert scheduler.run_once() is True
+        assert seen == [f"user{i}" for i in range(7)]
+        assert scheduler.stats["forgotten"] == 3
+        assert storage.get_maintenance_state("forgetting")["cursor"] == ""
+        assert storage.get_maintenance_state("forgetting")["cycles"] == 1
+
+    def test_cleanup_sessions_in_batches(self, storage):
+        """测试过期会话按批清理"""
+        from datetime import timedelta
+        from memory_core.maintenance import MaintenanceScheduler
+        old = datetime.now() - timedelta(days=30)
+        for i in range(5):
+            wm = WorkingMemory(user_id="user1", session_id=f"old{i}", updated_at=old)
+            wm.messages.append(Message(role=MessageRole.USER, content="你好"))
+            storage.save_working_memory(wm)
+        storage.save_working_memory(WorkingMemory(user_id="user1", session_id="fresh"))
+
+        assert storage.cleanup_old_sessions(7, limit=2) == 2
+        scheduler = MaintenanceScheduler(storage, lambda user_id: 0, chunk_size=2, rate=0)
+        assert scheduler.run_once() is True
+        assert scheduler.stats["sessions_deleted"] == 3
+        assert storage.get_working_memory("old4") is None
+        assert storage.get_working_memory("fresh") is not None
+        with storage._get_connection() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM working_messages").fetchone()[0] == 0
+
+    def test_manager_background_forgetting(self, temp_config):
+        """测试管理器启动后台维护线程，对全部用户执行遗忘"""
+        import time
+        from datetime import timedelta
+        temp_config.maintenance_enabled = True
+        temp_config.maintenance_rate = 0
+        temp_config.maintenance_interval = 0.01
+        manager = MemoryManager(temp_config)
+        try:
+            stale = datetime.now() - timedelta(days=365)
+            for i in range(3):
+                manager.storage.save_episode(
+                    Episode(user_id=f"user{i}", summary="很久以前", importance=0.1, last_accessed=stale)
+                )
+            manager.storage.save_episode(Episode(user_id="user0", summary="重要", importance=0.9))
+
+            deadline = time.time() + 5
+            while manager.maintenance.stats["forgotten"] < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            assert manager.maintenance.stats["forgotten"] == 3
+            assert [ep.summary for ep in manager.storage.get_episodes("user0")] == ["重要"]
+        finally:
+            manager.close()
+
+
 # 运行测试
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])